@@ -1,23 +1,22 @@
 import flask
-from flask import abort, request, send_file, Response
-import os
+from flask import abort, request, Response, stream_with_context
 import json
 import logging
 
-import numpy as np
-import pandas as pd
-
 import config as constants
 from config import config
 
-from utils.db.connector import DBConnector
-from utils.loader.loader import TennisDataLoader
-
-from utils.preprocess import Preprocessor
-from utils.preprocess import TOURNAMENTS_PREPROCESS, RESULTS_PREPROCESS, BETS_PREPROCESS
+from utils.db.connector import DBConnector, initialize_database
+from utils.loader.pipeline import ImportPipeline, IMPORTED, SKIPPED, CANCELLED
+from utils.loader.download_cache import DownloadCache
+from utils.loader.upload import BulkUploader, iter_json_records, iter_ndjson_records, NDJSON_MIMETYPES
 
 from utils.logging.helpers import log_initialize
-from utils.helpers import validate_input_json
+from utils.export import EXPORT_FORMATS
+from utils.cache import DataGenerations, ResponseCache, make_etag
+from utils.jobs import JobManager, JobConflict
+from utils.storage.snapshots import get_snapshot_store
+from utils.db.rollups import DIMENSIONS
 
 # initialize logging
 log_initialize(
@@ -28,9 +27,26 @@ log_initialize(
     days_keep=30
 )
 
+# create database structure once per process instead of on every request
+initialize_database()
+
 app = flask.Flask(__name__)
 app.config["DEBUG"] = True
 
+# read responses are cached per process and invalidated by data generations which writes of this process bump in
+# memory, generations stored in database are checked periodically for writes of other processes
+DATA_GENERATIONS = DataGenerations(DBConnector, check_interval=config["cache"].getfloat("generation_check_interval", 5))
+RESPONSE_CACHE = ResponseCache(
+    max_entries=config["cache"].getint("max_entries"),
+    max_bytes=config["cache"].getint("max_bytes"),
+    ttl=config["cache"].getfloat("ttl")
+)
+# imports run on a separate pool, so request threads are never blocked by downloads
+JOB_MANAGER = JobManager(
+    max_workers=config["jobs"].getint("max_workers"),
+    max_finished=config["jobs"].getint("max_finished")
+)
+
 @app.errorhandler(404)
 def page_not_found(e):
     return "<h1>404</h1><p>The requested link does not exist.</p>", 404
@@ -38,8 +54,20 @@ def page_not_found(e):
 @app.route('/api/get/data/<int:year>', methods=['GET'])
 def get_data(year):
 
-    db_connector = DBConnector()
-    
+    # unchanged data is answered without touching the database
+    etag = make_etag(request.path, request.args.items(multi=True), DATA_GENERATIONS.get(year))
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    cached = RESPONSE_CACHE.get(etag)
+    if cached is not None:
+        body, mimetype = cached
+        response = Response(body, mimetype=mimetype)
+        response.set_etag(etag)
+        return response
+
     search_value = request.args.get("search")
 
     nrows = constants.NROWS_PER_PAGE
@@ -50,32 +78,51 @@ def get_data(year):
     filters["and_filters"]["Year"] = [year]
     for c in constants.VALID_FILTER_FIELDS:
         if c in request.args:
-            filters["and_filters"][c] = request.args.get(c)
+            filters["and_filters"][c] = request.args.getlist(c)
 
-    if not request.args.get("page"):
+    # cursor-based pagination: `?cursor=` for the first page, then `?cursor=<next>` from the previous response
+    cursor = request.args.get("cursor")
+
+    if cursor is not None:
+        page = 1
+    elif not request.args.get("page"):
         page = 1
         nrows = 100000000
     else:
         page = int(request.args.get("page"))
 
-    print("Start loading backend data from database \n"\
-                    "Page number: {} \n" \
-                    "Rows to fetch: {} \n" \
-                    "Applying OR filters: {} \n" \
-                    "Applying AND filters: {} \n" \
-                    "Applying search for {}".format(page, nrows, filters.get("or_filters"), filters.get("and_filters"), search_value))
+    logging.info("Start loading backend data from database: page number {}, rows to fetch {}, OR filters {}, "
+                 "AND filters {}, search for {}".format(
+                     page, nrows, filters.get("or_filters"), filters.get("and_filters"), search_value))
 
-    data = db_connector.get_db_data(page=page, rows=nrows, search=search_value, **filters)
+    try:
+        with DBConnector() as db_connector:
+            data = db_connector.get_db_data(page=page, rows=nrows, search=search_value, cursor=cursor, **filters)
+    except ValueError as e:
+        abort(400, {'message': str(e)})
+
+    if cursor is not None:
+        next_cursor = DBConnector.get_next_cursor(data, rows=nrows)
+        body = '{{"data": {}, "next": {}}}'.format(data.to_json(orient="records", force_ascii=False), json.dumps(next_cursor))
+    else:
+        body = data.to_json(orient="records", force_ascii=False)
 
-    data.to_csv("test.csv", index=False)
+    body = body.encode("utf-8")
+    RESPONSE_CACHE.set(etag, body, "application/json")
 
-    return data.to_json(orient="records", force_ascii=False)
+    response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    return response
 
 @app.route('/api/get/data/<int:year>/download', methods=['GET'])
 def download_data(year):
 
-    db_connector = DBConnector()
-    
+    etag = make_etag(request.path, request.args.items(multi=True), DATA_GENERATIONS.get(year))
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
     search_value = request.args.get("search")
 
     nrows = constants.NROWS_PER_PAGE
@@ -86,108 +133,243 @@ def download_data(year):
     filters["and_filters"]["Year"] = [year]
     for c in constants.VALID_FILTER_FIELDS:
         if c in request.args:
-            filters["and_filters"][c] = request.args.get(c)
+            filters["and_filters"][c] = request.args.getlist(c)
 
     if not request.args.get("page"):
         page = 1
-        nrows = 100000000
+        nrows = None
     else:
         page = int(request.args.get("page"))
 
-    print("Start loading backend data from database \n"\
-                    "Page number: {} \n" \
-                    "Rows to fetch: {} \n" \
-                    "Applying OR filters: {} \n" \
-                    "Applying AND filters: {} \n" \
-                    "Applying search for {}".format(page, nrows, filters.get("or_filters"), filters.get("and_filters"), search_value))
+    logging.info("Start loading backend data from database: page number {}, rows to fetch {}, OR filters {}, "
+                 "AND filters {}, search for {}".format(
+                     page, nrows, filters.get("or_filters"), filters.get("and_filters"), search_value))
 
-    data = db_connector.get_db_data(page=page, rows=nrows, search=search_value, **filters)
+    export_format = request.args.get("format", "json").lower()
+    if export_format not in EXPORT_FORMATS:
+        abort(400, {'message': 'Invalid format {}, use one of: {}'.format(export_format, ", ".join(EXPORT_FORMATS))})
+    writer, mimetype, extension = EXPORT_FORMATS[export_format]
 
-    os.makedirs("data/files/downloaded", exist_ok=True)
-    path = "data/files/downloaded/{}.json".format(year)
-
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(data.to_json(orient="records", force_ascii=False), f, ensure_ascii=False, indent=4)
+    db_connector = DBConnector()
+    try:
+        chunks = db_connector.iter_db_data(page=page, rows=nrows, search=search_value, **filters)
+    except ValueError as e:
+        db_connector.close()
+        abort(400, {'message': str(e)})
+
+    def generate():
+        # rows are streamed from database cursor straight into the response
+        try:
+            for piece in writer(chunks):
+                yield piece
+        finally:
+            db_connector.close()
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype=mimetype,
+        headers={"Content-Disposition": "attachment; filename={}.{}".format(year, extension)}
+    )
+    # connector is also closed if the client disconnects before the body is iterated
+    response.call_on_close(db_connector.close)
+    response.set_etag(etag)
+    return response
+
+def get_list_arg(name):
+    """
+    Get list argument given as repeated or comma separated values
+    """
+    return [v.strip() for value in request.args.getlist(name) for v in value.split(",") if v.strip()]
+
+def stats_response(fields, aggregate):
+    """
+    Run aggregation with filters from request arguments and return cached JSON response
+    :param fields:      fields accepted as filters
+    :param aggregate:   function called as `aggregate(db_connector, group_by, order_by, limit, filters)`
+    """
+    # statistics may span all years, so any write invalidates them
+    etag = make_etag(request.path, request.args.items(multi=True), DATA_GENERATIONS.get_all())
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    cached = RESPONSE_CACHE.get(etag)
+    if cached is not None:
+        body, mimetype = cached
+        response = Response(body, mimetype=mimetype)
+        response.set_etag(etag)
+        return response
+
+    filters = {"and_filters": {}}
+    for c in fields:
+        if c in request.args:
+            filters["and_filters"][c] = request.args.getlist(c)
+    limit = request.args.get("limit")
 
-    return send_file(path, as_attachment=True)
+    try:
+        with DBConnector() as db_connector:
+            data = aggregate(
+                db_connector, get_list_arg("group_by"), request.args.get("order_by"),
+                int(limit) if limit else None, filters
+            )
+    except ValueError as e:
+        abort(400, {'message': str(e)})
+
+    body = data.to_json(orient="records", force_ascii=False).encode("utf-8")
+    RESPONSE_CACHE.set(etag, body, "application/json")
+
+    response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    return response
+
+@app.route('/api/stats/players', methods=['GET'])
+def player_stats():
+    # leaderboard from precomputed rollups, e.g. ?group_by=Surface&Year=2010..2020&order_by=-Wins&limit=20
+    return stats_response(
+        ["Player"] + DIMENSIONS,
+        lambda db, group_by, order_by, limit, filters: db.get_player_stats(
+            group_by=group_by, order_by=order_by or "-Wins", limit=limit or 100, **filters)
+    )
+
+@app.route('/api/stats/odds', methods=['GET'])
+def odds_stats():
+    # mean and max odds per bookmaker from precomputed rollups, e.g. ?group_by=Surface&Bookmaker=B365
+    return stats_response(
+        ["Bookmaker"] + DIMENSIONS,
+        lambda db, group_by, order_by, limit, filters: db.get_odds_stats(
+            group_by=group_by, order_by=order_by or "Bookmaker", limit=limit, **filters)
+    )
+
+@app.route('/api/stats/matches', methods=['GET'])
+def match_stats():
+    # ad hoc aggregation over match table, e.g. ?group_by=Surface,Round&metric=count&metric=mean:B365W
+    return stats_response(
+        constants.VALID_FILTER_FIELDS + ["Year"],
+        lambda db, group_by, order_by, limit, filters: db.get_aggregates(
+            group_by, get_list_arg("metric"), order_by=order_by, limit=limit, **filters)
+    )
 
 @app.route('/api/upload/data', methods=['GET', 'POST'])
 def upload_data():
-    if not request.get_json():
-        abort(400, {'message': 'No JSON file provided'})
-
-    payload = request.get_json()
-
-    if not 'ATP' in payload or not 'Year' in payload:
-        abort(400, {'message': 'No ATP and Year fields provided'})
-
-    if not validate_input_json(payload):
-        abort(400, {'message': 'Invalid input data format'})
+    """
+    Upload records as a JSON object, JSON array or NDJSON stream (`application/x-ndjson` content type)
+    """
+    if request.mimetype in NDJSON_MIMETYPES:
+        # NDJSON body is processed while it is being received, invalid lines are reported as rejected records
+        records = iter_ndjson_records(request.stream)
     else:
-        logging.info("Input data successfully validated")
+        body = request.get_data()
+        if not body:
+            abort(400, {'message': 'No JSON data provided'})
+        try:
+            records = iter_json_records(body)
+        except ValueError as e:
+            abort(400, {'message': 'Invalid input data format: {}'.format(e)})
 
     try:
-        db_connector = DBConnector()
-        loader = TennisDataLoader(url=config["tennis"]["base_url"], db_connector=db_connector)
-
-        pd_payload = {k:[v] for k,v in payload.items()}
-
-        data = pd.DataFrame.from_dict(pd_payload)
-
-        print("Preprocessing data before loading in database")
-        data_preprocessor = Preprocessor(TOURNAMENTS_PREPROCESS+RESULTS_PREPROCESS+BETS_PREPROCESS)
-        data = data_preprocessor.calculate(data)
-
-        year = int(payload.get("Year"))
-
-        data = data.rename(columns=constants.RENAME_MAP)
-
-        loader.save_tournament_data(yearly_data=data, filename=config["data"]["tournaments_data"].format(year=year), primary_keys=["ATP", "Year"])
-        loader.save_results_data(yearly_data=data, filename=config["data"]["results_data"].format(year=year), primary_keys=["ATP", "Year", "Winner", "Loser"])
-        loader.save_bets_data(yearly_data=data, filename=config["data"]["bets_data"].format(year=year), primary_keys=["ATP", "Year", "Winner", "Loser"])
+        with DBConnector() as db_connector:
+            uploader = BulkUploader(db_connector=db_connector, batch_size=config["upload"].getint("batch_size"))
+            report = uploader.upload(records)
     except Exception as e:
         # In case of failed execution return message with exception content
         logging.error("Data uploading failed with exception {}".format(e))
-        return Response("Failed to load data for year {} due to exception: {}".format(year, e), status=400)
+        return Response("Failed to upload data due to exception: {}".format(e), status=400)
+
+    if report["years"]:
+        DATA_GENERATIONS.bump(report["years"])
+    logging.info("Uploaded {} records, {} rejected, inserted rows: {}, updated rows: {}".format(
+        report["received"], len(report["rejected"]), report["inserted"], report["updated"]))
+
+    return Response(json.dumps(report), status=200 if not report["rejected"] else 207, mimetype="application/json")
+
+def import_years(job, years, force=False):
+    """
+    Background job importing a range of years
+    :param job:                 Job object
+    :param years:               list of years to import
+    :param force:               import years even if data is unchanged since the last import
+    :return:                    dictionary with imported, unchanged, cancelled and failed years
+    """
+    logging.info("Start loading data for years {}".format(years))
+    job.set_progress(0, "Importing {} years".format(len(years)))
+
+    # connection is checked out from the pool only when data is saved
+    with DBConnector() as db_connector:
+        pipeline = ImportPipeline(
+            db_connector=db_connector,
+            max_workers=config["import"].getint("max_workers"),
+            queue_size=config["import"].getint("queue_size"),
+            force=force
+        )
+        results = pipeline.run(
+            years,
+            on_saved=lambda year: DATA_GENERATIONS.bump([year]),
+            on_progress=lambda done, total: job.set_progress(done / total, "Processed {} of {} years".format(done, total)),
+            should_stop=lambda: job.cancel_requested
+        )
+
+    job.result = {
+        "imported": [year for year in years if results[year] == IMPORTED],
+        "unchanged": [year for year in years if results[year] == SKIPPED],
+        "cancelled": [year for year in years if results[year] == CANCELLED],
+        "failed": {year: str(r) for year, r in results.items() if r not in (IMPORTED, SKIPPED, CANCELLED)},
+        "changes": {year: report for year, report in pipeline.reports.items() if report is not None}
+    }
+    job.check_cancelled()
+    if job.result["failed"]:
+        raise Exception("Failed to import data for years {}".format(sorted(job.result["failed"])))
+    return job.result
+
+def submit_import_job(years):
+    """
+    Submit import job and build response with job status
+    """
+    force = request.args.get("force", "").lower() in ("1", "true", "yes")
+    name = "import {}".format(years[0] if len(years) == 1 else "{}-{}".format(years[0], years[-1]))
+    try:
+        job, created = JOB_MANAGER.submit(name, years, import_years, years, force=force)
+    except JobConflict as e:
+        return Response(json.dumps({"message": str(e), "job": e.job.to_dict()}), status=409, mimetype="application/json")
 
-    return Response("Data for year {} successfully uploaded".format(year), status=200)
+    status_url = "/api/jobs/{}".format(job.id)
+    body = json.dumps({"job": job.to_dict(), "status_url": status_url})
+    return Response(body, status=202 if created else 200, mimetype="application/json", headers={"Location": status_url})
 
 @app.route('/api/import/data/<int:year>', methods=['GET', 'POST'])
 def import_data(year):
+    return submit_import_job([year])
 
-    try:
-        logging.info("Start loading data for year {}".format(year))
+@app.route('/api/import/data/<int:start_year>/<int:end_year>', methods=['GET', 'POST'])
+def import_data_range(start_year, end_year):
 
-        db_connector = DBConnector()
-        loader = TennisDataLoader(url=config["tennis"]["base_url"], db_connector=db_connector)
+    if end_year < start_year:
+        abort(400, {'message': 'End year {} is before start year {}'.format(end_year, start_year)})
 
-        logging.info("Downloading data from {}".format(config["tennis"]["base_url"]))
-        yearly_data = loader.download_by_year(url=config["tennis"]["url_year"], year=year, path=config["tennis"]["base_dir"])
+    return submit_import_job(list(range(start_year, end_year + 1)))
 
-        logging.info("Preprocessing data before loading in database")
-        results_preprocessor = Preprocessor(TOURNAMENTS_PREPROCESS+RESULTS_PREPROCESS+BETS_PREPROCESS)
-        yearly_data = results_preprocessor.calculate(yearly_data)
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    return Response(json.dumps([job.to_dict() for job in JOB_MANAGER.list()]), status=200, mimetype="application/json")
 
-        yearly_data = yearly_data.rename(columns=constants.RENAME_MAP)
-        yearly_data["Year"] = int(year)
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = JOB_MANAGER.get(job_id)
+    if job is None:
+        abort(404)
+    return Response(json.dumps(job.to_dict()), status=200, mimetype="application/json")
 
-        loader.save_tournament_data(yearly_data=yearly_data, filename=config["data"]["tournaments_data"].format(year=year), primary_keys=["ATP", "Year"])
-        loader.save_results_data(yearly_data=yearly_data, filename=config["data"]["results_data"].format(year=year), primary_keys=["ATP", "Year", "Winner", "Loser"])
-        loader.save_bets_data(yearly_data=yearly_data, filename=config["data"]["bets_data"].format(year=year), primary_keys=["ATP", "Year", "Winner", "Loser"])
-
-    except Exception as e:
-        # In case of failed execution return message with exception content
-        logging.error("Data import failed with exception {}".format(e))
-        return Response("Failed to import data for year {} due to exception: {}".format(year, e), status=400)
-
-    return Response("Data for year {} successfully imported".format(year), status=200)
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST', 'DELETE'])
+def cancel_job(job_id):
+    job = JOB_MANAGER.cancel(job_id)
+    if job is None:
+        abort(404)
+    return Response(json.dumps(job.to_dict()), status=202, mimetype="application/json")
 
 @app.route('/api/delete/data', methods=['GET', 'POST'])
 def delete_data():
 
     try:
-        db_connector = DBConnector()
-        
         search_value = request.args.get("search")
 
         filters = {}
@@ -203,19 +385,29 @@ def delete_data():
 
         for c in constants.TOURNAMENTS_FIELDS:
             if c in request.args:
-                filters["tournaments"]["and_filters"][c] = request.args.get(c)
+                filters["tournaments"]["and_filters"][c] = request.args.getlist(c)
 
         for c in constants.RESULTS_FIELDS:
             if c in request.args:
-                filters["results"]["and_filters"][c] = request.args.get(c)
+                filters["results"]["and_filters"][c] = request.args.getlist(c)
 
         for c in constants.BETS_FIELDS:
             if c in request.args:
-                filters["bets"]["and_filters"][c] = request.args.get(c)
-
-        db_connector.delete_db_data(table="tournaments", search=search_value, **filters["tournaments"])
-        db_connector.delete_db_data(table="results", search=search_value, **filters["results"])
-        db_connector.delete_db_data(table="bets", search=search_value, **filters["bets"])
+                filters["bets"]["and_filters"][c] = request.args.getlist(c)
+
+        with DBConnector() as db_connector:
+            db_connector.delete_db_data(table="tournaments", search=search_value, **filters["tournaments"])
+            db_connector.delete_db_data(table="results", search=search_value, **filters["results"])
+            db_connector.delete_db_data(table="bets", search=search_value, **filters["bets"])
+            db_connector.refresh_rollups()
+        # deletion filters are not restricted to a year
+        DATA_GENERATIONS.bump()
+        # deleted rows are removed from snapshots as well, so they are not brought back by restore
+        snapshots = get_snapshot_store()
+        if snapshots is not None:
+            for table in ("tournaments", "results", "bets"):
+                snapshots.delete_data(table, search=search_value, **filters[table])
+        DownloadCache(config["tennis"]["download_cache"]).clear_imported()
 
     except Exception as e:
         # In case of failed execution return message with exception content
@@ -0,0 +1,134 @@
+"""
+Timing, result files and baseline comparison of benchmarks.
+Results are JSON files {"meta": {...}, "benchmarks": {name: statistics}}. A benchmark regresses when its median time
+exceeds the baseline median by more than `threshold` (relative) and `min_delta` seconds (absolute), so noise of very
+short benchmarks is not reported
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import platform
+import statistics
+
+import numpy as np
+import pandas as pd
+
+
+def measure(func, setup=None, repeat=5):
+    """
+    Time function calls
+    :param func:                    function called with arguments returned by `setup`
+    :param setup:                   function returning tuple of arguments for `func`, called before every run and not
+                                    timed
+    :param repeat:                  number of timed runs
+    :return:                        dictionary with timing statistics in seconds and number of processed rows
+                                    if `func` returns it
+    """
+    timings = []
+    rows = None
+    for _ in range(repeat):
+        args = setup() if setup is not None else ()
+        start = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - start)
+        if isinstance(result, int):
+            rows = result
+    stats = {
+        "repeat": repeat,
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+        "stdev": statistics.stdev(timings) if repeat > 1 else 0.0,
+    }
+    if rows is not None:
+        stats["rows"] = rows
+        stats["rows_per_second"] = rows / stats["median"] if stats["median"] > 0 else None
+    return stats
+
+
+def environment():
+    """
+    Description of the environment stored with results
+    """
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+
+
+def write_results(results, path):
+    """
+    Write results to JSON file
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    logging.info("Benchmark results were written to {}".format(path))
+
+
+def load_results(path):
+    """
+    Read results from JSON file
+    :return:                        results dictionary or None if file does not exist
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(results, baseline, threshold=0.25, min_delta=0.005):
+    """
+    Compare median times of benchmarks with baseline
+    :param results:                 current results
+    :param baseline:                baseline results
+    :param threshold:               allowed relative slowdown
+    :param min_delta:               allowed absolute slowdown in seconds
+    :return:                        list of dictionaries {"name", "baseline", "current", "ratio", "status"}, status is
+                                    one of "ok", "regression", "improvement", "new", "incomparable"
+    """
+    rows = []
+    baseline = baseline.get("benchmarks", {})
+    for name, stats in sorted(results["benchmarks"].items()):
+        current = stats["median"]
+        if name not in baseline:
+            rows.append({"name": name, "baseline": None, "current": current, "ratio": None, "status": "new"})
+            continue
+        if baseline[name].get("rows") != stats.get("rows"):
+            # workload differs, e.g. baseline was run at another scale
+            rows.append({"name": name, "baseline": baseline[name]["median"], "current": current, "ratio": None,
+                         "status": "incomparable"})
+            continue
+        reference = baseline[name]["median"]
+        ratio = current / reference if reference > 0 else None
+        status = "ok"
+        if ratio is not None and abs(current - reference) > min_delta:
+            if ratio > 1 + threshold:
+                status = "regression"
+            elif ratio < 1 / (1 + threshold):
+                status = "improvement"
+        rows.append({"name": name, "baseline": reference, "current": current, "ratio": ratio, "status": status})
+    return rows
+
+
+def format_comparison(rows):
+    """
+    Render comparison as text table
+    """
+    lines = ["{:<40} {:>12} {:>12} {:>8}  {}".format("benchmark", "baseline, s", "current, s", "ratio", "status")]
+    for row in rows:
+        lines.append("{:<40} {:>12} {:>12} {:>8}  {}".format(
+            row["name"],
+            "-" if row["baseline"] is None else "{:.4f}".format(row["baseline"]),
+            "{:.4f}".format(row["current"]),
+            "-" if row["ratio"] is None else "{:.2f}".format(row["ratio"]),
+            row["status"]
+        ))
+    return "\n".join(lines)
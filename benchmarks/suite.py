@@ -0,0 +1,265 @@
+"""
+Micro-benchmark suite of import, validation and database access.
+Database is built from seeded synthetic data in a separate file, every benchmark is timed `repeat` times and results
+are written to JSON and compared with the stored baseline.
+Missing baseline is recorded from the results of the run, so the first run of an environment creates its reference.
+Usage: python -m benchmarks.suite [--matches 50000] [--years 5] [--repeat 5] [--baseline benchmarks/baseline.json]
+                                  [--save-baseline]
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+
+import config as c
+from config import config
+
+# benchmark database is selected before database modules open their connection pools
+settings = config["benchmarks"]
+config["db"]["database"] = settings["database"]
+config["storage"]["snapshots"] = "no"
+
+from utils.db.connector import DBConnector, initialize_database
+from utils.helpers import validate_input_json
+from utils.loader.loader import TennisDataLoader
+from utils.logging.helpers import log_initialize
+from utils.preprocess import Preprocessor, TOURNAMENTS_PREPROCESS, RESULTS_PREPROCESS, BETS_PREPROCESS
+
+from benchmarks.synthetic import SyntheticTennisData
+from benchmarks.runner import measure, environment, write_results, load_results, compare, format_comparison
+
+PAGE_ROWS = c.NROWS_PER_PAGE
+VALIDATED_RECORDS = 1000
+PREPROCESS = TOURNAMENTS_PREPROCESS + RESULTS_PREPROCESS + BETS_PREPROCESS
+
+# exit codes of the suite
+EXIT_REGRESSION = 1
+
+
+def preprocess(data):
+    """
+    Preprocess raw yearly frame the same way as import does
+    """
+    data = Preprocessor(PREPROCESS).calculate(data)
+    return data.rename(columns=c.RENAME_MAP)
+
+
+def remove_database(path):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+class BenchmarkSuite:
+    """
+    Implements benchmarks over synthetic database
+    """
+    def __init__(self, matches=50000, years=5, repeat=5, seed=0, start_year=2000):
+        """
+        :param matches:             total number of matches in database
+        :param years:               number of years the matches are spread over
+        :param repeat:              number of timed runs of every benchmark
+        :param seed:                seed of synthetic data
+        :param start_year:          first year of data
+        """
+        self.matches = matches
+        self.years = list(range(start_year, start_year + years))
+        self.matches_per_year = -(-matches // years)
+        self.repeat = repeat
+        self.seed = seed
+        self.generator = SyntheticTennisData(seed=seed, dirty=0.01)
+        # year used by write benchmarks, it is not part of the queried data
+        self.scratch_year = start_year - 1
+        self.db_connector = None
+        self.loader = None
+        self.results = {}
+
+    def run(self):
+        """
+        Build database and run all benchmarks
+        :return:                    results dictionary
+        """
+        t1 = time.time()
+        os.makedirs(os.path.dirname(config["db"]["database"]) or ".", exist_ok=True)
+        remove_database(config["db"]["database"])
+        initialize_database()
+        with DBConnector() as db_connector:
+            self.db_connector = db_connector
+            self.loader = TennisDataLoader(url=config["tennis"]["base_url"], db_connector=db_connector)
+            populate_seconds = self.populate()
+
+            raw = self.generator.year(self.scratch_year, matches=self.matches_per_year)
+            raw["Year"] = self.scratch_year
+            prepared = preprocess(raw.copy())
+
+            self.bench_preprocess(raw)
+            self.bench_validation(prepared)
+            self.bench_save(prepared)
+            self.bench_queries()
+            self.bench_delete()
+        return {
+            "meta": dict(environment(), seed=self.seed, matches=self.matches, years=len(self.years),
+                         repeat=self.repeat, populate_seconds=populate_seconds, total_seconds=time.time() - t1),
+            "benchmarks": self.results,
+        }
+
+    def add(self, name, func, setup=None, repeat=None):
+        stats = measure(func, setup=setup, repeat=repeat or self.repeat)
+        self.results[name] = stats
+        logging.info("Benchmark {}: median {:.4f} seconds".format(name, stats["median"]))
+        print("{:<40} {:>10.4f} s".format(name, stats["median"]), flush=True)
+
+    def populate(self):
+        """
+        Load synthetic years through the loader
+        :return:                    seconds spent
+        """
+        t1 = time.time()
+        for year, raw in self.generator.years(self.matches, start_year=self.years[0], matches_per_year=self.matches_per_year):
+            raw["Year"] = year
+            data = preprocess(raw)
+            self.loader.save_tournament_data(yearly_data=data, primary_keys=c.PRIMARY_KEYS["tournaments"])
+            self.loader.save_results_data(yearly_data=data, primary_keys=c.PRIMARY_KEYS["results"])
+            self.loader.save_bets_data(yearly_data=data, primary_keys=c.PRIMARY_KEYS["bets"])
+            logging.info("Benchmark database: year {} with {} matches was loaded".format(year, len(data)))
+        return time.time() - t1
+
+    def bench_preprocess(self, raw):
+        self.add("preprocess.calculate", lambda data: len(Preprocessor(PREPROCESS).calculate(data)),
+                 setup=lambda: (raw.copy(),))
+
+    def bench_validation(self, prepared):
+        records = prepared.head(VALIDATED_RECORDS).copy()
+        records["Date"] = records["Date"].astype(str)
+        records = records.astype(object).where(records.notna(), None).to_dict("records")
+
+        def validate():
+            for record in records:
+                validate_input_json(record)
+            return len(records)
+
+        self.add("validation.validate_input_json", validate)
+
+    def clear_year(self, year, tables=("bets", "results", "tournaments")):
+        for table in tables:
+            self.db_connector._execute_single_query(
+                "DELETE FROM {} WHERE Year = ?;".format(self.db_connector.tables[table]), [year])
+
+    def bench_save(self, prepared):
+        tables = ("tournaments", "results", "bets")
+        savers = {
+            "tournaments": self.loader.save_tournament_data,
+            "results": self.loader.save_results_data,
+            "bets": self.loader.save_bets_data,
+        }
+        for i, table in enumerate(tables):
+            def setup(earlier=tables[:i]):
+                # tables are saved in import order, so earlier tables are loaded before the timed one
+                self.clear_year(self.scratch_year)
+                for t in earlier:
+                    savers[t](yearly_data=prepared, primary_keys=c.PRIMARY_KEYS[t])
+                return ()
+
+            def save(table=table):
+                savers[table](yearly_data=prepared, primary_keys=c.PRIMARY_KEYS[table])
+                return len(prepared)
+
+            self.add("loader.save_{}_data".format("tournament" if table == "tournaments" else table), save, setup=setup)
+        self.clear_year(self.scratch_year)
+
+    def bench_queries(self):
+        db = self.db_connector
+        year = self.years[len(self.years) // 2]
+        player = db.get_db_data(columns=["Winner"], rows=1, and_filters={"Year": [year]})["Winner"].iloc[0]
+        cursor = db.connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM {};".format(db.tables["matches"]))
+        total = cursor.fetchone()[0]
+        cursor.close()
+        deep_page = max(2, total // PAGE_ROWS)
+
+        self.add("db.get_db_data.first_page", lambda: len(db.get_db_data(rows=PAGE_ROWS, and_filters={"Year": [year]})))
+        self.add("db.get_db_data.filters", lambda: len(db.get_db_data(rows=PAGE_ROWS, and_filters={
+            "Year": [year], "Surface": ["Clay", "Grass"], "WRank": ["<=100"], "B365W": ["1.5..3"]})))
+        self.add("db.get_db_data.search", lambda: len(db.get_db_data(rows=PAGE_ROWS, search=player)))
+        self.add("db.get_db_data.search_year", lambda: len(db.get_db_data(
+            rows=PAGE_ROWS, search=player, and_filters={"Year": [year]})))
+        self.add("db.get_db_data.deep_page", lambda: len(db.get_db_data(rows=PAGE_ROWS, page=deep_page)))
+
+        # cursor of the same depth as the deep page: keys of the last row before it in keyset order
+        previous = db.get_db_data(columns=c.KEYSET_COLUMNS, rows=1, page=(deep_page - 1) * PAGE_ROWS,
+                                  sortby=c.KEYSET_COLUMNS)
+        deep_cursor = db.get_next_cursor(previous, rows=1) or ""
+        self.add("db.get_db_data.deep_cursor", lambda: len(db.get_db_data(rows=PAGE_ROWS, cursor=deep_cursor)))
+        self.add("db.get_db_data.full_year", lambda: len(db.get_db_data(rows=None, and_filters={"Year": [year]})),
+                 repeat=max(1, self.repeat // 2))
+
+    def bench_delete(self):
+        db = self.db_connector
+        year = self.years[-1]
+        tournaments = db.get_db_data(columns=["ATP"], rows=None, and_filters={"Year": [year]})["ATP"].unique().tolist()
+        targets = iter(tournaments)
+
+        def delete_tournament(atp):
+            db.delete_db_data("bets", and_filters={"Year": [year], "ATP": [atp]})
+            db.delete_db_data("results", and_filters={"Year": [year], "ATP": [atp]})
+            return 1
+
+        if len(tournaments) >= self.repeat:
+            self.add("db.delete_db_data", delete_tournament, setup=lambda: (next(targets),))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run benchmarks over synthetic data")
+    parser.add_argument("--matches", type=int, default=settings.getint("matches", 50000), help="total number of matches")
+    parser.add_argument("--years", type=int, default=settings.getint("years", 5), help="number of years")
+    parser.add_argument("--repeat", type=int, default=settings.getint("repeat", 5), help="timed runs per benchmark")
+    parser.add_argument("--seed", type=int, default=settings.getint("seed", 0), help="seed of synthetic data")
+    parser.add_argument("--output", help="results file, timestamped file in `results_dir` by default")
+    parser.add_argument("--baseline", default=settings["baseline"], help="baseline results file")
+    parser.add_argument("--save-baseline", action="store_true", help="store results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=settings.getfloat("threshold", 0.25),
+                        help="allowed relative slowdown against baseline")
+    parser.add_argument("--min-delta", type=float, default=settings.getfloat("min_delta", 0.005),
+                        help="allowed absolute slowdown in seconds")
+    args = parser.parse_args()
+
+    log_initialize(
+        file_path=config["logging"]["log_path_benchmarks"],
+        file_mode=c.LOG_FILE_MODE,
+        log_level=c.LOG_LEVEL,
+        log_format_str=c.LOG_FORMAT,
+        days_keep=30
+    )
+
+    suite = BenchmarkSuite(matches=args.matches, years=args.years, repeat=args.repeat, seed=args.seed)
+    results = suite.run()
+    output = args.output or os.path.join(settings["results_dir"], "benchmark_{}.json".format(time.strftime("%Y%m%d_%H%M%S")))
+    write_results(results, output)
+    print("Results: {}".format(output))
+
+    if args.save_baseline:
+        write_results(results, args.baseline)
+        print("Baseline: {}".format(args.baseline))
+        return 0
+
+    baseline = load_results(args.baseline)
+    if baseline is None:
+        # every benchmark is reported as new, results of this run are the reference of the next ones
+        print(format_comparison(compare(results, {})))
+        write_results(results, args.baseline)
+        logging.warning("Benchmark baseline {} was not found, results were recorded as baseline".format(args.baseline))
+        print("Baseline {} was not found, results were recorded as baseline".format(args.baseline))
+        return 0
+    rows = compare(results, baseline, threshold=args.threshold, min_delta=args.min_delta)
+    print(format_comparison(rows))
+    regressions = [row["name"] for row in rows if row["status"] == "regression"]
+    if regressions:
+        logging.error("Benchmark regressions: {}".format(", ".join(regressions)))
+        return EXIT_REGRESSION
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
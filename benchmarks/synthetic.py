@@ -0,0 +1,288 @@
+"""
+Seeded generator of synthetic tennis-data yearly files.
+Frames have the columns and value formats of files published on tennis-data.co.uk, so they go through the same
+preprocessing, validation and database code as downloaded data. Tournaments are knockout draws of a fixed player pool,
+so every (ATP, Year, Winner, Loser) key is unique, ranks drive winners and odds, and set scores are consistent with
+the number of sets won. Generation is vectorized per draw size and yearly frames are produced one by one, so data sets
+up to ~10M matches are generated without holding all years in memory
+"""
+
+import json
+import math
+import warnings
+import numpy as np
+import pandas as pd
+
+from config import config
+
+BOOKMAKERS = ["B365", "EX", "LB", "PS", "SJ"]
+
+# tournament categories: series, share of tournaments, draw sizes, best of
+SERIES = [
+    ("Grand Slam", 0.06, [128], 5),
+    ("Masters 1000", 0.14, [64, 128], 3),
+    ("ATP500", 0.20, [32, 64], 3),
+    ("ATP250", 0.60, [32], 3),
+]
+SURFACES = ["Hard", "Clay", "Grass", "Carpet"]
+SURFACE_SHARES = [0.55, 0.3, 0.1, 0.05]
+
+# losing set games: 0..6, 5 and 6 mean 7-5 and 7-6 sets
+LOSER_GAMES_SHARES = [0.04, 0.1, 0.18, 0.22, 0.22, 0.12, 0.12]
+
+# syllables of player surnames, index of a player is encoded in them, so names are unique
+CONSONANTS = "bcdfgklmnprstvz"
+VOWELS = "aeiou"
+SYLLABLES = [c1 + v + c2 for c1 in CONSONANTS for v in VOWELS for c2 in "lnrsv"]
+
+
+def player_names(n_players):
+    """
+    Build unique player names in tennis-data format "Surname I."
+    :param n_players:           number of players
+    :return:                    numpy array of names
+    """
+    base = len(SYLLABLES)
+    names = []
+    for i in range(n_players):
+        parts = [SYLLABLES[i % base].capitalize(), SYLLABLES[(i // base) % base]]
+        if i >= base * base:
+            parts.append(SYLLABLES[i // (base * base)])
+        names.append("{} {}.".format("".join(parts), chr(ord("A") + i % 26)))
+    return np.array(names, dtype=object)
+
+
+def _next_prime(n):
+    n = max(n, 2)
+    while any(n % d == 0 for d in range(2, int(math.isqrt(n)) + 1)):
+        n += 1
+    return n
+
+
+def _load_locations():
+    try:
+        with open(config["live"]["locations"], encoding="utf-8") as f:
+            return sorted(json.load(f))
+    except (KeyError, FileNotFoundError):
+        return ["Melbourne", "Paris", "London", "New York"]
+
+
+def _round_name(players_left, round_number):
+    names = {2: "The Final", 4: "Semifinals", 8: "Quarterfinals"}
+    if players_left in names:
+        return names[players_left]
+    return "{} Round".format({1: "1st", 2: "2nd", 3: "3rd"}.get(round_number, "{}th".format(round_number)))
+
+
+class SyntheticTennisData:
+    """
+    Implements generator of tennis-data shaped yearly frames
+    """
+    def __init__(self, seed=0, n_players=None, dirty=0.0):
+        """
+        :param seed:                seed of random generator, the same seed produces the same data
+        :param n_players:           size of player pool, derived from number of matches per year if None
+        :param dirty:               share of invalid values (missing or negative numbers and missing comments) injected
+                                    to exercise preprocessing
+        """
+        self.seed = seed
+        self.n_players = n_players
+        self.dirty = dirty
+        self.locations = _load_locations()
+        self._names = None
+
+    def names(self, n_players):
+        if self._names is None or len(self._names) < n_players:
+            self._names = player_names(n_players)
+        return self._names[:n_players]
+
+    def year(self, year, matches=2600):
+        """
+        Generate data of a single year
+        :param year:                year of the data
+        :param matches:             number of matches
+        :return:                    DataFrame with columns of tennis-data yearly file
+        """
+        rng = np.random.default_rng([self.seed, year])
+        # pool is a prime, so a random stride over it picks distinct players for a draw
+        n_players = _next_prime(max(self.n_players or int(math.sqrt(matches) * 16), 256))
+        names = self.names(n_players)
+        ranks = rng.permutation(n_players) + 1
+        points = np.round(12000 / ranks ** 0.75).astype(np.int64)
+
+        tournaments = self._tournaments(rng, year, matches)
+        frames = []
+        for draw, group in tournaments.groupby("draw", sort=False):
+            frames.append(self._draws(rng, group, int(draw), ranks))
+        data = pd.concat(frames, ignore_index=True).sort_values(["ATP", "round"], kind="stable")
+        data = data.iloc[:matches].reset_index(drop=True)
+        n = len(data)
+
+        winner, loser = data["winner"].to_numpy(), data["loser"].to_numpy()
+        best_of = data["best_of"].to_numpy()
+        frame = pd.DataFrame({
+            "ATP": data["ATP"].to_numpy(),
+            "Location": data["Location"].to_numpy(),
+            "Tournament": data["Tournament"].to_numpy(),
+            "Date": data["Date"].to_numpy() + pd.to_timedelta(data["round"].to_numpy(), unit="D"),
+            "Series": data["Series"].to_numpy(),
+            "Court": data["Court"].to_numpy(),
+            "Surface": data["Surface"].to_numpy(),
+            "Round": data["Round"].to_numpy(),
+            "Best of": best_of,
+            "Winner": names[winner],
+            "Loser": names[loser],
+            "WRank": ranks[winner].astype(np.float64),
+            "LRank": ranks[loser].astype(np.float64),
+            "WPts": points[winner].astype(np.float64),
+            "LPts": points[loser].astype(np.float64),
+        })
+        for column, values in self._scores(rng, best_of).items():
+            frame[column] = values
+        frame["Comment"] = np.where(rng.random(n) < 0.02, "Retired", "Completed").astype(object)
+        for column, values in self._odds(rng, ranks[winner], ranks[loser]).items():
+            frame[column] = values
+        if self.dirty:
+            self._inject_invalid(rng, frame)
+        return frame
+
+    def years(self, total_matches, start_year=2000, matches_per_year=2600):
+        """
+        Generate yearly frames until `total_matches` matches are produced
+        :return:                    generator of tuples (year, DataFrame)
+        """
+        year = start_year
+        remaining = total_matches
+        while remaining > 0:
+            matches = min(matches_per_year, remaining)
+            yield year, self.year(year, matches=matches)
+            remaining -= matches
+            year += 1
+
+    def _tournaments(self, rng, year, matches):
+        """
+        Draw tournaments until they have at least `matches` matches
+        """
+        shares = np.array([s[1] for s in SERIES])
+        mean_draw = sum(share * np.mean(draws) for (_, share, draws, _) in SERIES)
+        count = int(math.ceil(matches / (mean_draw - 1) * 1.2)) + 1
+        series = rng.choice(len(SERIES), size=count, p=shares / shares.sum())
+        draws = np.array([rng.choice(SERIES[s][2]) for s in series])
+        while (draws - 1).sum() < matches:
+            series = np.append(series, 3)
+            draws = np.append(draws, 32)
+        count = len(series)
+        location = rng.integers(0, len(self.locations), size=count)
+        week = np.sort(rng.integers(0, 50, size=count))
+        return pd.DataFrame({
+            "ATP": np.arange(1, count + 1),
+            "Location": [self.locations[i] for i in location],
+            "Tournament": ["{} {}".format(self.locations[i], SERIES[s][0]) for i, s in zip(location, series)],
+            "Date": pd.Timestamp(year=year, month=1, day=1) + pd.to_timedelta(week * 7, unit="D"),
+            "Series": [SERIES[s][0] for s in series],
+            "Court": np.where(rng.random(count) < 0.85, "Outdoor", "Indoor"),
+            "Surface": rng.choice(SURFACES, size=count, p=SURFACE_SHARES),
+            "best_of": [SERIES[s][3] for s in series],
+            "draw": draws,
+        })
+
+    @staticmethod
+    def _draws(rng, tournaments, draw, ranks):
+        """
+        Play knockout draws of the same size for all tournaments at once
+        :return:                    DataFrame with one row per match
+        """
+        count = len(tournaments)
+        n_players = len(ranks)
+        offset = rng.integers(0, n_players, size=(count, 1))
+        stride = rng.integers(1, n_players, size=(count, 1))
+        players = (offset + stride * np.arange(draw)) % n_players
+        matches = []
+        round_number = 1
+        while players.shape[1] > 1:
+            left, right = players[:, 0::2], players[:, 1::2]
+            left_wins = rng.random(left.shape) < ranks[right] / (ranks[left] + ranks[right])
+            winners = np.where(left_wins, left, right)
+            losers = np.where(left_wins, right, left)
+            matches.append(pd.DataFrame({
+                "row": np.repeat(np.arange(count), winners.shape[1]),
+                "round": round_number,
+                "Round": _round_name(players.shape[1], round_number),
+                "winner": winners.ravel(),
+                "loser": losers.ravel(),
+            }))
+            players = winners
+            round_number += 1
+        matches = pd.concat(matches, ignore_index=True)
+        info = tournaments.drop(columns="draw").reset_index(drop=True)
+        return info.iloc[matches["row"].to_numpy()].reset_index(drop=True).join(matches.drop(columns="row"))
+
+    @staticmethod
+    def _scores(rng, best_of):
+        """
+        Set scores consistent with the number of sets won by both players
+        :return:                    dictionary {column: values}
+        """
+        n = len(best_of)
+        to_win = (best_of + 1) // 2
+        loser_sets = np.floor(rng.random(n) * to_win).astype(np.int64)
+        total = to_win + loser_sets
+        # loser's sets are placed randomly before the last set, which is always won by the winner
+        keys = rng.random((n, 5))
+        keys[np.arange(5) >= (total - 1)[:, None]] = 2
+        order = np.argsort(keys, axis=1)
+        lost = np.zeros((n, 5), dtype=bool)
+        lost[np.arange(n)[:, None], order] = np.arange(5) < loser_sets[:, None]
+
+        loser_games = rng.choice(7, size=(n, 5), p=LOSER_GAMES_SHARES)
+        winner_games = np.where(loser_games >= 5, 7, 6)
+        played = np.arange(5) < total[:, None]
+        scores = {}
+        for i in range(5):
+            w = np.where(lost[:, i], loser_games[:, i], winner_games[:, i]).astype(np.float64)
+            l = np.where(lost[:, i], winner_games[:, i], loser_games[:, i]).astype(np.float64)
+            scores["W{}".format(i + 1)] = np.where(played[:, i], w, np.nan)
+            scores["L{}".format(i + 1)] = np.where(played[:, i], l, np.nan)
+        scores["Wsets"] = to_win.astype(np.float64)
+        scores["Lsets"] = loser_sets.astype(np.float64)
+        return scores
+
+    @staticmethod
+    def _odds(rng, winner_rank, loser_rank):
+        """
+        Odds of bookmakers around rank based probability of the winner, with maximum and average over bookmakers
+        :return:                    dictionary {column: values}
+        """
+        n = len(winner_rank)
+        probability = loser_rank ** 0.8 / (winner_rank ** 0.8 + loser_rank ** 0.8)
+        odds = {}
+        winner_odds, loser_odds = [], []
+        for bookmaker in BOOKMAKERS:
+            noise = rng.normal(0, 0.05, size=n)
+            p = np.clip(probability + noise, 0.02, 0.98)
+            w = np.round(np.maximum(1.01, 1 / (p * 1.05)), 2)
+            l = np.round(np.maximum(1.01, 1 / ((1 - p) * 1.05)), 2)
+            # smaller bookmakers do not quote every match
+            missing = rng.random(n) < (0.02 if bookmaker in ("B365", "PS") else 0.15)
+            w[missing] = np.nan
+            l[missing] = np.nan
+            odds[bookmaker + "W"], odds[bookmaker + "L"] = w, l
+            winner_odds.append(w)
+            loser_odds.append(l)
+        with warnings.catch_warnings():
+            # matches without any quote get missing maximum and average
+            warnings.simplefilter("ignore", RuntimeWarning)
+            odds["MaxW"] = np.nanmax(winner_odds, axis=0)
+            odds["MaxL"] = np.nanmax(loser_odds, axis=0)
+            odds["AvgW"] = np.round(np.nanmean(winner_odds, axis=0), 2)
+            odds["AvgL"] = np.round(np.nanmean(loser_odds, axis=0), 2)
+        return odds
+
+    def _inject_invalid(self, rng, frame):
+        n = len(frame)
+        for column in ["WRank", "LRank", "WPts", "LPts", "B365W", "PSL", "W1", "L2"]:
+            values = frame[column].to_numpy(copy=True)
+            mask = rng.random(n) < self.dirty
+            values[mask] = np.where(rng.random(mask.sum()) < 0.5, np.nan, -1)
+            frame[column] = values
+        frame.loc[rng.random(n) < self.dirty, "Comment"] = np.nan
@@ -40,8 +40,17 @@ BETS_FIELDS = ["ATP", "Date", "Winner", "Loser",
 
 RENAME_MAP = {"Best of" : "BestOf"}
 
+PRIMARY_KEYS = {
+    "tournaments": ["ATP", "Year"],
+    "results": ["ATP", "Year", "Winner", "Loser"],
+    "bets": ["ATP", "Year", "Winner", "Loser"]
+}
+
 NROWS_PER_PAGE = 100
 
+# unique sort key used for cursor-based pagination
+KEYSET_COLUMNS = ["ATP", "Year", "Winner", "Loser"]
+
 SEARCH_FIELDS = ["Tournament", "Location", "Year",
     "Series", "Court", "Surface", 
     "Winner", "Loser", "Round", "Comment"
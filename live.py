@@ -0,0 +1,64 @@
+"""
+Run live match stream service.
+Usage: python live.py [--host 0.0.0.0] [--port 8081] [--simulate]
+"""
+import sys
+import logging
+import argparse
+
+from aiohttp import web
+
+import config as constants
+from config import config
+
+from utils.logging.helpers import log_initialize
+from utils.live.service import create_app
+from utils.live.simulators import create_actions_simulator, create_weather_simulator, start_app
+
+
+def main():
+    settings = config["live"]
+    parser = argparse.ArgumentParser(description="Serve live streams of match actions and weather")
+    parser.add_argument("--host", default=settings.get("host", "0.0.0.0"), help="interface to listen on")
+    parser.add_argument("--port", type=int, default=settings.getint("port", 8081), help="port to listen on")
+    parser.add_argument("--simulate", action="store_true",
+                        help="start local simulators of action and weather providers on configured ports")
+    args = parser.parse_args()
+
+    log_initialize(
+        file_path=config["logging"]["log_path_live"],
+        file_mode=constants.LOG_FILE_MODE,
+        log_level=constants.LOG_LEVEL,
+        log_format_str=constants.LOG_FORMAT,
+        days_keep=30
+    )
+
+    app = create_app()
+    if args.simulate:
+        seed = settings.getint("simulator_seed", 0)
+        simulators = [
+            (create_actions_simulator(interval=settings.getfloat("simulator_interval", 1), seed=seed),
+             settings.getint("simulator_actions_port", 8091)),
+            (create_weather_simulator(seed=seed), settings.getint("simulator_weather_port", 8092)),
+        ]
+        runners = []
+
+        async def start_simulators(app):
+            for simulator, port in simulators:
+                runners.append(await start_app(simulator, "127.0.0.1", port))
+
+        async def stop_simulators(app):
+            for runner in runners:
+                await runner.cleanup()
+
+        # simulators are started before the service subscribes to providers
+        app.on_startup.insert(0, start_simulators)
+        app.on_cleanup.append(stop_simulators)
+
+    logging.info("Live: service is starting on {}:{}".format(args.host, args.port))
+    web.run_app(app, host=args.host, port=args.port)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
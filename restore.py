@@ -0,0 +1,49 @@
+"""
+Rebuild database from snapshots without network access.
+Usage: python restore.py [--years 2015 2016] [--snapshot-dir data/parquet] [--no-verify]
+"""
+import sys
+import json
+import logging
+import argparse
+
+import config as constants
+from config import config
+
+from utils.db.connector import DBConnector, initialize_database
+from utils.logging.helpers import log_initialize
+from utils.storage.parquet import ParquetBackend
+from utils.storage.snapshots import restore_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild database from Parquet snapshots")
+    parser.add_argument("--years", type=int, nargs="+", help="years to restore, all snapshot years by default")
+    parser.add_argument("--snapshot-dir", help="directory of snapshots, `parquet_dir` from configuration by default")
+    parser.add_argument("--no-verify", action="store_true", help="skip checksum verification of snapshot files")
+    args = parser.parse_args()
+
+    log_initialize(
+        file_path=config["logging"]["log_path_tennis_data"],
+        file_mode=constants.LOG_FILE_MODE,
+        log_level=constants.LOG_LEVEL,
+        log_format_str=constants.LOG_FORMAT,
+        days_keep=30
+    )
+
+    initialize_database()
+    try:
+        with DBConnector() as db_connector:
+            report = restore_database(
+                db_connector, store=ParquetBackend(base_dir=args.snapshot_dir), years=args.years, verify=not args.no_verify
+            )
+    except ValueError as e:
+        logging.error("Restore failed: {}".format(e))
+        print("Restore failed: {}".format(e), file=sys.stderr)
+        return 1
+    print(json.dumps({str(year): changes for year, changes in report.items()}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""
+Shared fixtures of tests
+"""
+
+import os
+import tempfile
+
+import pandas as pd
+
+import config as c
+from config import config
+
+from utils.db import connector
+from utils.preprocess import Preprocessor, TOURNAMENTS_PREPROCESS, RESULTS_PREPROCESS, BETS_PREPROCESS
+
+MATCH = {
+    "ATP": 98, "Year": 2013, "Date": "2013-05-05", "Tournament": "Var", "Location": "Varazdin", "Series": "ATP250",
+    "Court": "Outdoor", "Surface": "Clay", "Round": "1st Round", "Best of": 3, "Winner": "Murray A.",
+    "Loser": "Dolgopolov O.", "WRank": 10, "LRank": 20, "Comment": "Completed", "B365W": 1.5, "B365L": 2.5
+}
+
+
+class TemporaryDatabase:
+    """
+    Point database and snapshot configuration to a temporary directory, restore them on `cleanup`.
+    Database structure is created by the next DBConnector
+    """
+    SETTINGS = {"db": ("database",), "storage": ("snapshots", "parquet_dir")}
+
+    def __init__(self, snapshots=False):
+        """
+        :param snapshots:               write imports and uploads to Parquet snapshots in the directory
+        """
+        self.tmp = tempfile.TemporaryDirectory()
+        self.saved = {(section, key): config[section].get(key, raw=True)
+                      for section, keys in self.SETTINGS.items() for key in keys}
+        self.path = os.path.join(self.tmp.name, "tennisdata.db")
+        self.parquet_dir = os.path.join(self.tmp.name, "parquet")
+        config["db"]["database"] = self.path
+        config["storage"]["snapshots"] = "yes" if snapshots else "no"
+        config["storage"]["parquet_dir"] = self.parquet_dir
+        self._reset()
+
+    @staticmethod
+    def _reset():
+        connector.close_pool()
+        connector._BOOTSTRAPPED = False
+
+    def cleanup(self):
+        self._reset()
+        for (section, key), value in self.saved.items():
+            config[section][key] = value
+        self.tmp.cleanup()
+
+
+def match_frames(records):
+    """
+    Preprocess records and split them into frames of tournaments, results and bets as imports save them
+    :param records:                     list of dictionaries named as source file columns
+    :return:                            dictionary {table key: DataFrame indexed by primary key}
+    """
+    data = Preprocessor(TOURNAMENTS_PREPROCESS + RESULTS_PREPROCESS + BETS_PREPROCESS).calculate(
+        pd.DataFrame.from_records(records)).rename(columns=c.RENAME_MAP)
+    frames = {}
+    for table, fields in (("tournaments", c.TOURNAMENTS_FIELDS), ("results", c.RESULTS_FIELDS), ("bets", c.BETS_FIELDS)):
+        keys = c.PRIMARY_KEYS[table]
+        frames[table] = data.reindex(columns=fields + ["Year"]).drop_duplicates(subset=keys).set_index(keys)
+    return frames
@@ -0,0 +1,100 @@
+"""
+Data generations and response cache of read endpoints.
+Run with `python -m unittest discover tests`
+"""
+
+import time
+import unittest
+
+from utils.cache import DataGenerations, ResponseCache, make_etag
+
+
+class StoredGenerations:
+    """
+    Stands in for DBConnector, counts reads of stored generations
+    """
+    def __init__(self):
+        self.generations = {0: 42, 2012: 1}
+        self.reads = 0
+
+    def __call__(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def get_data_generations(self):
+        self.reads += 1
+        return dict(self.generations)
+
+
+class DataGenerationsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stored = StoredGenerations()
+        self.generations = DataGenerations(self.stored, check_interval=0.2)
+
+    def test_repeated_gets_read_database_once_per_interval(self):
+        token = self.generations.get(2012)
+        for _ in range(10):
+            self.assertEqual(self.generations.get(2012), token)
+        self.assertEqual(self.stored.reads, 1)
+
+    def test_bump_changes_token_of_year_only(self):
+        tokens = {year: self.generations.get(year) for year in (2012, 2013)}
+        total = self.generations.get_all()
+
+        self.generations.bump([2012])
+
+        self.assertNotEqual(self.generations.get(2012), tokens[2012])
+        self.assertEqual(self.generations.get(2013), tokens[2013])
+        self.assertNotEqual(self.generations.get_all(), total)
+        self.assertEqual(self.stored.reads, 1)
+
+    def test_bump_of_all_years(self):
+        token = self.generations.get(2013)
+        self.generations.bump()
+        self.assertNotEqual(self.generations.get(2013), token)
+
+    def test_write_of_other_process_is_noticed_after_interval(self):
+        token = self.generations.get(2012)
+        self.stored.generations[2012] += 1
+
+        self.assertEqual(self.generations.get(2012), token)
+        time.sleep(0.25)
+        self.assertNotEqual(self.generations.get(2012), token)
+        self.assertEqual(self.stored.reads, 2)
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def test_etag_ignores_argument_order(self):
+        self.assertEqual(make_etag("/a", [("x", "1"), ("y", "2")], "0.1"), make_etag("/a", [("y", "2"), ("x", "1")], "0.1"))
+        self.assertNotEqual(make_etag("/a", [], "0.1"), make_etag("/a", [], "0.2"))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = ResponseCache(max_entries=2, max_bytes=1024, ttl=60)
+        cache.set("a", b"1", "application/json")
+        cache.set("b", b"2", "application/json")
+        cache.get("a")
+        cache.set("c", b"3", "application/json")
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), (b"1", "application/json"))
+
+    def test_size_limit_and_ttl(self):
+        cache = ResponseCache(max_entries=10, max_bytes=4, ttl=0.1)
+        cache.set("large", b"12345", "text/csv")
+        cache.set("small", b"12", "text/csv")
+
+        self.assertIsNone(cache.get("large"))
+        self.assertIsNotNone(cache.get("small"))
+        time.sleep(0.15)
+        self.assertIsNone(cache.get("small"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+"""
+Conditional downloads of yearly files against a local HTTP server standing in for tennis-data.
+Run with `python -m unittest discover tests`
+"""
+
+import io
+import os
+import json
+import zipfile
+import tempfile
+import threading
+import unittest
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import config
+
+from utils.loader.loader import TennisDataLoader
+
+YEAR = 2012
+
+CSV_HEADER = "ATP,Date,Tournament,Location,Series,Court,Surface,Winner,Loser,Round,Best of,Comment,B365W,B365L\n"
+CSV_ROW = "1,2012-01-05,Brisbane,Brisbane,ATP250,Outdoor,Hard,Murray A.,Dolgopolov O.,The Final,3,Completed,{},2.62\n"
+
+
+def make_zip(odds):
+    """
+    Build yearly zip archive with a single match
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zipf:
+        zipf.writestr("{}.csv".format(YEAR), CSV_HEADER + CSV_ROW.format(odds))
+    return buffer.getvalue()
+
+
+class YearlyFileHandler(BaseHTTPRequestHandler):
+    """
+    Serves `server.body` with validators and answers conditional requests as tennis-data does
+    """
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        etag = '"{}"'.format(server.version)
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", server.last_modified)
+        self.send_header("Content-Type", "application/zip")
+        self.send_header("Content-Length", str(len(server.body)))
+        self.end_headers()
+        self.wfile.write(server.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DownloadCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), YearlyFileHandler)
+        self.server.requests = []
+        self.publish(odds=1.36)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.saved = {key: config["tennis"].get(key, raw=True) for key in ("download_cache", "skip_unchanged")}
+        self.saved_snapshots = config["storage"].get("snapshots", raw=True)
+        self.manifest_file = os.path.join(self.tmp.name, "download_cache.json")
+        config["tennis"]["download_cache"] = self.manifest_file
+        config["tennis"]["skip_unchanged"] = "yes"
+        config["storage"]["snapshots"] = "no"
+
+        self.url = "http://127.0.0.1:{}/{{year}}/{{year}}.zip".format(self.server.server_port)
+        self.path = os.path.join(self.tmp.name, "downloaded")
+        # files are only downloaded and parsed, database is not touched
+        self.loader = TennisDataLoader(url=self.url, db_connector=None)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        for key, value in self.saved.items():
+            config["tennis"][key] = value
+        config["storage"]["snapshots"] = self.saved_snapshots
+        self.tmp.cleanup()
+
+    def publish(self, odds):
+        """
+        Change file served by the stand-in, every version gets its own ETag and modification time
+        """
+        self.server.version = getattr(self.server, "version", 0) + 1
+        self.server.body = make_zip(odds)
+        self.server.last_modified = formatdate(1325376000 + self.server.version * 3600, usegmt=True)
+
+    def manifest(self):
+        with open(self.manifest_file) as f:
+            return json.load(f)[str(YEAR)]
+
+    def test_first_download_writes_manifest_entry(self):
+        filename, sha256 = self.loader.fetch_by_year(self.url, YEAR, self.path)
+
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertNotIn("If-None-Match", self.server.requests[0])
+        self.assertNotIn("If-Modified-Since", self.server.requests[0])
+        with open(filename, "rb") as f:
+            self.assertEqual(f.read(), self.server.body)
+        entry = self.manifest()
+        self.assertEqual(entry["filename"], filename)
+        self.assertEqual(entry["sha256"], sha256)
+        self.assertEqual(entry["etag"], '"1"')
+        self.assertEqual(entry["last_modified"], self.server.last_modified)
+
+    def test_repeated_download_is_conditional(self):
+        filename, sha256 = self.loader.fetch_by_year(self.url, YEAR, self.path)
+        modified = os.path.getmtime(filename)
+
+        cached_filename, cached_sha256 = self.loader.fetch_by_year(self.url, YEAR, self.path)
+
+        request = self.server.requests[-1]
+        self.assertEqual(request["If-None-Match"], '"1"')
+        self.assertEqual(request["If-Modified-Since"], self.server.last_modified)
+        self.assertEqual((cached_filename, cached_sha256), (filename, sha256))
+        # 304 response leaves cached copy in place
+        self.assertEqual(os.path.getmtime(filename), modified)
+
+    def test_unchanged_file_skips_import(self):
+        data = self.loader.download_by_year(self.url, YEAR, self.path, skip_imported=True)
+        self.assertEqual(len(data), 1)
+        self.loader.download_cache.mark_imported(YEAR, data.attrs["content_hash"])
+
+        self.assertIsNone(self.loader.download_by_year(self.url, YEAR, self.path, skip_imported=True))
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_changed_file_is_imported_again(self):
+        data = self.loader.download_by_year(self.url, YEAR, self.path, skip_imported=True)
+        self.loader.download_cache.mark_imported(YEAR, data.attrs["content_hash"])
+
+        self.publish(odds=1.4)
+        changed = self.loader.download_by_year(self.url, YEAR, self.path, skip_imported=True)
+
+        self.assertIsNotNone(changed)
+        self.assertNotEqual(changed.attrs["content_hash"], data.attrs["content_hash"])
+        self.assertAlmostEqual(float(changed["B365W"].iloc[0]), 1.4)
+        self.assertEqual(self.server.requests[-1]["If-None-Match"], '"1"')
+        self.assertEqual(self.manifest()["etag"], '"2"')
+
+
+if __name__ == "__main__":
+    unittest.main()
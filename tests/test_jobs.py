@@ -0,0 +1,102 @@
+"""
+Background jobs: per-year deduplication, conflicts and cooperative cancellation.
+Run with `python -m unittest discover tests`
+"""
+
+import threading
+import unittest
+
+from utils.jobs import JobManager, JobConflict, SUCCEEDED, FAILED, CANCELLED, RUNNING, QUEUED
+
+TIMEOUT = 10
+
+
+def blocking_job(job, started, release):
+    """
+    Job running until `release` is set, checks for cancellation in between
+    """
+    started.set()
+    while not release.wait(0.01):
+        job.check_cancelled()
+    return "done"
+
+
+class JobManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.manager = JobManager(max_workers=1, max_finished=2)
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        self.manager.shutdown()
+
+    def submit(self, keys, name="import"):
+        return self.manager.submit(name, keys, blocking_job, self.started, self.release)
+
+    def test_same_years_are_deduplicated(self):
+        job, created = self.submit([2012, 2013])
+        same, created_again = self.submit([2013, 2012])
+
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertIs(same, job)
+
+        self.release.set()
+        job.future.result(TIMEOUT)
+        self.assertEqual((job.status, job.result, job.progress), (SUCCEEDED, "done", 1.0))
+
+    def test_overlapping_years_conflict(self):
+        job, _ = self.submit([2012, 2013])
+        with self.assertRaises(JobConflict) as raised:
+            self.submit([2013, 2014])
+        self.assertIs(raised.exception.job, job)
+
+        # other years run independently, a finished job no longer locks its years
+        other, created = self.submit([2015])
+        self.assertTrue(created)
+        self.release.set()
+        job.future.result(TIMEOUT)
+        other.future.result(TIMEOUT)
+        self.assertTrue(self.submit([2013, 2014])[1])
+
+    def test_cancel_running_job(self):
+        job, _ = self.submit([2012])
+        self.assertTrue(self.started.wait(TIMEOUT))
+        self.assertEqual(job.status, RUNNING)
+
+        self.manager.cancel(job.id)
+        job.future.result(TIMEOUT)
+        self.assertEqual(job.status, CANCELLED)
+        self.assertIsNotNone(job.finished)
+
+    def test_cancel_queued_job(self):
+        running, _ = self.submit([2012])
+        self.assertTrue(self.started.wait(TIMEOUT))
+        queued, _ = self.submit([2013])
+        self.assertEqual(queued.status, QUEUED)
+
+        self.manager.cancel(queued.id)
+        self.assertEqual(queued.status, CANCELLED)
+        self.assertTrue(queued.future.cancelled())
+        self.assertEqual(self.manager.cancel("unknown"), None)
+
+    def test_failed_job_and_eviction(self):
+        def fail(job):
+            raise RuntimeError("download failed")
+
+        jobs = [self.manager.submit("import", [year], fail)[0] for year in (2010, 2011, 2012)]
+        for job in jobs:
+            job.future.result(TIMEOUT)
+        self.assertEqual([job.status for job in jobs], [FAILED] * 3)
+        self.assertEqual(jobs[0].error, "download failed")
+
+        # the oldest finished job is evicted when the next job is submitted
+        self.submit([2013])
+        self.assertIsNone(self.manager.get(jobs[0].id))
+        self.assertEqual(len(self.manager.list()), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
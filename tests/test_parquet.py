@@ -0,0 +1,106 @@
+"""
+Parquet storage backend: partitioned saves, appended files and their compaction, filters, keyset pages and manifest.
+Run with `python -m unittest discover tests`
+"""
+
+import os
+import tempfile
+import unittest
+
+from utils.db.query import encode_cursor
+from utils.storage.parquet import ParquetBackend, APPEND_PREFIX, PART_FILE
+
+from tests.helpers import MATCH, match_frames
+
+YEAR = MATCH["Year"]
+MATCHES = [
+    dict(MATCH, ATP=1, Tournament="Brisbane", Surface="Hard", B365W=1.2),
+    dict(MATCH, ATP=2, Tournament="Doha", Surface="Hard", Winner="Nadal R."),
+    dict(MATCH, ATP=3, Tournament="Monte Carlo", Loser="Djokovic N.", B365W=2.0),
+    dict(MATCH, ATP=1, Year=YEAR - 1, Date="2012-01-01", Tournament="Brisbane", Surface="Hard"),
+]
+
+
+class ParquetBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.store = ParquetBackend(base_dir=self.tmp.name)
+        self.store.save_frames(match_frames(MATCHES))
+
+    def partition_files(self, table, year=YEAR):
+        directory = os.path.join(self.tmp.name, table, "Year={}".format(year))
+        return sorted(os.listdir(directory))
+
+    def test_tables_are_partitioned_by_year(self):
+        self.assertEqual(self.partition_files("results"), [PART_FILE])
+        self.assertEqual(self.store.read_table("results", YEAR)["ATP"].tolist(), [1, 2, 3])
+        self.assertEqual(self.store.read_table("matches", YEAR - 1)["Tournament"].tolist(), ["Brisbane"])
+        with self.assertRaises(ValueError):
+            self.store.read_table("players", YEAR)
+
+    def test_saved_rows_are_ignored_unless_overwritten(self):
+        self.store.save_frames(match_frames([dict(MATCHES[0], B365W=5.0)]))
+        self.assertEqual(self.store.read_table("bets", YEAR)["B365W"].tolist()[0], 1.2)
+
+        self.store.save_frames(match_frames([dict(MATCHES[0], B365W=5.0)]), overwrite=True)
+        self.assertEqual(self.store.read_table("bets", YEAR)["B365W"].tolist()[0], 5.0)
+
+    def test_appended_rows_replace_stored_rows_until_compaction(self):
+        years = self.store.append_frames(match_frames([dict(MATCHES[2], B365W=3.0), dict(MATCHES[2], ATP=4)]))
+
+        self.assertEqual(years, {YEAR})
+        self.assertTrue(any(f.startswith(APPEND_PREFIX) for f in self.partition_files("bets")))
+        matches = self.store.read_table("matches", YEAR)
+        self.assertEqual(matches["ATP"].tolist(), [1, 2, 3, 4])
+        self.assertEqual(matches["B365W"].tolist(), [1.2, 1.5, 3.0, 2.0])
+
+        # the next save of the year merges appended files into the compacted file
+        self.store.save_frames(match_frames([dict(MATCHES[0], ATP=5)]))
+        self.assertEqual(self.partition_files("bets"), [PART_FILE])
+        self.assertEqual(self.store.read_table("bets", YEAR)["B365W"].tolist(), [1.2, 1.5, 3.0, 2.0, 1.2])
+
+    def test_filters_and_search(self):
+        data = self.store.get_data(columns=["ATP", "Year"], and_filters={"Surface": "Hard"}, sortby=["Year", "ATP"])
+        self.assertEqual(data.values.tolist(), [[1, YEAR - 1], [1, YEAR], [2, YEAR]])
+
+        data = self.store.get_data(columns=["ATP"], and_filters={"Year": YEAR}, search="monte")
+        self.assertEqual(data["ATP"].tolist(), [3])
+
+        data = self.store.get_data(columns=["ATP"], and_filters={"Year": YEAR, "B365W": ">1.4"})
+        self.assertEqual(data["ATP"].tolist(), [2, 3])
+
+        with self.assertRaises(ValueError):
+            self.store.get_data(columns=["ATP"], and_filters={"Unknown": 1})
+
+    def test_keyset_pages(self):
+        first = self.store.get_data(columns=["Tournament"], rows=2, cursor="")
+        self.assertEqual(first[["ATP", "Year"]].values.tolist(), [[1, YEAR - 1], [1, YEAR]])
+
+        after = first.iloc[-1][["ATP", "Year", "Winner", "Loser"]].tolist()
+        second = self.store.get_data(columns=["Tournament"], rows=2, cursor=encode_cursor(after))
+        self.assertEqual(second["Tournament"].tolist(), ["Doha", "Monte Carlo"])
+
+    def test_delete_cascades_to_results_and_bets(self):
+        self.store.delete_data("tournaments", and_filters={"Tournament": "Doha"})
+
+        for table in ("results", "bets", "matches"):
+            self.assertEqual(self.store.read_table(table, YEAR)["ATP"].tolist(), [1, 3], table)
+        self.assertEqual(len(self.store.read_table("results", YEAR - 1)), 1)
+
+    def test_manifest_detects_changed_files(self):
+        self.assertEqual(self.store.verify(), [])
+        self.assertEqual(sorted(self.store.load_manifest()["tables"]["matches"]), [str(YEAR - 1), str(YEAR)])
+
+        path = os.path.join(self.tmp.name, "bets", "Year={}".format(YEAR), PART_FILE)
+        with open(path, "ab") as f:
+            f.write(b"0")
+        errors = self.store.verify()
+        self.assertEqual(len(errors), 1)
+        self.assertIn("does not match manifest checksum", errors[0])
+        self.assertEqual(self.store.verify(years=[YEAR - 1]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+"""
+Connection pool: reuse of idle connections, bounded size, nested and cross-thread checkins, health checks and closing.
+Run with `python -m unittest discover tests`
+"""
+
+import sqlite3
+import threading
+import unittest
+
+from utils.db.pool import ConnectionPool
+
+TIMEOUT = 10
+
+
+class ConnectionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.opened = []
+        self.pool = ConnectionPool(self.connect, max_size=2, timeout=0.1)
+
+    def tearDown(self):
+        self.pool.close_all()
+
+    def connect(self):
+        connection = sqlite3.connect(":memory:", check_same_thread=False)
+        self.opened.append(connection)
+        return connection
+
+    def checkout_in_thread(self):
+        """
+        Check out a connection in another thread and keep it until the returned event is set
+        """
+        checked_out, release = threading.Event(), threading.Event()
+
+        def hold():
+            connection = self.pool.checkout()
+            checked_out.set()
+            release.wait(TIMEOUT)
+            self.pool.checkin(connection)
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        self.assertTrue(checked_out.wait(TIMEOUT))
+        self.addCleanup(thread.join, TIMEOUT)
+        self.addCleanup(release.set)
+        return release
+
+    def test_idle_connection_is_reused(self):
+        connection = self.pool.checkout()
+        self.pool.checkin(connection)
+
+        self.assertIs(self.pool.checkout(), connection)
+        self.assertEqual((len(self.opened), self.pool.size), (1, 1))
+
+    def test_checkout_waits_for_free_connection(self):
+        self.checkout_in_thread()
+        release = self.checkout_in_thread()
+        self.assertEqual(self.pool.size, 2)
+
+        with self.assertRaises(ConnectionError):
+            self.pool.checkout()
+
+        release.set()
+        self.assertIn(self.pool.checkout(), self.opened)
+        self.assertEqual(len(self.opened), 2)
+
+    def run_in_thread(self, target):
+        result = []
+        thread = threading.Thread(target=lambda: result.append(target()))
+        thread.start()
+        thread.join(TIMEOUT)
+        return result[0] if result else None
+
+    def test_nested_checkouts_share_connection(self):
+        connection = self.pool.checkout()
+        self.assertIs(self.pool.checkout(), connection)
+
+        self.pool.checkin(connection)
+        # still pinned to this thread after the inner checkin
+        self.assertIs(self.pool.checkout(), connection)
+        self.pool.checkin(connection)
+        self.assertIsNot(self.run_in_thread(self.pool.checkout), connection)
+
+        self.pool.checkin(connection)
+        self.assertIs(self.run_in_thread(self.pool.checkout), connection)
+
+    def test_checkin_from_other_thread_keeps_owner_connection(self):
+        connection = self.pool.checkout()
+        self.pool.checkout()
+
+        # e.g. a connector garbage collected in another thread returns one of the checkouts
+        self.run_in_thread(lambda: self.pool.checkin(connection))
+        self.assertIs(self.pool.checkout(), connection)
+        self.assertEqual(connection.execute("SELECT 1;").fetchone(), (1,))
+        self.assertEqual(self.pool.size, 1)
+
+        self.pool.checkin(connection)
+        self.pool.checkin(connection)
+        self.assertIs(self.run_in_thread(self.pool.checkout), connection)
+
+    def test_connection_of_finished_thread_is_returned(self):
+        connection = self.run_in_thread(self.pool.checkout)
+
+        self.pool.checkin(connection)
+        self.assertIs(self.pool.checkout(), connection)
+        self.assertEqual((len(self.opened), self.pool.size), (1, 1))
+        # unknown connection does not free a slot
+        self.pool.checkin(sqlite3.connect(":memory:"))
+        self.assertEqual(self.pool.size, 1)
+
+    def test_broken_idle_connection_is_replaced(self):
+        connection = self.pool.checkout()
+        self.pool.checkin(connection)
+        connection.close()
+
+        replaced = self.pool.checkout()
+        self.assertIsNot(replaced, connection)
+        self.assertEqual(self.pool.size, 1)
+
+    def test_closed_pool(self):
+        connection = self.pool.checkout()
+        self.pool.close_all()
+
+        # connection checked out at the moment is closed when returned
+        self.pool.checkin(connection)
+        self.assertEqual(self.pool.size, 0)
+        with self.assertRaises(sqlite3.ProgrammingError):
+            connection.execute("SELECT 1;")
+        with self.assertRaises(ConnectionError):
+            self.pool.checkout()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+"""
+Preprocessor execution plan: block operations give the same result as transformations applied one by one.
+Run with `python -m unittest discover tests`
+"""
+
+import unittest
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import SyntheticTennisData
+from utils.preprocess import Preprocessor, PreprocessTransformation
+from utils.preprocess import TOURNAMENTS_PREPROCESS, RESULTS_PREPROCESS, BETS_PREPROCESS
+
+PREPROCESS = TOURNAMENTS_PREPROCESS + RESULTS_PREPROCESS + BETS_PREPROCESS
+
+
+def calculate_sequentially(transformations, data):
+    for transformation in transformations:
+        data[transformation.output_col] = transformation.calculate(data)
+    return data
+
+
+class PreprocessPlanTest(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter("ignore")
+        self.addCleanup(warnings.resetwarnings)
+
+    def test_in_place_operations_are_grouped(self):
+        plan = Preprocessor(PREPROCESS).plan
+        blocks = {(step.operation, step.args): [t.output_col for t in step.transformations]
+                  for step in plan if step.operation is not None}
+
+        self.assertEqual(blocks[("fill_na_with_value", ("",))],
+                         ["Tournament", "Location", "Series", "Court", "Surface", "Round", "Comment"])
+        self.assertIn("B365W", blocks[("fill_na_and_negatives", (0, 0))])
+        self.assertLess(len(plan), len(PREPROCESS))
+
+    def test_dependent_transformations_keep_order(self):
+        plan = Preprocessor(PREPROCESS).plan
+        single = [(step.transformations[0].output_col, step.transformations[0].calculation_name)
+                  for step in plan if step.operation is None]
+
+        # names are filled before they are normalized
+        self.assertLess(single.index(("Winner", "fill_na_with_value")), single.index(("Winner", "normalize_name")))
+        self.assertIn(("Date", "to_date"), single)
+
+    def test_plan_matches_sequential_preprocessing(self):
+        raw = SyntheticTennisData(seed=3, dirty=0.1).year(2012, matches=500)
+
+        planned = Preprocessor(PREPROCESS).calculate(raw.copy())
+        sequential = calculate_sequentially(PREPROCESS, raw.copy())
+
+        pd.testing.assert_frame_equal(planned, sequential)
+
+    def test_block_fills_missing_negative_and_non_numeric_values(self):
+        data = pd.DataFrame({"A": [1.5, np.nan, -2.0], "B": ["3", "x", None], "C": [1, 2, 3]})
+        transformations = [PreprocessTransformation(col, col, "fill_na_and_negatives", 0, 0) for col in "ABC"]
+
+        result = Preprocessor(transformations).calculate(data)
+
+        self.assertEqual(result["A"].tolist(), [1.5, 0.0, 0.0])
+        self.assertEqual(result["B"].tolist(), [3.0, 0.0, 0.0])
+        self.assertEqual(result["C"].dtype, np.int64)
+
+    def test_missing_block_columns_are_added(self):
+        transformations = [PreprocessTransformation(col, col, "fill_na_with_value", "") for col in ("Court", "Surface")]
+        result = Preprocessor(transformations).calculate(pd.DataFrame({"Court": [None, "Indoor"]}))
+
+        self.assertEqual(result["Court"].tolist(), ["", "Indoor"])
+        self.assertIn("Surface", result.columns)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+"""
+Rendering and caching of parameterized statements and keyset pagination cursors.
+Run with `python -m unittest discover tests`
+"""
+
+import unittest
+
+import numpy as np
+
+from utils.db.query import QueryBuilder, encode_cursor, decode_cursor
+
+QUERY = "SELECT * FROM tournaments_matches t"
+KEYSET = ["ATP", "Year", "Winner", "Loser"]
+
+
+class QueryBuilderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.builder = QueryBuilder(numeric_columns=["ATP", "Year", "B365W"], date_columns=["Date"])
+
+    def test_equality_values_are_combined(self):
+        statement, params = self.builder.build(QUERY, and_filters={"Surface": ["Clay", "Grass"], "Year": "2012"})
+
+        self.assertEqual(statement, QUERY + " where 1=1 and t.Surface IN (?, ?) and t.Year IN (?);")
+        self.assertEqual(params, ["Clay", "Grass", 2012])
+
+    def test_comparison_and_range_operators(self):
+        statement, params = self.builder.build(QUERY, and_filters={"B365W": [">=1.5", "1.5..2.25"], "Date": "<2012-06-01"})
+
+        self.assertEqual(statement, QUERY + " where 1=1 and t.B365W >= ? and t.B365W BETWEEN ? AND ? and t.Date < ?;")
+        self.assertEqual(params, [1.5, 1.5, 2.25, "2012-06-01"])
+
+    def test_or_filters_and_like_search(self):
+        statement, params = self.builder.build(QUERY, search_value="100%", search_columns=["Tournament", "Location"],
+                                               or_filters={"Round": "The Final"})
+
+        self.assertEqual(statement, QUERY + " where 1=1 and ((t.Round IN (?)) or (t.Tournament LIKE ? ESCAPE '\\') or "
+                                            "(t.Location LIKE ? ESCAPE '\\'));")
+        self.assertEqual(params, ["The Final", "%100\\%%", "%100\\%%"])
+
+    def test_full_text_search(self):
+        self.builder.search_index = "tournaments_search"
+        statement, params = self.builder.build(QUERY, search_value="roland garros", search_keys=["rowid"])
+
+        self.assertIn("(t.rowid) IN (SELECT rowid FROM tournaments_search WHERE tournaments_search MATCH ?)", statement)
+        self.assertEqual(params, ['"roland"* "garros"*'])
+
+    def test_offset_pagination(self):
+        statement, params = self.builder.build(QUERY, sortby=["ATP", "Year"], sort_order="desc", rows=50, page=3)
+
+        self.assertEqual(statement, QUERY + " where 1=1 ORDER BY t.ATP desc, t.Year desc LIMIT 50 OFFSET ?;")
+        self.assertEqual(params, [100])
+
+    def test_invalid_requests(self):
+        with self.assertRaises(ValueError):
+            self.builder.build(QUERY, and_filters={"Year; DROP TABLE x": 1})
+        with self.assertRaises(ValueError):
+            self.builder.build(QUERY, and_filters={"B365W": "abc"})
+        with self.assertRaises(ValueError):
+            self.builder.build(QUERY, sort_order="sideways")
+
+    def test_statements_are_cached_by_shape(self):
+        first, first_params = self.builder.build(QUERY, and_filters={"Year": "2012"}, rows=10)
+        second, second_params = self.builder.build(QUERY, and_filters={"Year": "2013"}, rows=10, page=2)
+
+        self.assertIs(first, second)
+        self.assertEqual((first_params, second_params), ([2012, 0], [2013, 10]))
+        self.assertEqual(self.builder.cache_info().hits, 1)
+
+        self.builder.build(QUERY, and_filters={"Year": ["2012", "2013"]}, rows=10)
+        self.assertEqual(self.builder.cache_info().misses, 2)
+
+
+class KeysetCursorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.builder = QueryBuilder(numeric_columns=["ATP", "Year"])
+
+    def test_cursor_round_trip(self):
+        values = [np.int64(12), np.int64(2012), "Murray A.", "Dolgopolov O."]
+        token = encode_cursor(values)
+
+        self.assertNotIn("=", token)
+        self.assertEqual(decode_cursor(token), [12, 2012, "Murray A.", "Dolgopolov O."])
+
+    def test_missing_values_are_encoded_as_null(self):
+        self.assertEqual(decode_cursor(encode_cursor([12, 2012, np.nan, None])), [12, 2012, None, None])
+
+    def test_invalid_cursor(self):
+        for token in ("not base64!", encode_cursor([]) + "x", "eyJhIjogMX0"):
+            with self.assertRaises(ValueError):
+                decode_cursor(token)
+
+    def test_first_page_is_ordered_by_keyset(self):
+        statement, params = self.builder.build(QUERY, keyset=KEYSET, rows=100, sortby=["Tournament"])
+
+        self.assertEqual(statement, QUERY + " where 1=1 ORDER BY t.ATP asc, t.Year asc, t.Winner asc, t.Loser asc LIMIT 100;")
+        self.assertEqual(params, [])
+
+    def test_seek_after_last_row(self):
+        statement, params = self.builder.build(QUERY, keyset=KEYSET, rows=100, after=[12, 2012, "A", "B"])
+
+        self.assertIn("t.ATP >= ? and (t.ATP, t.Year, t.Winner, t.Loser) > (?, ?, ?, ?)", statement)
+        self.assertEqual(params, [12, 12, 2012, "A", "B"])
+
+    def test_seek_after_tournament_without_results(self):
+        # trailing missing keys are dropped, so the next page starts with the next tournament
+        statement, params = self.builder.build(QUERY, keyset=KEYSET, rows=100, sort_order="desc", after=[12, 2012, None, None])
+
+        self.assertIn("t.ATP <= ? and (t.ATP, t.Year) < (?, ?)", statement)
+        self.assertEqual(params, [12, 12, 2012])
+
+    def test_invalid_seek_keys(self):
+        with self.assertRaises(ValueError):
+            self.builder.build(QUERY, keyset=KEYSET, after=[None, 2012, "A", "B"])
+        with self.assertRaises(ValueError):
+            self.builder.build(QUERY, keyset=KEYSET, after=[12, 2012])
+
+
+if __name__ == "__main__":
+    unittest.main()
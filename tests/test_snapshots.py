@@ -0,0 +1,85 @@
+"""
+Corrections uploaded to database are kept by snapshots, their compaction and restore.
+Run with `python -m unittest discover tests`
+"""
+
+import sqlite3
+import unittest
+
+from utils.db.connector import DBConnector
+from utils.loader.upload import BulkUploader
+from utils.storage.parquet import ParquetBackend
+from utils.storage.snapshots import restore_database
+
+from tests.helpers import MATCH, TemporaryDatabase
+
+YEAR = MATCH["Year"]
+
+
+class SnapshotCorrectionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.database = TemporaryDatabase(snapshots=True)
+        self.db_connector = DBConnector()
+        self.store = ParquetBackend(base_dir=self.database.parquet_dir)
+
+    def tearDown(self):
+        self.db_connector.close()
+        self.database.cleanup()
+
+    def upload(self, *records):
+        return BulkUploader(self.db_connector).upload(enumerate(records))
+
+    def stored_odds(self):
+        with sqlite3.connect(self.database.path) as connection:
+            return connection.execute("SELECT B365W FROM tournaments_bets;").fetchall()
+
+    def assert_snapshot_odds(self, odds):
+        for table in ("bets", "matches"):
+            self.assertEqual(self.store.read_table(table, YEAR)["B365W"].tolist(), [odds], table)
+
+    def test_correction_replaces_snapshot_row(self):
+        self.upload(MATCH)
+        report = self.upload(dict(MATCH, B365W=1.8))
+
+        self.assertEqual(report["updated"]["bets"], 1)
+        self.assertEqual(self.stored_odds(), [(1.8,)])
+        self.assert_snapshot_odds(1.8)
+
+    def test_correction_survives_compaction(self):
+        self.upload(MATCH)
+        self.upload(dict(MATCH, B365W=1.8))
+        # saving another match of the year merges appended files into the year file
+        self.upload(dict(MATCH, ATP=99, Tournament="Other"))
+        frames = {table: self.store.read_table(table, YEAR) for table in ("tournaments", "results", "bets")}
+        self.store.save_frames({table: df[df["ATP"] == 99] for table, df in frames.items()})
+
+        bets = self.store.read_table("bets", YEAR).set_index("ATP")
+        self.assertEqual(bets.loc[MATCH["ATP"], "B365W"], 1.8)
+        self.assertEqual(len(self.store._partition_files("bets", YEAR)), 1)
+
+    def test_restore_keeps_correction(self):
+        self.upload(MATCH)
+        self.upload(dict(MATCH, B365W=1.8))
+        with sqlite3.connect(self.database.path) as connection:
+            connection.execute("UPDATE tournaments_bets SET B365W = 1.1;")
+
+        restore_database(self.db_connector, self.store)
+
+        self.assertEqual(self.stored_odds(), [(1.8,)])
+
+    def test_upload_refreshes_manifest_once(self):
+        calls = []
+        refresh = self.store.refresh
+        uploader = BulkUploader(self.db_connector, batch_size=1)
+        uploader.snapshots = self.store
+        self.store.refresh = lambda years: calls.append(sorted(years)) or refresh(years)
+
+        uploader.upload(enumerate([MATCH, dict(MATCH, ATP=99, Tournament="Other")]))
+
+        self.assertEqual(calls, [[YEAR]])
+        self.assertEqual(self.store.read_table("matches", YEAR)["ATP"].tolist(), [98, 99])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+Bulk upload endpoint: partial rejection, NDJSON streams and corrections of stored matches.
+Run with `python -m unittest discover tests`
+"""
+
+import os
+import json
+import unittest
+from unittest import mock
+
+import flask
+
+from config import config
+
+from tests.helpers import MATCH, TemporaryDatabase
+
+UPLOAD_URL = "/api/upload/data"
+
+
+class UploadTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.database = TemporaryDatabase()
+        cls.saved_log_path = config["logging"].get("log_path_api", raw=True)
+        config["logging"]["log_path_api"] = os.path.join(cls.database.tmp.name, "logs", "api_{date}.log")
+        # API module starts the server when imported
+        with mock.patch.object(flask.Flask, "run"):
+            import api
+        cls.client = api.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        config["logging"]["log_path_api"] = cls.saved_log_path
+        cls.database.cleanup()
+
+    def post(self, body, content_type="application/json"):
+        return self.client.post(UPLOAD_URL, data=body, content_type=content_type)
+
+    def test_valid_records_are_saved(self):
+        response = self.post(json.dumps([MATCH, dict(MATCH, ATP=99)]))
+        report = response.get_json()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((report["received"], report["rejected"], report["years"]), (2, [], [MATCH["Year"]]))
+        self.assertEqual(report["inserted"]["results"], 2)
+
+    def test_invalid_records_are_rejected_by_position(self):
+        records = [dict(MATCH, ATP=10), dict(MATCH, ATP="x"), dict(MATCH, ATP=11, B365W=100.0), "match", dict(MATCH, ATP=12)]
+        response = self.post(json.dumps(records))
+        report = response.get_json()
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([r["row"] for r in report["rejected"]], [1, 2, 3])
+        self.assertEqual(report["rejected"][0]["errors"], ["Field `ATP` is not an integer fitting INT"])
+        self.assertEqual(report["rejected"][2]["errors"], ["Record is not a JSON object"])
+        self.assertEqual(report["inserted"]["bets"], 2)
+
+    def test_ndjson_stream(self):
+        lines = [json.dumps(dict(MATCH, ATP=20)), "", "{broken", json.dumps(dict(MATCH, ATP=21))]
+        response = self.post("\n".join(lines), content_type="application/x-ndjson")
+        report = response.get_json()
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(report["received"], 3)
+        self.assertEqual(report["rejected"][0]["row"], 1)
+        self.assertTrue(report["rejected"][0]["errors"][0].startswith("Invalid JSON"))
+        self.assertEqual(report["inserted"]["tournaments"], 2)
+
+    def test_correction_updates_stored_match(self):
+        self.post(json.dumps(dict(MATCH, ATP=30)))
+        report = self.post(json.dumps(dict(MATCH, ATP=30, B365W=1.8))).get_json()
+
+        self.assertEqual(report["updated"], {"tournaments": 0, "results": 0, "bets": 1})
+        self.assertEqual(report["unchanged"]["results"], 1)
+
+    def test_invalid_body(self):
+        self.assertEqual(self.post(b"").status_code, 400)
+        self.assertEqual(self.post(b"{broken").status_code, 400)
+        self.assertEqual(self.post(b"42").status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
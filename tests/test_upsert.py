@@ -0,0 +1,173 @@
+"""
+Diff-based upsert by row hashes, interning of player names and rollups rebuilt from written years.
+Run with `python -m unittest discover tests`
+"""
+
+import sqlite3
+import unittest
+
+from utils.db.connector import DBConnector
+from utils.db.players import intern_names, intern_frames
+from utils.db.upsert import upsert_frames, row_hashes, HASH_COLUMN
+
+from tests.helpers import MATCH, TemporaryDatabase, match_frames
+
+YEAR = MATCH["Year"]
+OTHER_MATCH = dict(MATCH, ATP=99, Tournament="Other", Winner="Del Potro J.M.", Loser="Murray A.", B365W=2.0)
+
+
+class DatabaseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.database = TemporaryDatabase()
+        self.db_connector = DBConnector()
+
+    def tearDown(self):
+        self.db_connector.close()
+        self.database.cleanup()
+
+    def query(self, statement, params=()):
+        with sqlite3.connect(self.database.path) as connection:
+            return connection.execute(statement, params).fetchall()
+
+
+class UpsertTest(DatabaseTest):
+
+    def upsert(self, records, **kwargs):
+        return upsert_frames(self.db_connector, match_frames(records), years=[YEAR], **kwargs)
+
+    def test_hash_ignores_keys_and_hash_column(self):
+        frames = match_frames([MATCH, dict(MATCH, ATP=99)])
+        hashes = row_hashes(frames["bets"])
+
+        self.assertEqual(hashes[0], hashes[1])
+        frames["bets"][HASH_COLUMN] = 1
+        self.assertEqual(row_hashes(frames["bets"]).tolist(), hashes.tolist())
+
+    def test_new_rows_are_inserted(self):
+        report = self.upsert([MATCH, OTHER_MATCH])
+
+        for table in ("tournaments", "results", "bets"):
+            self.assertEqual(report[table], {"inserted": 2, "updated": 0, "deleted": 0, "unchanged": 0}, table)
+        self.assertEqual(self.query("SELECT COUNT(*) FROM tournaments_matches;"), [(2,)])
+
+    def test_repeated_rows_are_unchanged(self):
+        self.upsert([MATCH])
+        generation = self.query("SELECT Generation FROM data_generations WHERE Year = ?;", [YEAR])
+
+        report = self.upsert([MATCH])
+
+        self.assertEqual(report["bets"], {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 1})
+        # nothing was written, so cached responses of the year stay valid
+        self.assertEqual(self.query("SELECT Generation FROM data_generations WHERE Year = ?;", [YEAR]), generation)
+
+    def test_changed_rows_are_updated(self):
+        self.upsert([MATCH])
+        stored_hash = self.query("SELECT RowHash FROM tournaments_bets;")
+
+        report = self.upsert([dict(MATCH, B365W=1.8)])
+
+        self.assertEqual(report["bets"]["updated"], 1)
+        self.assertEqual(report["results"]["unchanged"], 1)
+        self.assertEqual(self.query("SELECT B365W FROM tournaments_bets;"), [(1.8,)])
+        self.assertNotEqual(self.query("SELECT RowHash FROM tournaments_bets;"), stored_hash)
+        self.assertEqual(self.query("SELECT B365W FROM tournaments_matches;"), [(1.8,)])
+
+    def test_vanished_rows_are_deleted_on_request(self):
+        self.upsert([MATCH, OTHER_MATCH])
+
+        report = self.upsert([MATCH])
+        self.assertEqual(report["results"]["deleted"], 0)
+        self.assertEqual(self.query("SELECT COUNT(*) FROM tournaments_results;"), [(2,)])
+
+        report = self.upsert([MATCH], delete_missing=True)
+        self.assertEqual(report["results"]["deleted"], 1)
+        self.assertEqual(report["tournaments"]["deleted"], 1)
+        self.assertEqual(self.query("SELECT ATP FROM tournaments_matches;"), [(MATCH["ATP"],)])
+
+    def test_other_years_are_not_compared(self):
+        self.upsert([dict(MATCH, Year=YEAR - 1, Date="2012-05-05")])
+
+        report = upsert_frames(self.db_connector, match_frames([MATCH]), years=[YEAR], delete_missing=True)
+
+        self.assertEqual(report["results"]["deleted"], 0)
+        self.assertEqual(self.query("SELECT Year FROM tournaments_results ORDER BY Year;"), [(YEAR - 1,), (YEAR,)])
+
+
+class PlayerInterningTest(DatabaseTest):
+
+    def test_spelling_variants_share_id(self):
+        cursor = self.db_connector.write_connection.cursor()
+        ids = intern_names(cursor, ["Del Potro J.M.", "del potro J. M", "Murray A."])
+        self.db_connector.write_connection.commit()
+
+        self.assertEqual(ids["Del Potro J.M."], ids["del potro J. M"])
+        self.assertNotEqual(ids["Del Potro J.M."], ids["Murray A."])
+        # ids are assigned in name order, the first spelling is stored
+        self.assertEqual(self.query("SELECT PlayerId, Name FROM players ORDER BY PlayerId;"),
+                         [(1, "Del Potro J.M."), (2, "Murray A.")])
+
+    def test_stored_players_are_reused(self):
+        cursor = self.db_connector.write_connection.cursor()
+        first = intern_names(cursor, ["Murray A."])
+        second = intern_names(cursor, ["Murray  A.", "Nadal R."])
+
+        self.assertEqual(second["Murray  A."], first["Murray A."])
+        self.assertEqual(self.query("SELECT COUNT(*) FROM players;"), [(0,)])
+        self.db_connector.write_connection.commit()
+        self.assertEqual(self.query("SELECT COUNT(*) FROM players;"), [(2,)])
+
+    def test_frames_are_keyed_by_player_ids(self):
+        frames = match_frames([MATCH, dict(MATCH, Winner="murray a")])
+        cursor = self.db_connector.write_connection.cursor()
+        interned = intern_frames(cursor, frames)
+
+        self.assertEqual(interned["tournaments"].index.names, frames["tournaments"].index.names)
+        self.assertIn("WinnerId", interned["results"].index.names)
+        self.assertNotIn("Winner", interned["results"].index.names)
+        # both records refer to the same players after interning
+        self.assertEqual(len(interned["results"]), 1)
+
+    def test_names_are_restored_in_match_table(self):
+        upsert_frames(self.db_connector, match_frames([MATCH]), years=[YEAR])
+        self.assertEqual(self.query("SELECT Winner, Loser FROM tournaments_matches;"), [("Murray A.", "Dolgopolov O.")])
+
+
+class RollupTest(DatabaseTest):
+
+    def setUp(self):
+        super().setUp()
+        upsert_frames(self.db_connector, match_frames([MATCH, OTHER_MATCH]), years=[YEAR])
+        self.db_connector.refresh_rollups([YEAR])
+
+    def test_player_stats(self):
+        stats = self.db_connector.get_player_stats(order_by="Player").set_index("Player")
+
+        self.assertEqual(stats.loc["Murray A.", ["Matches", "Wins", "Losses"]].tolist(), [2, 1, 1])
+        self.assertEqual(stats.loc["Murray A.", "WinRate"], 0.5)
+        self.assertEqual(stats.loc["Del Potro J.M.", "Wins"], 1)
+
+    def test_odds_stats_skip_missing_odds(self):
+        stats = self.db_connector.get_odds_stats().set_index("Bookmaker")
+
+        self.assertEqual(stats.loc["B365", "MeanWinnerOdds"], 1.75)
+        self.assertEqual(stats.loc["B365", "MaxWinnerOdds"], 2.0)
+        self.assertNotIn("PS", stats.index)
+
+    def test_refresh_after_correction(self):
+        upsert_frames(self.db_connector, match_frames([dict(OTHER_MATCH, B365W=3.0)]), years=[YEAR])
+        self.db_connector.refresh_rollups([YEAR])
+
+        stats = self.db_connector.get_odds_stats(and_filters={"Bookmaker": "B365"})
+        self.assertEqual(stats["MaxWinnerOdds"].tolist(), [3.0])
+
+    def test_filters_and_grouping(self):
+        stats = self.db_connector.get_player_stats(group_by=["Surface"], and_filters={"Player": "Murray A."})
+        self.assertEqual(stats[["Player", "Surface", "Matches"]].values.tolist(), [["Murray A.", "Clay", 2]])
+
+        with self.assertRaises(ValueError):
+            self.db_connector.get_player_stats(group_by=["Winner"])
+
+
+if __name__ == "__main__":
+    unittest.main()
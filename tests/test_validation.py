@@ -0,0 +1,116 @@
+"""
+Validation of input data against rules derived from database schema.
+Run with `python -m unittest discover tests`
+"""
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from utils.loader.parsers import get_raw_dtypes
+from utils.validation import ColumnRule, SchemaValidator, get_schema_validator
+
+from tests.helpers import MATCH
+
+RECORDS = [
+    MATCH,
+    dict(MATCH, Date="2013-05-05T00:00:00"),
+    dict(MATCH, Date="2013-05-05T10:30:00+02:00"),
+    dict(MATCH, Date=1367712000000),
+    dict(MATCH, Date="05/05/2013"),
+    dict(MATCH, Date="2013-13-01"),
+    dict(MATCH, ATP=None),
+    dict(MATCH, ATP="x"),
+    dict(MATCH, ATP=1.5),
+    dict(MATCH, WRank=" 7 "),
+    dict(MATCH, B365W="1.8"),
+    dict(MATCH, B365W=100.0),
+    dict(MATCH, B365W=float("nan")),
+    dict(MATCH, Comment="x" * 65),
+]
+
+
+class ColumnRuleTest(unittest.TestCase):
+
+    def test_integer_range_and_fraction(self):
+        rule = ColumnRule("WRank", "SMALLINT")
+        (invalid, message), = rule.check(pd.Series([1, 2**15, 1.5, np.nan]))
+
+        self.assertEqual(invalid.tolist(), [False, True, True, False])
+        self.assertEqual(message, "is not an integer fitting SMALLINT")
+
+    def test_decimal_precision(self):
+        rule = ColumnRule("B365W", "DECIMAL", size=4, scale=2)
+        (invalid, _), = rule.check(pd.Series(["1.5", "99.99", "100", "x", None], dtype=object))
+
+        self.assertEqual(invalid.tolist(), [False, False, True, True, False])
+
+    def test_dates_in_preprocessor_formats(self):
+        rule = ColumnRule("Date", "DATETIME")
+        values = pd.Series(["2012-04-02", "2012-04-02T00:00:00", 1333324800000, "02/04/2012", None], dtype=object)
+        (invalid, message), = rule.check(values)
+
+        self.assertEqual(invalid.tolist(), [False, False, False, True, False])
+        self.assertEqual(message, "is not a date")
+
+    def test_required_value(self):
+        rule = ColumnRule("ATP", "INT", required=True)
+        checks = dict((message, invalid.tolist()) for invalid, message in rule.check(pd.Series([1, None], dtype=object)))
+
+        self.assertEqual(checks["is missing"], [False, True])
+        self.assertEqual(rule.check_value(None), "is missing")
+
+
+class SchemaValidatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.validator = get_schema_validator()
+
+    def test_mask_and_error_counts(self):
+        data = pd.DataFrame.from_records(RECORDS)
+        result = self.validator.validate(data)
+
+        self.assertEqual(result.mask().tolist(), [True] * 4 + [False] * 5 + [True, True, False, True, False])
+        self.assertEqual(result.error_counts, {"Date": 2, "ATP": 3, "B365W": 1, "Comment": 1})
+        self.assertEqual(result.mask(columns=["ATP"]).sum(), len(RECORDS) - 3)
+        self.assertEqual(result.row_errors()[6], ["Field `ATP` is missing"])
+
+    def test_missing_required_column(self):
+        result = self.validator.validate(pd.DataFrame({"Year": [2013]}))
+        self.assertEqual(result.error_counts, {"ATP": 1})
+
+    def test_records_agree_with_frame(self):
+        data = pd.DataFrame.from_records(RECORDS)
+        row_errors = self.validator.validate(data).row_errors()
+
+        for i, record in enumerate(RECORDS):
+            self.assertEqual(sorted(self.validator.validate_record(record)), sorted(row_errors.get(i, [])), record)
+
+    def test_records_agree_with_typed_columns(self):
+        # columns of a DataFrame built from valid records are numeric, so the vectorized checks are used
+        data = pd.DataFrame.from_records([dict(MATCH, WRank=2**31), dict(MATCH, B365W=100.0)])
+        self.assertNotEqual(data["WRank"].dtype, object)
+        row_errors = self.validator.validate(data).row_errors()
+
+        self.assertEqual(row_errors[0], self.validator.validate_record(dict(MATCH, WRank=2**31)))
+        self.assertEqual(row_errors[1], self.validator.validate_record(dict(MATCH, B365W=100.0)))
+
+    def test_player_names_are_validated_as_players_table_names(self):
+        rules = {rule.name: rule for rule in self.validator.rules}
+
+        for column in ("Winner", "Loser"):
+            self.assertEqual((rules[column].sql_type, rules[column].size), ("NVARCHAR", 255))
+            self.assertEqual(get_raw_dtypes()[column], "str")
+        # surrogate player ids and row hashes are set on write, they are not part of source data
+        self.assertFalse({"WinnerId", "LoserId", "RowHash"} & set(rules))
+        self.assertEqual(self.validator.validate_record(dict(MATCH, Loser="x" * 256)),
+                         ["Field `Loser` is longer than 255 characters"])
+
+    def test_source_column_names(self):
+        validator = SchemaValidator([ColumnRule("BestOf", "SMALLINT")])
+        self.assertEqual(validator.validate_record({"Best of": "x"}), ["Field `Best of` is not an integer fitting SMALLINT"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+"""
+Weather client cache and request coalescing against the local weather simulator.
+Run with `python -m unittest discover tests`
+"""
+
+import time
+import socket
+import asyncio
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from utils.live.simulators import create_weather_simulator, start_app
+from utils.live.weather import WeatherClient
+
+HOST = "127.0.0.1"
+CALLERS = 16
+TTL = 0.5
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+class WeatherClientTest(unittest.TestCase):
+
+    def setUp(self):
+        # simulator runs in its own event loop thread, responses are delayed so concurrent calls overlap
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        port = free_port()
+        app = create_weather_simulator(seed=0, latency=0.3)
+        self.runner = asyncio.run_coroutine_threadsafe(start_app(app, HOST, port), self.loop).result(10)
+        self.base_url = "http://{}:{}".format(HOST, port)
+        self.client = WeatherClient(url=self.base_url + "/weather", ttl=TTL, precision=2, timeout=5, retries=0,
+                                    pool_size=CALLERS)
+
+    def tearDown(self):
+        self.client.close()
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result(10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(10)
+        self.loop.close()
+
+    def upstream_requests(self):
+        return requests.get(self.base_url + "/stats", timeout=5).json()["requests"]
+
+    def concurrent_gets(self):
+        barrier = threading.Barrier(CALLERS)
+
+        def get(i):
+            barrier.wait()
+            # coordinates differ below cache precision, so all callers share one key
+            return self.client.get(51.431 + i * 2e-4, -0.211 - i * 2e-4)
+
+        with ThreadPoolExecutor(max_workers=CALLERS) as executor:
+            return list(executor.map(get, range(CALLERS)))
+
+    def test_concurrent_gets_make_one_request(self):
+        readings = self.concurrent_gets()
+
+        self.assertEqual(self.upstream_requests(), 1)
+        self.assertEqual(self.client.requests, 1)
+        self.assertEqual(self.client.coalesced + self.client.hits, CALLERS - 1)
+        self.assertGreater(self.client.coalesced, 0)
+        self.assertTrue(all(reading == readings[0] for reading in readings))
+
+    def test_cache_hit_within_ttl(self):
+        reading = self.client.get(51.434, -0.214)
+        hits = self.client.hits
+
+        self.assertEqual(self.client.get(51.4341, -0.2139), reading)
+        self.assertEqual(self.client.hits, hits + 1)
+        self.assertEqual(self.upstream_requests(), 1)
+
+    def test_refetch_after_ttl(self):
+        self.client.get(51.434, -0.214)
+        time.sleep(TTL + 0.1)
+
+        self.client.get(51.434, -0.214)
+        self.assertEqual(self.upstream_requests(), 2)
+        self.assertEqual(self.client.requests, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
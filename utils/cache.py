@@ -0,0 +1,155 @@
+"""
+In-process response cache for read endpoints.
+Cached responses are keyed by normalized request and data generation of the requested year. Every write bumps the
+generation of affected years, so responses computed before the write are never served again and are evicted by LRU and
+TTL limits. Writes of other processes are noticed within `check_interval` seconds
+"""
+
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from utils.db.generations import EPOCH_YEAR
+
+
+class DataGenerations:
+    """
+    Implements per-year data generation tokens. Writes of this process bump in-process counters, so requests are
+    answered without touching the database. Generations stored in database (see `utils.db.generations`) are read at most
+    once per `check_interval` seconds, so writes of other processes (e.g. `restore.py`) invalidate responses too and
+    tokens survive restarts
+    """
+    def __init__(self, connector_factory, check_interval=5):
+        """
+        :param connector_factory:   function returning DBConnector object usable as context manager
+        :param check_interval:      seconds after which generations stored in database are read again
+        """
+        self.connector_factory = connector_factory
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._local = 0
+        self._years = {}
+        self._stored = {}
+        self._checked = None
+
+    def bump(self, years=None):
+        """
+        Mark data written by this process as changed
+        :param years:               iterable of changed years, all years are marked if None
+        """
+        with self._lock:
+            if years is None:
+                self._local += 1
+                return
+            for year in years:
+                year = int(year)
+                self._years[year] = self._years.get(year, 0) + 1
+
+    def _stored_generations(self):
+        """
+        Get generations stored in database, cached for `check_interval` seconds
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._checked is not None and now - self._checked < self.check_interval:
+                return self._stored
+        with self.connector_factory() as db_connector:
+            stored = db_connector.get_data_generations()
+        with self._lock:
+            self._stored, self._checked = stored, now
+        return stored
+
+    def get(self, year=None):
+        """
+        Get generation token of the year
+        :param year:                year, token changed by a write to any year is returned if None
+        :return:                    string token
+        """
+        if year is None:
+            return self.get_all()
+        stored = self._stored_generations()
+        year = int(year)
+        with self._lock:
+            return "{}.{}.{}.{}".format(stored.get(EPOCH_YEAR, 0), stored.get(year, 0), self._local, self._years.get(year, 0))
+
+    def get_all(self):
+        """
+        Get generation token changed by a write to any year, used by requests spanning multiple years
+        :return:                    string token
+        """
+        stored = self._stored_generations()
+        with self._lock:
+            return "{}.{}.{}.{}".format(stored.get(EPOCH_YEAR, 0), sum(g for y, g in stored.items() if y != EPOCH_YEAR),
+                                        self._local, sum(self._years.values()))
+
+
+def make_etag(path, args, generation):
+    """
+    Build ETag of a read request
+    :param path:                    request path
+    :param args:                    request arguments as an iterable of (key, value) pairs
+    :param generation:              data generation token
+    :return:                        ETag value without quotes
+    """
+    normalized = "{}?{}#{}".format(path, "&".join("{}={}".format(k, v) for k, v in sorted(args)), generation)
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU cache of response bodies with entry count, total size and TTL limits
+    """
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=300):
+        """
+        :param max_entries:         maximum number of cached responses
+        :param max_bytes:           maximum total size of cached bodies
+        :param ttl:                 seconds after which cached response expires
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Get cached response
+        :return:                    tuple (body, mimetype) or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            body, mimetype, expires = entry
+            if expires < time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return body, mimetype
+
+    def set(self, key, body, mimetype):
+        """
+        Cache response body. Bodies larger than the whole cache are not stored
+        :param body:                response body bytes
+        :param mimetype:            response mimetype
+        """
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (body, mimetype, time.time() + self.ttl)
+            self._size += len(body)
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _remove(self, key):
+        body, _, _ = self._entries.pop(key)
+        self._size -= len(body)
@@ -8,7 +8,9 @@ http://www.ch-werner.de/sqliteodbc/
 import time
 import json
 import os
+import atexit
 import logging
+import threading
 import numpy as np
 import pandas as pd
 import pyodbc
@@ -16,95 +18,270 @@ import pyodbc
 import config as c
 from config import config
 
-from utils.helpers import validate_data_for_sql_query
+from utils.db.pool import ConnectionPool
+from utils.db.query import QueryBuilder, encode_cursor, decode_cursor
+from utils.db.schema import load_db_schema, get_column_types, get_numeric_columns, get_date_columns
+from utils.db.frames import frame_from_cursor
+from utils.db.search import SEARCH_TABLE, create_search_index, drop_search_index, search_index_exists
+from utils.db.indexes import reconcile_indexes
+from utils.db.matches import MATCHES_TABLE, create_matches_table
+from utils.db.generations import create_generations_table, bump_generations, get_generations
+from utils.db.native import connect_native, iter_rows
+from utils.db.players import PLAYERS_TABLE, db_keys, intern_frames, named_rows, migrate_player_keys
+from utils.db import rollups
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+_BOOTSTRAPPED = False
+_BOOTSTRAP_LOCK = threading.Lock()
+
+# statement cache is shared by all connectors of the process
+QUERY_BUILDER = QueryBuilder(
+    numeric_columns=get_numeric_columns(),
+    date_columns=get_date_columns(),
+    cache_size=config["db"].getint("query_cache_size", 256)
+)
+
+
+def connect(user=None, password=None):
+    """
+    Open a new database connection configured for the application
+    :param user:            database user name
+    :param password:        database user password
+    :return:                pyodbc connection object
+    """
+    connection_str = "SERVER={server};DATABASE={database};Trusted_connection=yes".format(**config["db"])
+    if "driver" in config["db"]:
+        connection_str += ";DRIVER={driver}".format(**config["db"])
+    if "port" in config["db"]:
+        connection_str += ";PORT={port}".format(**config["db"])
+    if user and password:
+        connection_str += ";UID={user};PWD={password}".format(user=user, password=password)
+
+    connection = pyodbc.connect(connection_str)
+    connection.setdecoding(pyodbc.SQL_CHAR, encoding='utf-8')
+    connection.setdecoding(pyodbc.SQL_WCHAR, encoding='utf-8')
+    connection.setencoding(encoding='utf-8')
+    # self.connection.setdecoding(pyodbc.SQL_WMETADATA, encoding='utf-32le')
+
+    try:
+        # connection-level settings are applied once per physical connection
+        cursor = connection.cursor()
+        cursor.execute("PRAGMA foreign_keys = ON;")
+        cursor.commit()
+        # cursor.execute("PRAGMA encoding = 'UTF-8';")
+        # cursor.commit()
+        cursor.close()
+        logging.info("Connection to database established")
+    except Exception:
+        raise ConnectionError("Exception during connecting to DB")
+
+    return connection
+
+
+def get_pool(user=None, password=None):
+    """
+    Get process-wide connection pool, create it on the first call
+    :param user:            database user name
+    :param password:        database user password
+    :return:                ConnectionPool object
+    """
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ConnectionPool(
+                connect_func=lambda: connect(user=user, password=password),
+                max_size=config["db"].getint("pool_size", 8),
+                timeout=config["db"].getfloat("pool_timeout", 30)
+            )
+            # pooled connections are closed on interpreter shutdown instead of being left to garbage collection
+            atexit.register(close_pool)
+    return _POOL
+
+
+def close_pool():
+    """
+    Close process-wide connection pool, a new pool is created by the next `get_pool` call
+    """
+    global _POOL
+    with _POOL_LOCK:
+        pool, _POOL = _POOL, None
+    if pool is not None:
+        pool.close_all()
+        logging.info("Database connection pool was closed")
+
+
+def initialize_database(user=None, password=None):
+    """
+    Create database structure once per process. Subsequent calls are no-op
+    :param user:            database user name
+    :param password:        database user password
+    """
+    global _BOOTSTRAPPED
+    if _BOOTSTRAPPED:
+        return
+    with _BOOTSTRAP_LOCK:
+        if _BOOTSTRAPPED:
+            return
+        with DBConnector(user=user, password=password, create_tables=False) as db_connector:
+            db_connector._create_db_structure()
+            if config["db"].getboolean("full_text_search", True) and search_index_exists(db_connector):
+                QUERY_BUILDER.search_index = SEARCH_TABLE
+        _BOOTSTRAPPED = True
+
 
 class DBConnector:
     def __init__(self, user=None, password=None, create_tables=True):
         self.user = user
         self.password = password
-        self.connection = None
+        self._connection = None
+        self._pool = None
+        self._write_connection = None
+        # `sqlite3` writes through native connection, `odbc` through pooled ODBC connection
+        self.write_engine = config["db"].get("write_engine", "odbc")
         self.tables = {
-            "tournaments": "tournaments_common", "results": "tournaments_results", "bets": "tournaments_bets"
+            "tournaments": "tournaments_common", "results": "tournaments_results", "bets": "tournaments_bets",
+            "matches": MATCHES_TABLE, "players": PLAYERS_TABLE
         }
-        self._establish_connection()
-        
         if create_tables:
-            self._create_db_structure()
-            
-    def _establish_connection(self):
+            initialize_database(user=user, password=password)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    @property
+    def connection(self):
         """
-        Create connection to DB if already not exists
+        Connection is checked out from the pool on first use and kept until the connector is closed
         """
-        if self.connection:
-            self.connection.close()
+        self._establish_connection()
+        return self._connection
 
-        connection_str = "SERVER={server};DATABASE={database};Trusted_connection=yes".format(**config["db"])
-        if "driver" in config["db"]:
-            connection_str += ";DRIVER={driver}".format(**config["db"])
-        if "port" in config["db"]:
-            connection_str += ";PORT={port}".format(**config["db"])
-        if self.user and self.password:
-            connection_str += ";UID={user};PWD={password}".format(user=self.user, password=self.password)
+    @property
+    def write_connection(self):
+        """
+        Connection used for bulk writes: native sqlite3 connection opened on first use if `write_engine` is `sqlite3`,
+        pooled connection otherwise
+        """
+        if self.write_engine != "sqlite3":
+            return self.connection
+        if self._write_connection is None:
+            self._write_connection = connect_native()
+        return self._write_connection
 
-        self.connection = pyodbc.connect(connection_str)
-        self.connection.setdecoding(pyodbc.SQL_CHAR, encoding='utf-8')
-        self.connection.setdecoding(pyodbc.SQL_WCHAR, encoding='utf-8')
-        self.connection.setencoding(encoding='utf-8')
-        # self.connection.setdecoding(pyodbc.SQL_WMETADATA, encoding='utf-32le')
+    def row_values(self, df):
+        """
+        Rows of DataFrame as accepted by `executemany` of the write connection.
+        Native connection consumes rows lazily, ODBC connection requires a list
+        """
+        rows = iter_rows(df)
+        return rows if self.write_engine == "sqlite3" else list(rows)
 
-        self._check_connection()
+    def _establish_connection(self):
+        """
+        Check out connection from the process-wide pool if already not checked out
+        """
+        if self._connection:
+            return
+        # connection is returned to the pool it was taken from, even if the process-wide pool was closed meanwhile
+        self._pool = get_pool(user=self.user, password=self.password)
+        self._connection = self._pool.checkout()
 
-    def _check_connection(self):
+    def close(self):
         """
-        Check connection to DB. Raise exception if not exists
+        Return connection to the pool
         """
-        try:
-            cursor = self.connection.cursor()
-            cursor.execute("PRAGMA foreign_keys = ON;")
-            cursor.commit()
-            # cursor.execute("PRAGMA encoding = 'UTF-8';")
-            # cursor.commit()
-            cursor.close()
-            logging.info("Connection to database established")
-        except Exception:
-            raise ConnectionError("Exception during connecting to DB")
+        if self._write_connection is not None:
+            write_connection, self._write_connection = self._write_connection, None
+            write_connection.close()
+        if self._connection:
+            connection, self._connection = self._connection, None
+            self._pool.checkin(connection)
 
-    def _execute_single_query(self, query):
+    def _execute_single_query(self, query, params=None):
         cursor = self.connection.cursor()
-        cursor.execute(query)
+        if params:
+            cursor.execute(query, params)
+        else:
+            cursor.execute(query)
         cursor.commit()
         cursor.close()
 
     def _execute_many_query(self, df, table, fast_executemany=True):
         """
-        Save many row to table
+        Save many row to table in one transaction
         :param df: df with all fields to save
         :param table: tablename to save into
         :param fast_executemany: status if fast_executemany is needed
         :return:
         """
-        # convert nans to None
-        df = df.where(pd.notnull(df), None)
-        columns = df.columns.tolist()
-        values = df.values.tolist()
-        query = "INSERT OR IGNORE INTO {} ({}) VALUES ({});".format(table, ", ".join(columns), ", ".join("?" * len(columns)))
-        logging.info(columns)
-        logging.info(values[0])
+        query = self._insert_statement(df.columns.tolist(), table)
         logging.info(query)
+        connection = self.write_connection
         try:
-            cursor = self.connection.cursor()
+            cursor = connection.cursor()
             #cursor.fast_executemany = fast_executemany
             t1 = time.time()
-            cursor.executemany(query, values)
-            cursor.commit()
+            cursor.executemany(query, self.row_values(df))
+            bump_generations(cursor, df["Year"].unique().tolist())
+            connection.commit()
             cursor.close()
+            elapsed = time.time() - t1
             logging.info(
-                "{} rows were saved to table {}. \nExecution took {} seconds".format(
-                    df.shape[0], table, time.time() - t1))
+                "{} rows were saved to table {}. \nExecution took {:.3f} seconds ({:.0f} rows/s)".format(
+                    df.shape[0], table, elapsed, df.shape[0] / max(elapsed, 1e-9)))
         except Exception as e:
+            connection.rollback()
             logging.error("Exception during saving data to {} table. Error message: {}".format(table, e))
             raise Exception("Exception during saving data to {} table".format(table))
 
+    @staticmethod
+    def _insert_statement(columns, table):
+        """
+        Build insert statement for columns
+        """
+        return "INSERT OR IGNORE INTO {} ({}) VALUES ({});".format(table, ", ".join(columns), ", ".join("?" * len(columns)))
+
+    def save_batch(self, frames):
+        """
+        Save data to multiple tables in a single transaction
+        :param frames: dictionary {table key as in `self.tables`: DataFrame indexed by primary key}
+        """
+        connection = self.write_connection
+        cursor = connection.cursor()
+        try:
+            t1 = time.time()
+            years = set()
+            frames = intern_frames(cursor, frames)
+            for table, df in frames.items():
+                if df.empty:
+                    continue
+                df = df.reset_index()
+                cursor.executemany(self._insert_statement(df.columns.tolist(), self.tables[table]), self.row_values(df))
+                years.update(df["Year"].unique().tolist())
+            bump_generations(cursor, years)
+            connection.commit()
+            nrows = sum(df.shape[0] for df in frames.values())
+            elapsed = time.time() - t1
+            logging.info("Batch of {} rows was saved in {:.3f} seconds ({:.0f} rows/s)".format(
+                nrows, elapsed, nrows / max(elapsed, 1e-9)))
+        except Exception as e:
+            connection.rollback()
+            logging.error("Exception during saving batch. Error message: {}".format(e))
+            raise
+        finally:
+            cursor.close()
+
     def _create_table(self, table_name, fields):
         if not table_name:
             return False
@@ -112,43 +289,118 @@ class DBConnector:
         table_structure = table_structure.format(**self.tables)
         query = "CREATE TABLE IF NOT EXISTS {0}\n({1});".format(table_name, table_structure, **self.tables)
         self._execute_single_query(query)
-        cursor = self.connection.cursor()
-        if cursor.tables(table=table_name, tableType='TABLE').fetchone():
+        if self.table_exists(table_name):
             logging.info("DB initialisation: Table {} exists in DataBase".format(table_name))
         else:
             logging.error("DB initialisation: Table {} was not created".format(table_name))
             raise Exception("Not all tables were created")
-        cursor.close()
+        self._add_missing_columns(table_name, fields)
         return True
 
+    def _add_missing_columns(self, table_name, fields):
+        """
+        Add columns declared in schema file but missing in already existing table
+        """
+        cursor = self.connection.cursor()
+        cursor.execute("PRAGMA table_info({});".format(table_name))
+        existing = set(row[1] for row in cursor.fetchall())
+        cursor.close()
+        for field in fields:
+            name = field.split()[0]
+            if name.upper() in ("PRIMARY", "FOREIGN", "UNIQUE", "CHECK", "CONSTRAINT") or name in existing:
+                continue
+            self._execute_single_query("ALTER TABLE {} ADD COLUMN {};".format(table_name, field))
+            logging.info("DB initialisation: column {} was added to table {}".format(name, table_name))
+
     def _create_db_structure(self):
         """
-        Create all tables based on schema file
-        :param ebooks_schema: specified key of schema for ebooks static data as it's different for modeling and
-        inference flow
+        Create all tables based on schema file. Skipped if schema version stored in database is up to date.
+        Declared indexes are checked and reconciled on every call
         """
         schema_file = config["db"]["db_schema"]
         logging.info("DB schema: {schema}".format(schema=schema_file))
 
-        if not os.path.exists(schema_file):
-            raise Exception("DB initialisation: No db_schema specified")
-        with open(schema_file, "r") as f:
-            structure = json.load(f)
+        structure = load_db_schema(schema_file)
+
+        schema_version = int(structure.get("version", 0))
+        stored_version = self.get_schema_version()
+        if stored_version >= schema_version:
+            if stored_version > schema_version:
+                logging.warning("DB initialisation: stored schema version {} is newer than schema file version {}".format(
+                    stored_version, schema_version))
+            logging.info("DB initialisation: schema version {} is up to date".format(stored_version))
+        else:
+            self._create_table(self.tables.get("tournaments"), structure["tournaments_common"])
+            self._create_table(self.tables.get("players"), structure["players"])
+            if self.table_exists(self.tables["results"]):
+                migrate_player_keys(self, structure, dependent_tables=[MATCHES_TABLE, SEARCH_TABLE])
+            self._create_table(self.tables.get("results"), structure["tournaments_results"])
+            self._create_table(self.tables.get("bets"), structure["tournaments_bets"])
+            logging.info("DB initialisation: all tables were created")
+
+            # search index is built from match table, so it is rebuilt after the table is refilled
+            drop_search_index(self)
+            create_matches_table(self, structure["tournaments_matches"])
+            create_generations_table(self)
+            rollups.create_rollup_tables(self, structure)
+
+            if config["db"].getboolean("full_text_search", True):
+                create_search_index(self)
+
+            self.set_schema_version(schema_version)
+            logging.info("DB initialisation: schema upgraded from version {} to {}".format(stored_version, schema_version))
+
+        # index check is a cheap catalog lookup, so declared indexes are verified on every startup
+        reconcile_indexes(self, structure.get("indexes", []), apply_changes=config["db"].getboolean("reconcile_indexes", True))
 
-        self._create_table(self.tables.get("tournaments"), structure["tournaments_common"])
-        self._create_table(self.tables.get("results"), structure["tournaments_results"])
-        self._create_table(self.tables.get("bets"), structure["tournaments_bets"])
-        logging.info("DB initialisation: all tables were created")
+    def table_exists(self, table_name):
+        """
+        Check if table exists in database
+        """
+        cursor = self.connection.cursor()
+        exists = cursor.tables(table=table_name, tableType='TABLE').fetchone() is not None
+        cursor.close()
+        return exists
+
+    def get_schema_version(self):
+        """
+        Get schema version stored in database
+        """
+        cursor = self.connection.cursor()
+        cursor.execute("PRAGMA user_version;")
+        version = cursor.fetchone()[0]
+        cursor.close()
+        return int(version)
+
+    def set_schema_version(self, version):
+        """
+        Store schema version in database
+        :param version:     integer schema version
+        """
+        self._execute_single_query("PRAGMA user_version = {:d};".format(int(version)))
 
     def save_data(self, df, table, batch_size=2000):
-        if not df.empty:
-            for g, data in df.reset_index().groupby(np.arange(len(df)) // batch_size):
-                logging.info("Save data for batch: {}/{}".format(g, len(df) // batch_size))
-                self._execute_many_query(data, self.tables[table])
-        else:
+        if df.empty:
             logging.info("No data were found for saving to {}".format(self.tables[table]))
+            return
+        # players are committed before rows referencing them, as ODBC engine commits every batch
+        connection = self.write_connection
+        cursor = connection.cursor()
+        try:
+            df = intern_frames(cursor, {table: df})[table]
+            connection.commit()
+        finally:
+            cursor.close()
+        if self.write_engine == "sqlite3":
+            # native engine streams all rows in a single transaction
+            self._execute_many_query(df.reset_index(), self.tables[table])
+        else:
+            df = df.reset_index()
+            for start in range(0, len(df), batch_size):
+                logging.info("Save data for batch: {}/{}".format(start // batch_size, len(df) // batch_size))
+                self._execute_many_query(df.iloc[start:start + batch_size], self.tables[table])
 
-    def get_db_data(self, columns=c.VALID_FILTER_FIELDS+["Year"], rows=c.NROWS_PER_PAGE, page=1, sortby=["ATP", "Year"], sort_order='asc', search=None, **filters):
+    def get_db_data(self, columns=c.VALID_FILTER_FIELDS+["Year"], rows=c.NROWS_PER_PAGE, page=1, sortby=["ATP", "Year"], sort_order='asc', search=None, cursor=None, **filters):
         """
         Get data from database
         :param columns:     an iterable of column names to retrieve from db, default is None
@@ -157,25 +409,91 @@ class DBConnector:
         :param sortby:      columns to be sorted by
         :param sort_order:  sorting order
         :param search:      phrase for global search
+        :param cursor:      pagination token returned by `get_next_cursor`, empty string for the first page.
+                            If provided, seek pagination over `KEYSET_COLUMNS` is used instead of `page` and `sortby`
         :param filters:     filters for data visualization
         """
+        query_paginated, params = self._build_data_query(
+            columns=columns, rows=rows, page=page, sortby=sortby, sort_order=sort_order, search=search, cursor=cursor, **filters
+        )
+
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(query_paginated, params)
+            data = frame_from_cursor(cursor, get_column_types())
+        finally:
+            cursor.close()
+        return data
+
+    def iter_db_data(self, columns=c.VALID_FILTER_FIELDS+["Year"], rows=None, page=1, sortby=["ATP", "Year"], sort_order='asc', search=None, chunk_size=5000, **filters):
+        """
+        Iterate over data from database in chunks without loading the whole result in memory.
+        Parameters are the same as for `get_db_data`
+        :param chunk_size:  number of rows fetched from database cursor at once
+        :return:            generator of (column names, list of row tuples), a single chunk without rows if result
+                            is empty
+        """
+        query_paginated, params = self._build_data_query(
+            columns=columns, rows=rows, page=page, sortby=sortby, sort_order=sort_order, search=search, **filters
+        )
+        # query is built eagerly so that invalid filters are reported before iteration starts
+        return self._iter_query(query_paginated, params, chunk_size)
+
+    def _iter_query(self, query, params, chunk_size):
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(query, params)
+            names = [d[0] for d in cursor.description]
+            empty = True
+            while True:
+                chunk = cursor.fetchmany(chunk_size)
+                if not chunk:
+                    break
+                empty = False
+                yield names, chunk
+            # empty result still carries column names, e.g. for CSV header
+            if empty:
+                yield names, []
+        finally:
+            cursor.close()
+
+    def _build_data_query(self, columns, rows, page, sortby, sort_order, search, cursor=None, **filters):
+        """
+        Build data query with filters, search and pagination
+        :return:            tuple (query, list of parameters)
+        """
+        keyset = None
+        after = None
+        if cursor is not None:
+            keyset = c.KEYSET_COLUMNS
+            after = decode_cursor(cursor) if cursor else None
+            if columns is not None:
+                columns = list(columns) + [k for k in keyset if k not in columns]
+
+        # denormalized match table is maintained on write, so no join is needed on read
         columns = "*" if columns is None else ", ".join(columns)
         query = """
-            SELECT {cols} FROM
-            (SELECT * FROM {tournaments}
-            LEFT JOIN {results}
-            ON {tournaments}.ATP = {results}.ATP AND {tournaments}.Year = {results}.Year
-            LEFT JOIN {bets}
-            ON {results}.ATP = {bets}.ATP AND {results}.Year = {bets}.Year AND {results}.Winner = {bets}.Winner AND {results}.Loser = {bets}.Loser) as t
+            SELECT {cols} FROM {matches} as t
         """.format(cols=columns, **self.tables)
-        
-        query_with_filters = self.add_multiple_filters_to_query(query=query, table="t", search_value=search, **filters)
-        query_with_filters_paginated = self.add_pagination_to_query("t", query_with_filters, sortby, rows, page, sort_order)
 
-        data = pd.read_sql(query_with_filters_paginated, self.connection, coerce_float=True)
-        data = data.T.groupby(level=0).first().T
-        return data
-    
+        return QUERY_BUILDER.build(
+            query, table="t", search_value=search, sortby=sortby, sort_order=sort_order, rows=rows, page=page,
+            keyset=keyset, after=after, search_keys=["rowid"], **filters
+        )
+
+    @staticmethod
+    def get_next_cursor(data, rows=c.NROWS_PER_PAGE):
+        """
+        Get pagination token for the page following `data`
+        :param data:        page returned by `get_db_data` in cursor mode
+        :param rows:        number of rows per page
+        :return:            token string or None if `data` is the last page
+        """
+        if rows is None or len(data) < rows:
+            return None
+        last_row = data.iloc[-1][c.KEYSET_COLUMNS]
+        return encode_cursor([None if pd.isna(v) else v for v in last_row.tolist()])
+
     def delete_db_data(self, table, search=None, **filters):
         """
         Delete data from table
@@ -184,80 +502,82 @@ class DBConnector:
         :param filters:     filters for data visualization
         """
         table_name = self.tables[table]
-        query = """
-            DELETE FROM {}
-        """.format(table_name)
-        
-        query_with_filters = self.add_multiple_filters_to_query(query=query, table=table_name, search_value=search, **filters)
+        keys = db_keys(c.PRIMARY_KEYS[table])
+        if keys == c.PRIMARY_KEYS[table]:
+            query = """
+                DELETE FROM {}
+            """.format(table_name)
+            query_with_filters, params = self.add_multiple_filters_to_query(
+                query=query, table=table_name, search_value=search, search_keys=keys, **filters
+            )
+        else:
+            # filters use player names, so rows to delete are selected from table joined with player names
+            query = """
+                DELETE FROM {} WHERE rowid IN (SELECT t.RowId FROM ({}) AS t
+            """.format(table_name, named_rows(table_name))
+            query_with_filters, params = self.add_multiple_filters_to_query(
+                query=query, table="t", search_value=search, search_keys=keys, **filters
+            )
+            query_with_filters = query_with_filters.rstrip(";") + ");"
 
-        self._execute_single_query(query_with_filters)
+        cursor = self.connection.cursor()
+        if params:
+            cursor.execute(query_with_filters, params)
+        else:
+            cursor.execute(query_with_filters)
+        # filters are not restricted to a year, so generations of all years are bumped in the same transaction
+        bump_generations(cursor)
+        cursor.commit()
+        cursor.close()
 
-    def add_multiple_filters_to_query(self, query, table="t", search_value=None, search_columns=c.SEARCH_FIELDS, **filters):
+    def get_data_generations(self):
         """
-        Add filters to query as WHERE clause: where [key1] in (values1) and [key2] in (values2) and ...
-        :param query:                   input query
-        :param table                    table containing data to filter out
-        :param filters:                 data filters applied to an input table: WHERE filter1 AND/OR filter2 AND/OR ...
-                                        Include numerical filters (=, <, <=, >, >=) 
-        :param search:                  data to search globally across the table
-        :param is_crm:                  True if query is applied to CRM data
+        Get generations of stored data, the generation of a year changes with every write to the year
+        :return:            dictionary {year: generation}, see `generations.get_generations`
         """
-        query = query + "where 1=1"
-
-
-        and_query = []
-        if filters.get("and_filters"):
-            and_values = {}
-            and_filters = validate_data_for_sql_query(filters["and_filters"])
-            for key, value in and_filters.items():
-                and_values[key] = ', '.join("'{}'".format(v) for v in value)
-
-            and_query = " and ".join("{}.{} in ({})".format(table,key,value) for key, value in and_values.items())
-            
-        or_query = []       
-        if filters.get("or_filters"):
-            or_filters = validate_data_for_sql_query(filters["or_filters"])           
-            
-            for key, value in or_filters.items():
-                or_values = ', '.join("'{}'".format(v) for v in value)
-                or_query.append("{}.{} in ({})".format(table,key,or_values))
+        return get_generations(self)
 
-        search_query = []
-        if search_value:
-            search_query.append(self.add_global_search_to_query(table=table, search_columns=search_columns, search_value=search_value))
-
-        or_query_total = " or ".join(filter(None, [" or ".join(filter(None, or_query)), " or ".join(filter(None, search_query))]))
-
-        query = " and ".join(filter(None, [query, and_query, "({})".format(or_query_total)])) if or_query_total else " and ".join(filter(None, [query, and_query]))
+    def refresh_rollups(self, years=None):
+        """
+        Rebuild rollup tables for the years, see `rollups.refresh_rollups`
+        :param years:       iterable of changed years, all years if None
+        """
+        rollups.refresh_rollups(self, years)
 
-        return query
+    def get_player_stats(self, group_by=(), order_by="-Wins", limit=100, **filters):
+        """
+        Get win/loss, set and game totals per player, see `rollups.get_player_stats`
+        """
+        return rollups.get_player_stats(self, QUERY_BUILDER, group_by=group_by, order_by=order_by, limit=limit, **filters)
 
-    def add_global_search_to_query(self, table, query=None, search_value=None, search_columns=None):
+    def get_odds_stats(self, group_by=(), order_by="Bookmaker", limit=None, **filters):
         """
-        Add filters to query as WHERE clause: where [key1] like (values1) or [key2] like (values2) or ...
-        :param query:   input query
-        :param filters: filters for WHERE clause in query    
+        Get mean and max odds per bookmaker, see `rollups.get_odds_stats`
         """
-        if search_value:
-            value = validate_data_for_sql_query(search_value)
-            columns = search_columns if search_columns else self.get_table_columns(table)
-            search_conditions = ["{}.{} LIKE '%{}%'".format(table, col, value) for col in columns]
-            query = "{}".format(" or ".join(search_conditions))
-        return query
+        return rollups.get_odds_stats(self, QUERY_BUILDER, group_by=group_by, order_by=order_by, limit=limit, **filters)
 
-    def add_pagination_to_query(self, table, query, columns, rows=c.NROWS_PER_PAGE, page=1, order='asc'):
+    def get_aggregates(self, group_by, metrics, order_by=None, limit=None, **filters):
         """
-        Add pagination to table by splitting it into chunks with same numbers of rows 
-        :param query:   input query
-        :param columns: columns to order by
-        :param order: ascending of descending order
-        :param rows: number of rows on each page
-        :param page: page number 
+        Aggregate match data in SQL, see `rollups.get_match_aggregates`
         """
+        return rollups.get_match_aggregates(
+            self, QUERY_BUILDER, group_by, metrics, c.VALID_FILTER_FIELDS + ["Year"], order_by=order_by, limit=limit,
+            **filters
+        )
 
-        offset = (page-1)*rows
-        sorting_expression = "ORDER BY {}".format(', '.join(["{}.{} {}".format(table, col, order) for col in columns])) if columns else "ORDER BY(SELECT NULL)"
-        paginated_query = query + """ {}
-                                    LIMIT {} OFFSET {};
-                                """.format(sorting_expression, rows, offset)
-        return paginated_query 
\ No newline at end of file
+    def add_multiple_filters_to_query(self, query, table="t", search_value=None, search_columns=c.SEARCH_FIELDS, search_keys=None, **filters):
+        """
+        Add filters to query as WHERE clause: where [key1] in (?, ?) and [key2] >= ? and ...
+        :param query:                   input query
+        :param table                    table containing data to filter out
+        :param filters:                 data filters applied to an input table: WHERE filter1 AND/OR filter2 AND/OR ...
+                                        Numerical and date filters support operators as value prefix (=, !=, <, <=, >, >=)
+                                        and ranges (`low..high`)
+        :param search_value:            data to search globally across the table
+        :param search_columns:          columns used for global search
+        :param search_keys:             key columns of `table` used to match full-text search index
+        :return:                        tuple (query, list of parameters)
+        """
+        return QUERY_BUILDER.build(
+            query, table=table, search_value=search_value, search_columns=search_columns, search_keys=search_keys, **filters
+        )
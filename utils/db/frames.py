@@ -0,0 +1,66 @@
+"""
+Build typed DataFrames directly from database cursor.
+Rows are fetched in chunks, transposed into per-column sequences and converted to NumPy arrays with a dtype derived
+from SQL type of the column, so no intermediate object-dtype frame is created
+"""
+
+import numpy as np
+import pandas as pd
+
+from utils.db.schema import NUMERIC_TYPES, DATE_TYPES
+
+INTEGER_TYPES = ("INT", "SMALLINT", "INTEGER", "BIGINT")
+
+
+def _to_float_array(values):
+    return np.fromiter((np.nan if v is None else v for v in values), dtype=np.float64, count=len(values))
+
+
+def _to_array(values, sql_type):
+    """
+    Convert a chunk of column values to NumPy array
+    :param values:          sequence of column values
+    :param sql_type:        SQL type of the column without size, e.g. `DECIMAL`
+    """
+    if sql_type in NUMERIC_TYPES:
+        return _to_float_array(values)
+    return np.array(values, dtype=object)
+
+
+def _finalize(chunks, sql_type):
+    """
+    Concatenate column chunks and convert them to the final column dtype
+    """
+    if sql_type in NUMERIC_TYPES:
+        values = np.concatenate(chunks) if chunks else np.empty(0, dtype=np.float64)
+        if sql_type in INTEGER_TYPES:
+            mask = np.isnan(values)
+            if mask.any():
+                return pd.arrays.IntegerArray(np.where(mask, 0, values).astype(np.int64), mask)
+            return values.astype(np.int64)
+        return values
+    values = np.concatenate(chunks) if chunks else np.empty(0, dtype=object)
+    if sql_type in DATE_TYPES:
+        return pd.to_datetime(values, errors="coerce")
+    return values
+
+
+def frame_from_cursor(cursor, column_types, chunk_size=10000):
+    """
+    Fetch all rows of executed cursor into a DataFrame with typed columns
+    :param cursor:          DBAPI cursor with executed query
+    :param column_types:    dictionary {column name: SQL type}, columns with unknown type are kept as objects
+    :param chunk_size:      number of rows fetched at once
+    :return:                DataFrame
+    """
+    names = [d[0] for d in cursor.description]
+    types = [column_types.get(name) for name in names]
+    chunks = [[] for _ in names]
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        for i, values in enumerate(zip(*rows)):
+            chunks[i].append(_to_array(values, types[i]))
+
+    return pd.DataFrame({name: _finalize(chunks[i], types[i]) for i, name in enumerate(names)}, columns=names)
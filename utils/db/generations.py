@@ -0,0 +1,83 @@
+"""
+Per-year data generation counters stored in database.
+Writes of tournaments, results and bets tables (imports, uploads, deletes and restores) bump generations of their years
+once per transaction, in the same transaction as the data, so writes of other processes are visible to API processes.
+Row with year 0 holds a random epoch set when the table is created, so a recreated database never repeats tokens of
+the previous one
+"""
+
+import logging
+
+GENERATIONS_TABLE = "data_generations"
+
+EPOCH_YEAR = 0
+
+
+def drop_generation_triggers(db_connector):
+    """
+    Drop per-row triggers which bumped generations in schema versions 8 and 9, generations are bumped once per
+    transaction by writers instead
+    :param db_connector:    DBConnector object
+    """
+    cursor = db_connector.connection.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name GLOB ?;", [GENERATIONS_TABLE + "_*"])
+    triggers = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    for trigger in triggers:
+        db_connector._execute_single_query("DROP TRIGGER IF EXISTS {};".format(trigger))
+
+
+def create_generations_table(db_connector):
+    """
+    Create generation table with its epoch
+    :param db_connector:    DBConnector object
+    """
+    db_connector._execute_single_query(
+        "CREATE TABLE IF NOT EXISTS {} (Year INT PRIMARY KEY, Generation INT NOT NULL);".format(GENERATIONS_TABLE))
+    db_connector._execute_single_query(
+        "INSERT INTO {generations} (Year, Generation) SELECT ?, ABS(RANDOM() % 1000000000) "
+        "WHERE NOT EXISTS (SELECT 1 FROM {generations} WHERE Year = ?);".format(generations=GENERATIONS_TABLE),
+        [EPOCH_YEAR, EPOCH_YEAR])
+    drop_generation_triggers(db_connector)
+    logging.info("DB initialisation: generation table {} was created".format(GENERATIONS_TABLE))
+
+
+def bump_statements(years=None):
+    """
+    Render statements bumping generations of the years, executed once at the end of every write transaction
+    :param years:           list of years, all stored years are bumped if None
+    :return:                list of tuples (statement, parameters)
+    """
+    statement = "UPDATE {} SET Generation = Generation + 1 WHERE Year <> ?".format(GENERATIONS_TABLE)
+    if years is None:
+        return [(statement + ";", [EPOCH_YEAR])]
+    years = sorted(set(int(y) for y in years))
+    if not years:
+        return []
+    # the first write of a year creates its counter
+    insert = "INSERT OR IGNORE INTO {} (Year, Generation) VALUES {};".format(
+        GENERATIONS_TABLE, ", ".join(["(?, 0)"] * len(years)))
+    return [(insert, years), (statement + " AND Year IN ({});".format(", ".join("?" * len(years))), [EPOCH_YEAR] + years)]
+
+
+def bump_generations(cursor, years=None):
+    """
+    Bump generations of the years within the transaction of cursor
+    :param cursor:          cursor of write connection
+    :param years:           iterable of years, all stored years are bumped if None
+    """
+    for statement, params in bump_statements(years):
+        cursor.execute(statement, params)
+
+
+def get_generations(db_connector):
+    """
+    Get generations of all stored years in one query, the table holds a row per year
+    :param db_connector:    DBConnector object
+    :return:                dictionary {year: generation}, epoch is stored under `EPOCH_YEAR`
+    """
+    cursor = db_connector.connection.cursor()
+    cursor.execute("SELECT Year, Generation FROM {};".format(GENERATIONS_TABLE))
+    generations = {int(year): int(generation) for year, generation in cursor.fetchall()}
+    cursor.close()
+    return generations
@@ -0,0 +1,101 @@
+"""
+Reconciliation of secondary indexes declared in database schema file.
+Indexes are declared under `indexes` key of schema file:
+    {"name": "idx_results_winner", "table": "tournaments_results", "columns": ["WinnerId", "Year"],
+     "unique": false, "where": "Comment <> 'Completed'"}
+`unique` and `where` (partial index condition) are optional. Indexes whose names start with `MANAGED_INDEX_PREFIX`
+are owned by schema file: they are created when missing, recreated when definition changes and dropped when removed
+from schema file
+"""
+
+import re
+import time
+import logging
+
+MANAGED_INDEX_PREFIX = "idx_"
+
+
+def render_index(index):
+    """
+    Render CREATE INDEX statement for index declaration
+    :param index:           dictionary with index declaration
+    :return:                SQL statement
+    """
+    statement = "CREATE {}INDEX {} ON {} ({})".format(
+        "UNIQUE " if index.get("unique") else "", index["name"], index["table"], ", ".join(index["columns"])
+    )
+    if index.get("where"):
+        statement += " WHERE {}".format(index["where"])
+    return statement
+
+
+def _normalize(statement):
+    return re.sub(r"\s+", " ", statement or "").strip().rstrip(";").lower()
+
+
+def get_existing_indexes(db_connector):
+    """
+    Get explicitly created indexes stored in database
+    :return:                dictionary {index name: CREATE INDEX statement}
+    """
+    cursor = db_connector.connection.cursor()
+    cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL;")
+    existing = {name: sql for name, sql in cursor.fetchall()}
+    cursor.close()
+    return existing
+
+
+def get_index_report(db_connector, declared):
+    """
+    Compare declared indexes with indexes stored in database
+    :param db_connector:    DBConnector object
+    :param declared:        list of index declarations from schema file
+    :return:                dictionary with lists of `missing`, `changed` and `obsolete` index names
+    """
+    existing = get_existing_indexes(db_connector)
+    declared_names = set()
+    report = {"missing": [], "changed": [], "obsolete": []}
+    for index in declared:
+        declared_names.add(index["name"])
+        if index["name"] not in existing:
+            report["missing"].append(index["name"])
+        elif _normalize(existing[index["name"]]) != _normalize(render_index(index)):
+            report["changed"].append(index["name"])
+    report["obsolete"] = sorted(
+        name for name in existing if name.startswith(MANAGED_INDEX_PREFIX) and name not in declared_names
+    )
+    return report
+
+
+def reconcile_indexes(db_connector, declared, apply_changes=True):
+    """
+    Log index report and bring database indexes in line with declarations
+    :param db_connector:    DBConnector object
+    :param declared:        list of index declarations from schema file
+    :param apply_changes:   if False, only report is logged
+    :return:                index report before reconciliation
+    """
+    report = get_index_report(db_connector, declared)
+
+    for name in report["missing"]:
+        logging.warning("DB indexes: index {} is missing".format(name))
+    for name in report["changed"]:
+        logging.warning("DB indexes: index {} definition has changed".format(name))
+    for name in report["obsolete"]:
+        logging.warning("DB indexes: index {} is not declared in schema file".format(name))
+    if not any(report.values()):
+        logging.info("DB indexes: all {} declared indexes exist".format(len(declared)))
+        return report
+    if not apply_changes:
+        return report
+
+    by_name = {index["name"]: index for index in declared}
+    for name in report["obsolete"] + report["changed"]:
+        db_connector._execute_single_query("DROP INDEX IF EXISTS {};".format(name))
+        logging.info("DB indexes: dropped index {}".format(name))
+    for name in report["changed"] + report["missing"]:
+        t1 = time.time()
+        db_connector._execute_single_query(render_index(by_name[name]) + ";")
+        logging.info("DB indexes: created index {} in {:.2f} seconds".format(name, time.time() - t1))
+    db_connector._execute_single_query("ANALYZE;")
+    return report
@@ -0,0 +1,132 @@
+"""
+Denormalized match table: tournaments LEFT JOIN results LEFT JOIN bets stored as a regular table.
+Table is maintained incrementally by triggers on the source tables, so it is updated in the same transaction as the
+statement that changes tournaments, results or bets data (including cascade deletes). Tournaments without results are
+stored as a single row with NULL player ids and names. Match rows are keyed by player ids as result rows and carry
+player names, so reads need no join with players table
+"""
+
+import logging
+
+import config as c
+from utils.db.players import PLAYER_ID_COLUMNS, player_name
+
+MATCHES_TABLE = "tournaments_matches"
+
+KEY_COLUMNS = ["ATP", "Year"]
+MATCH_KEY_COLUMNS = ["ATP", "Year"] + list(PLAYER_ID_COLUMNS.values())
+PLAYER_COLUMNS = list(PLAYER_ID_COLUMNS)
+
+TOURNAMENT_COLUMNS = [f for f in c.TOURNAMENTS_FIELDS if f not in KEY_COLUMNS + ["Date"]]
+RESULT_COLUMNS = [f for f in c.RESULTS_FIELDS if f not in MATCH_KEY_COLUMNS + PLAYER_COLUMNS + ["Date"]]
+BET_COLUMNS = [f for f in c.BETS_FIELDS if f not in MATCH_KEY_COLUMNS + PLAYER_COLUMNS + ["Date"]]
+
+MATCH_COLUMNS = MATCH_KEY_COLUMNS + PLAYER_COLUMNS + ["Date"] + TOURNAMENT_COLUMNS + RESULT_COLUMNS + BET_COLUMNS
+
+
+def _select_match(tournament, result, bet):
+    """
+    Render select list of a match row from tournament, result and bet row aliases
+    """
+    return ", ".join(
+        ["{}.ATP".format(tournament), "{}.Year".format(tournament),
+         "{}.WinnerId".format(result), "{}.LoserId".format(result),
+         player_name("WinnerId", result), player_name("LoserId", result),
+         # tournament date is used as in the original join result, match date if it is missing
+         "COALESCE({}.Date, {}.Date, {}.Date)".format(tournament, result, bet)] +
+        ["{}.{}".format(tournament, f) for f in TOURNAMENT_COLUMNS] +
+        ["{}.{}".format(result, f) for f in RESULT_COLUMNS] +
+        ["{}.{}".format(bet, f) for f in BET_COLUMNS]
+    )
+
+
+def _insert_result_row(result):
+    """
+    Render statement inserting match row for result row alias `result` (`new` in triggers)
+    """
+    # explicit delete instead of INSERT OR REPLACE: conflict clause of trigger statements is overridden by the outer
+    # statement (e.g. INSERT OR IGNORE)
+    return (
+        "DELETE FROM {matches} WHERE " + _match_key_condition("{r}") + "; "
+        "INSERT INTO {matches} (" + ", ".join(MATCH_COLUMNS) + ") "
+        "SELECT " + _select_match("tr", result, "b") + " FROM {tournaments} AS tr "
+        "LEFT JOIN {bets} AS b ON b.ATP = {r}.ATP AND b.Year = {r}.Year AND b.WinnerId = {r}.WinnerId AND b.LoserId = {r}.LoserId "
+        "WHERE tr.ATP = {r}.ATP AND tr.Year = {r}.Year;"
+    ).replace("{r}", result)
+
+
+def _insert_placeholder_row(tournament):
+    """
+    Render statement inserting a row for tournament without results
+    """
+    return (
+        "INSERT INTO {matches} (" + ", ".join(KEY_COLUMNS + ["Date"] + TOURNAMENT_COLUMNS) + ") "
+        "SELECT tr.ATP, tr.Year, tr.Date, " + ", ".join("tr." + f for f in TOURNAMENT_COLUMNS) +
+        " FROM {tournaments} AS tr WHERE tr.ATP = {t}.ATP AND tr.Year = {t}.Year "
+        "AND NOT EXISTS (SELECT 1 FROM {results} AS r WHERE r.ATP = {t}.ATP AND r.Year = {t}.Year) "
+        "AND NOT EXISTS (SELECT 1 FROM {matches} AS m WHERE m.ATP = {t}.ATP AND m.Year = {t}.Year);"
+    ).replace("{t}", tournament)
+
+
+def _match_key_condition(row):
+    return " AND ".join("{k} = {r}.{k}".format(k=k, r=row) for k in MATCH_KEY_COLUMNS)
+
+
+def get_trigger_statements(tables):
+    """
+    Render triggers keeping match table in sync with source tables
+    :param tables:          dictionary with table names as in `DBConnector.tables`
+    :return:                list of SQL statements
+    """
+    update_bets = "UPDATE {matches} SET " + ", ".join("{f} = new.{f}".format(f=f) for f in BET_COLUMNS) + \
+                  " WHERE " + _match_key_condition("new") + ";"
+    clear_bets = "UPDATE {matches} SET " + ", ".join("{f} = NULL".format(f=f) for f in BET_COLUMNS) + \
+                 " WHERE " + _match_key_condition("old") + ";"
+    update_tournament = "UPDATE {matches} SET Date = COALESCE(new.Date, Date), " + \
+                        ", ".join("{f} = new.{f}".format(f=f) for f in TOURNAMENT_COLUMNS) + \
+                        " WHERE ATP = new.ATP AND Year = new.Year;"
+    delete_placeholder = "DELETE FROM {matches} WHERE ATP = new.ATP AND Year = new.Year AND WinnerId IS NULL AND LoserId IS NULL;"
+
+    triggers = {
+        "tournaments_insert": ("AFTER INSERT ON {tournaments}", [_insert_placeholder_row("new")]),
+        "tournaments_update": ("AFTER UPDATE ON {tournaments}", [update_tournament]),
+        "tournaments_delete": ("AFTER DELETE ON {tournaments}",
+                               ["DELETE FROM {matches} WHERE ATP = old.ATP AND Year = old.Year;"]),
+        "results_insert": ("AFTER INSERT ON {results}", [delete_placeholder, _insert_result_row("new")]),
+        "results_update": ("AFTER UPDATE ON {results}",
+                           ["DELETE FROM {matches} WHERE " + _match_key_condition("old") + ";",
+                            delete_placeholder, _insert_result_row("new"), _insert_placeholder_row("old")]),
+        "results_delete": ("AFTER DELETE ON {results}",
+                           ["DELETE FROM {matches} WHERE " + _match_key_condition("old") + ";",
+                            _insert_placeholder_row("old")]),
+        "bets_insert": ("AFTER INSERT ON {bets}", [update_bets]),
+        "bets_update": ("AFTER UPDATE ON {bets}", [clear_bets, update_bets]),
+        "bets_delete": ("AFTER DELETE ON {bets}", [clear_bets]),
+    }
+    statements = []
+    for name, (event, body) in triggers.items():
+        statement = "CREATE TRIGGER IF NOT EXISTS {matches}_" + name + " " + event + " BEGIN " + " ".join(body) + " END;"
+        statements.append(statement.format(**dict(tables, matches=MATCHES_TABLE)))
+    return statements
+
+
+def create_matches_table(db_connector, fields):
+    """
+    Create match table with synchronization triggers and fill it with already stored data
+    :param db_connector:    DBConnector object
+    :param fields:          table fields from schema file
+    """
+    tables = db_connector.tables
+    db_connector._create_table(MATCHES_TABLE, fields)
+
+    db_connector._execute_single_query("DELETE FROM {};".format(MATCHES_TABLE))
+    db_connector._execute_single_query((
+        "INSERT INTO {matches} (" + ", ".join(MATCH_COLUMNS) + ") "
+        "SELECT " + _select_match("tr", "r", "b") + " FROM {tournaments} AS tr "
+        "LEFT JOIN {results} AS r ON r.ATP = tr.ATP AND r.Year = tr.Year "
+        "LEFT JOIN {bets} AS b ON b.ATP = r.ATP AND b.Year = r.Year AND b.WinnerId = r.WinnerId AND b.LoserId = r.LoserId;"
+    ).format(**dict(tables, matches=MATCHES_TABLE)))
+
+    for statement in get_trigger_statements(tables):
+        db_connector._execute_single_query(statement)
+    logging.info("DB initialisation: match table {} was filled and synchronization triggers created".format(MATCHES_TABLE))
@@ -0,0 +1,58 @@
+"""
+Native write engine based on the standard library `sqlite3` module.
+Bulk writes bypass ODBC: connection is tuned for loading (WAL journal, `synchronous=NORMAL`, larger page cache) and
+rows are fed to `executemany` from an iterator, so no intermediate list of rows is built
+"""
+
+import sqlite3
+import logging
+import datetime
+import numpy as np
+import pandas as pd
+
+from config import config
+
+# values produced by pandas are adapted explicitly, sqlite3 accepts only exact built-in types
+sqlite3.register_adapter(datetime.date, lambda d: d.isoformat())
+sqlite3.register_adapter(datetime.datetime, lambda d: d.isoformat(" "))
+sqlite3.register_adapter(pd.Timestamp, lambda d: d.isoformat(" "))
+sqlite3.register_adapter(np.int64, int)
+sqlite3.register_adapter(np.int32, int)
+sqlite3.register_adapter(np.float64, float)
+sqlite3.register_adapter(np.bool_, bool)
+
+
+def connect_native(database=None):
+    """
+    Open native SQLite connection configured for bulk writes
+    :param database:        path to database file, default is taken from configuration
+    :return:                sqlite3 connection object
+    """
+    database = database or config["db"]["database"]
+    connection = sqlite3.connect(database, timeout=config["db"].getfloat("pool_timeout", 30))
+    # journal mode is persistent, other settings are applied per connection
+    connection.execute("PRAGMA journal_mode = {};".format(config["db"].get("journal_mode", "WAL")))
+    connection.execute("PRAGMA synchronous = {};".format(config["db"].get("synchronous", "NORMAL")))
+    connection.execute("PRAGMA cache_size = -{};".format(config["db"].getint("cache_size_kib", 65536)))
+    connection.execute("PRAGMA temp_store = MEMORY;")
+    connection.execute("PRAGMA foreign_keys = ON;")
+    logging.info("Native connection to database {} established".format(database))
+    return connection
+
+
+def iter_rows(df):
+    """
+    Iterate over DataFrame rows as tuples of Python values with missing values replaced by None.
+    Values are converted column by column, rows are produced lazily
+    :param df:              an input DataFrame
+    :return:                iterator of row tuples
+    """
+    columns = []
+    for name in df.columns:
+        values = df[name].to_numpy(dtype=object)
+        mask = pd.isna(values)
+        if mask.any():
+            values = values.copy()
+            values[mask] = None
+        columns.append(values)
+    return zip(*columns)
@@ -0,0 +1,206 @@
+"""
+Player dimension table.
+Results and bets reference players by integer surrogate keys (`WinnerId`, `LoserId`) instead of names, so primary keys,
+secondary indexes and joins of these tables compare integers. Names are interned into ids on write: a name is matched
+by its normalized key (see `utils.preprocess.names.name_key`) and unknown players are inserted in the same transaction
+as the rows referencing them. Match table and search index keep player names, so filters and responses of the API use
+names as before
+"""
+
+import time
+import logging
+import numpy as np
+import pandas as pd
+
+from utils.logging.helpers import log_and_warn
+from utils.preprocess.names import clean_name, name_key
+
+PLAYERS_TABLE = "players"
+
+# name column in source data: id column in database
+PLAYER_ID_COLUMNS = {"Winner": "WinnerId", "Loser": "LoserId"}
+
+# maximum number of bound parameters in one lookup statement
+LOOKUP_CHUNK_SIZE = 500
+
+MIGRATION_SUFFIX = "_migration"
+
+
+def db_keys(keys):
+    """
+    Primary key columns as stored in database: player name columns are replaced by player id columns
+    :param keys:            primary key columns as in `config.PRIMARY_KEYS`
+    :return:                list of column names
+    """
+    return [PLAYER_ID_COLUMNS.get(k, k) for k in keys]
+
+
+def player_name(id_column, alias):
+    """
+    Render SQL expression selecting player name by id column of row alias
+    """
+    return "(SELECT Name FROM {} WHERE PlayerId = {}.{})".format(PLAYERS_TABLE, alias, id_column)
+
+
+def named_rows(table):
+    """
+    Render query selecting rows of results or bets table with their rowid and player names in `Winner` and `Loser`
+    columns, so rows can be filtered by names
+    """
+    return "SELECT r.rowid AS RowId, r.*, {} FROM {} AS r".format(
+        ", ".join("{} AS {}".format(player_name(id_column, "r"), name) for name, id_column in PLAYER_ID_COLUMNS.items()),
+        table
+    )
+
+
+def _lookup(cursor, keys):
+    """
+    Get player ids of name keys stored in players table
+    :return:                dictionary {name key: player id}
+    """
+    keys = list(keys)
+    ids = {}
+    for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+        chunk = keys[start:start + LOOKUP_CHUNK_SIZE]
+        cursor.execute("SELECT NameKey, PlayerId FROM {} WHERE NameKey IN ({});".format(
+            PLAYERS_TABLE, ", ".join("?" * len(chunk))), chunk)
+        ids.update((key, int(player_id)) for key, player_id in cursor.fetchall())
+    return ids
+
+
+def intern_names(cursor, names):
+    """
+    Get player ids of names, players which are not stored yet are inserted
+    :param cursor:          cursor of write connection, new players are committed with the current transaction
+    :param names:           iterable of player names
+    :return:                dictionary {name: player id}
+    """
+    keys = {name: name_key(str(name)) for name in set(names)}
+    ids = _lookup(cursor, set(keys.values()))
+
+    missing = {}
+    # the first spelling in name order is stored, independently of the order of names
+    for name, key in sorted(keys.items()):
+        if key not in ids:
+            missing.setdefault(key, clean_name(str(name)))
+    if missing:
+        # ids are assigned in name order, so the same data gets the same ids in every database
+        cursor.executemany(
+            "INSERT OR IGNORE INTO {} (Name, NameKey) VALUES (?, ?);".format(PLAYERS_TABLE),
+            sorted(((name, key) for key, name in missing.items()), key=lambda row: row[0])
+        )
+        ids.update(_lookup(cursor, missing))
+        logging.info("{} new players were added to {} table".format(len(missing), PLAYERS_TABLE))
+    return {name: ids[key] for name, key in keys.items()}
+
+
+def intern_frames(cursor, frames):
+    """
+    Replace player names in primary keys of frames by player ids
+    :param cursor:          cursor of write connection
+    :param frames:          dictionary {table key: DataFrame indexed by primary key as in `config.PRIMARY_KEYS`}
+    :return:                dictionary {table key: DataFrame indexed by primary key as stored in database}
+    """
+    names = set()
+    for df in frames.values():
+        for column in PLAYER_ID_COLUMNS:
+            if column in df.index.names:
+                names.update(df.index.get_level_values(column).unique().tolist())
+    if not names:
+        return frames
+    ids = intern_names(cursor, names)
+
+    interned = {}
+    for table, df in frames.items():
+        if not any(column in df.index.names for column in PLAYER_ID_COLUMNS):
+            interned[table] = df
+            continue
+        index = df.index.to_frame(index=False)
+        for column in PLAYER_ID_COLUMNS:
+            if column in index.columns:
+                index[column] = index[column].map(ids).astype(np.int64)
+        df = df.set_axis(pd.MultiIndex.from_frame(index.rename(columns=PLAYER_ID_COLUMNS)), axis=0)
+        # spelling variants of the same player have the same id
+        duplicated = df.index.duplicated()
+        if duplicated.any():
+            log_and_warn("{} rows of {} data duplicate other rows after player names were interned".format(
+                duplicated.sum(), table))
+            df = df[~duplicated]
+        interned[table] = df
+    return interned
+
+
+def _table_columns(db_connector, table):
+    cursor = db_connector.connection.cursor()
+    cursor.execute("PRAGMA table_info({});".format(table))
+    columns = [row[1] for row in cursor.fetchall()]
+    cursor.close()
+    return columns
+
+
+def migrate_player_keys(db_connector, structure, dependent_tables=()):
+    """
+    Convert results and bets tables keyed by player names (schema version 5 and earlier) to player ids.
+    Tables are rebuilt with structure from schema file, triggers on source tables and `dependent_tables` which store
+    the old keys are dropped, they are recreated by schema upgrade
+    :param db_connector:    DBConnector object
+    :param structure:       schema file content
+    :param dependent_tables: tables derived from results and bets, e.g. match table and search index
+    :return:                True if tables were migrated
+    """
+    tables = db_connector.tables
+    if "Winner" not in _table_columns(db_connector, tables["results"]):
+        return False
+    t1 = time.time()
+
+    cursor = db_connector.connection.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name IN (?, ?, ?);",
+                   [tables["tournaments"], tables["results"], tables["bets"]])
+    triggers = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    for trigger in triggers:
+        db_connector._execute_single_query("DROP TRIGGER IF EXISTS {};".format(trigger))
+    for table in dependent_tables:
+        db_connector._execute_single_query("DROP TABLE IF EXISTS {};".format(table))
+
+    # stored names are interned the same way as imported names
+    cursor = db_connector.connection.cursor()
+    cursor.execute(" UNION ".join(
+        "SELECT {} FROM {} WHERE {} IS NOT NULL".format(column, tables[table], column)
+        for table in ("results", "bets") for column in PLAYER_ID_COLUMNS
+    ) + ";")
+    names = [row[0] for row in cursor.fetchall()]
+    ids = intern_names(cursor, names)
+    cursor.commit()
+    cursor.close()
+
+    mapping = PLAYERS_TABLE + MIGRATION_SUFFIX
+    db_connector._execute_single_query("DROP TABLE IF EXISTS {};".format(mapping))
+    db_connector._execute_single_query("CREATE TABLE {} (Name NVARCHAR(255) PRIMARY KEY, PlayerId INT);".format(mapping))
+    cursor = db_connector.connection.cursor()
+    cursor.executemany("INSERT INTO {} (Name, PlayerId) VALUES (?, ?);".format(mapping), list(ids.items()))
+    cursor.commit()
+    cursor.close()
+
+    for table in ("results", "bets"):
+        table_name = tables[table]
+        new_table = table_name + MIGRATION_SUFFIX
+        old_columns = _table_columns(db_connector, table_name)
+        db_connector._execute_single_query("DROP TABLE IF EXISTS {};".format(new_table))
+        db_connector._create_table(new_table, structure[table_name])
+
+        # every name column is joined with mapping table under alias of its id column
+        id_columns = {id_column: name for name, id_column in PLAYER_ID_COLUMNS.items()}
+        columns = [col for col in _table_columns(db_connector, new_table) if col in old_columns or col in id_columns]
+        select = ["{}.PlayerId".format(col) if col in id_columns else "s.{}".format(col) for col in columns]
+        joins = " ".join("LEFT JOIN {m} AS {a} ON {a}.Name = s.{n}".format(m=mapping, a=a, n=n) for a, n in id_columns.items())
+        db_connector._execute_single_query("INSERT OR IGNORE INTO {} ({}) SELECT {} FROM {} AS s {};".format(
+            new_table, ", ".join(columns), ", ".join(select), table_name, joins))
+        db_connector._execute_single_query("DROP TABLE {};".format(table_name))
+        db_connector._execute_single_query("ALTER TABLE {} RENAME TO {};".format(new_table, table_name))
+        logging.info("DB initialisation: table {} was migrated to player ids".format(table_name))
+
+    db_connector._execute_single_query("DROP TABLE {};".format(mapping))
+    logging.info("DB initialisation: {} players were interned, migration took {:.2f} seconds".format(
+        len(set(ids.values())), time.time() - t1))
+    return True
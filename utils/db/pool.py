@@ -0,0 +1,159 @@
+"""
+Process-wide connection pool shared by all DBConnector instances
+"""
+
+import time
+import queue
+import logging
+import threading
+
+
+class ConnectionPool:
+    """
+    Implements a bounded pool of long-lived database connections.
+    A connection checked out by a thread stays pinned to that thread until it is returned, so nested checkouts
+    from the same thread reuse the same connection (and therefore the same transaction)
+    """
+    def __init__(self, connect_func, max_size=8, timeout=30, health_check_query="SELECT 1;"):
+        """
+        :param connect_func:                function without arguments returning a new DBAPI connection
+        :param max_size:                    maximum number of connections opened by the pool
+        :param timeout:                     seconds to wait for a free connection before raising an exception
+        :param health_check_query:          query executed on an idle connection before handing it out
+        """
+        self.connect_func = connect_func
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_query = health_check_query
+        self._idle = queue.LifoQueue()
+        self._size = 0
+        self._lock = threading.Lock()
+        # id of checked out connection: [connection, number of checkouts not yet returned], the same entry is kept
+        # by the owner thread, so the thread can tell whether its connection was returned meanwhile
+        self._owners = {}
+        self._local = threading.local()
+        self._closed = False
+
+    @property
+    def size(self):
+        """Number of connections currently opened by the pool
+        """
+        return self._size
+
+    def checkout(self):
+        """
+        Get a connection for the current thread. Re-entrant: the same connection is returned until every
+        checkout of the thread is matched by a checkin
+        :return:                            DBAPI connection
+        """
+        entry = getattr(self._local, "entry", None)
+        if entry is not None:
+            with self._lock:
+                if self._owners.get(id(entry[0])) is entry:
+                    entry[1] += 1
+                    return entry[0]
+
+        if self._closed:
+            raise ConnectionError("Connection pool is closed")
+        connection = self._acquire()
+        entry = [connection, 1]
+        with self._lock:
+            self._owners[id(connection)] = entry
+        self._local.entry = entry
+        return connection
+
+    def checkin(self, connection):
+        """
+        Return a connection previously obtained with `checkout`. Checkouts are counted per connection, so a connection
+        may be returned by another thread than the one which checked it out (e.g. by a garbage collected connector):
+        it stays pinned to its owner until every checkout is returned
+        :param connection:                  DBAPI connection to return
+        """
+        with self._lock:
+            entry = self._owners.get(id(connection))
+            if entry is None or entry[0] is not connection:
+                logging.warning("Database connection which was not checked out was returned to pool and was ignored")
+                return
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            del self._owners[id(connection)]
+
+        try:
+            # discard anything left uncommitted by the caller
+            connection.rollback()
+        except Exception as e:
+            logging.warning("Discarding broken database connection: {}".format(e))
+            self._discard(connection)
+            return
+        if self._closed:
+            self._discard(connection)
+            return
+        self._idle.put(connection)
+
+    def close_all(self):
+        """
+        Close all idle connections and stop handing out new ones. Connections checked out at the moment are closed
+        when returned
+        """
+        self._closed = True
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(connection)
+
+    def _acquire(self):
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                connection = self._open_if_allowed()
+                if connection is not None:
+                    return connection
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise ConnectionError("No free database connection within {} seconds".format(self.timeout))
+                try:
+                    connection = self._idle.get(timeout=remaining)
+                except queue.Empty:
+                    raise ConnectionError("No free database connection within {} seconds".format(self.timeout))
+
+            if self._is_healthy(connection):
+                return connection
+            logging.warning("Database connection failed health check and was replaced")
+            self._discard(connection)
+
+    def _open_if_allowed(self):
+        with self._lock:
+            if self._size >= self.max_size:
+                return None
+            self._size += 1
+        try:
+            connection = self.connect_func()
+        except Exception:
+            with self._lock:
+                self._size -= 1
+            raise
+        logging.info("Database connection opened ({}/{} in pool)".format(self._size, self.max_size))
+        return connection
+
+    def _is_healthy(self, connection):
+        try:
+            cursor = connection.cursor()
+            cursor.execute(self.health_check_query)
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._size -= 1
@@ -0,0 +1,283 @@
+"""
+Parameterized query builder for filters, global search and pagination
+"""
+
+import re
+import json
+import base64
+import functools
+
+import config as c
+from utils.db.search import build_match_expression
+from utils.helpers import decode_url_symbols, escape_like_pattern
+
+# operators accepted as value prefix for numeric and date filters, e.g. `WRank=<=10`
+COMPARISON_OPERATORS = (">=", "<=", "!=", ">", "<")
+# separator for range filters, e.g. `B365W=1.5..2.0`
+RANGE_SEPARATOR = ".."
+LIKE_ESCAPE_CHAR = "\\"
+
+IDENTIFIER_REGEX = re.compile(r"^\w+$")
+
+
+def encode_cursor(values):
+    """
+    Encode key values of the last row of a page into an opaque pagination token
+    :param values:          iterable of key values
+    :return:                URL-safe token string
+    """
+    values = [v.item() if hasattr(v, "item") else v for v in values]
+    values = [None if v != v else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token):
+    """
+    Decode pagination token created by `encode_cursor`
+    :param token:           URL-safe token string
+    :return:                list of key values
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+    except Exception:
+        raise ValueError("Invalid pagination cursor")
+    if not isinstance(values, list):
+        raise ValueError("Invalid pagination cursor")
+    return values
+
+
+class QueryBuilder:
+    """
+    Builds SQL statements with `?` placeholders and a list of bound parameters.
+    Statement text depends only on the shape of a request (filter keys and operators, number of values, search on/off,
+    sorting and page size), so rendered statements are kept in LRU cache and the same SQL text is reused for all
+    requests of the same shape
+    """
+    def __init__(self, numeric_columns=(), date_columns=(), cache_size=256, search_index=None):
+        """
+        :param numeric_columns:             columns compared as numbers, support comparison and range operators
+        :param date_columns:                columns compared as ISO dates, support comparison and range operators
+        :param cache_size:                  maximum number of cached statement shapes
+        :param search_index:                name of FTS5 table used for global search, LIKE search is used if None
+        """
+        self.search_index = search_index
+        self.numeric_columns = set(numeric_columns)
+        self.ordered_columns = set(numeric_columns) | set(date_columns)
+        self._render_cached = functools.lru_cache(maxsize=cache_size)(self._render)
+
+    def cache_info(self):
+        """Statistics of statement cache
+        """
+        return self._render_cached.cache_info()
+
+    def build(self, query, table="t", search_value=None, search_columns=c.SEARCH_FIELDS, sortby=None, sort_order="asc",
+              rows=None, page=1, keyset=None, after=None, search_keys=None, **filters):
+        """
+        Build statement with WHERE, ORDER BY and LIMIT/OFFSET clauses.
+        If `keyset` columns are provided, seek pagination is used instead of OFFSET: rows are ordered by `keyset`
+        columns and only rows after the `after` key are selected
+        :param query:                       base query without WHERE clause
+        :param table:                       table containing data to filter out
+        :param search_value:                data to search globally across the table
+        :param search_columns:              columns used for global search
+        :param search_keys:                 key columns of `table` matched against full-text index rows,
+                                            LIKE search over `search_columns` is used if None
+        :param sortby:                      columns to order by
+        :param sort_order:                  ascending or descending order
+        :param rows:                        number of rows on each page, no pagination if None
+        :param page:                        page number, ignored for seek pagination
+        :param keyset:                      unique combination of columns for seek pagination
+        :param after:                       values of `keyset` columns of the last row of the previous page,
+                                            None for the first page
+        :param filters:                     `and_filters` and `or_filters` dictionaries {column: value or list of values}
+        :return:                            tuple (statement, list of parameters)
+        """
+        and_shape, and_params = self._parse_filters(filters.get("and_filters"))
+        or_shape, or_params = self._parse_filters(filters.get("or_filters"))
+
+        search_shape = None
+        search_params = []
+        if search_value:
+            search_value = decode_url_symbols(str(search_value))
+            match_expression = None
+            if self.search_index and search_keys:
+                match_expression = build_match_expression(search_value, search_columns)
+            if match_expression:
+                search_shape = ("match", tuple(search_keys), self.search_index)
+                search_params = [match_expression]
+            else:
+                search_shape = ("like", tuple(search_columns))
+                pattern = "%{}%".format(escape_like_pattern(search_value, LIKE_ESCAPE_CHAR))
+                search_params = [pattern] * len(search_columns)
+
+        sort_order = sort_order.lower()
+        if sort_order not in ("asc", "desc"):
+            raise ValueError("Invalid sorting order: {}".format(sort_order))
+
+        keyset_shape = None
+        pagination_params = []
+        if keyset:
+            sortby = None
+            if after is not None:
+                if len(after) != len(keyset):
+                    raise ValueError("Invalid pagination cursor")
+                # missing trailing keys (tournament without results) can only be followed by the next tournament,
+                # so seek is done over the non-missing prefix of the key
+                size = next((i for i, v in enumerate(after) if v is None), len(after))
+                if size == 0:
+                    raise ValueError("Invalid pagination cursor")
+                after = after[:size]
+                # leading column is repeated as a separate bound so that an index on it can be used for seek
+                pagination_params = [after[0]] + list(after)
+            keyset_shape = (tuple(keyset), len(after) if after is not None else 0)
+            if rows is not None:
+                rows = int(rows)
+        elif rows is not None:
+            rows = int(rows)
+            pagination_params = [(int(page) - 1) * rows]
+
+        statement = self._render_cached(
+            query, table, and_shape, or_shape, search_shape,
+            tuple(sortby) if sortby else None, sort_order, rows, keyset_shape
+        )
+        return statement, and_params + or_params + search_params + pagination_params
+
+    def iter_conditions(self, filters):
+        """
+        Parse filters into conditions for storage engines other than SQL
+        :param filters:                     dictionary {column: value or list of values}
+        :return:                            generator of (column, operator, list of converted values), where operator
+                                            is `in`, `between` or one of `COMPARISON_OPERATORS`
+        """
+        shape, params = self._parse_filters(filters)
+        params = iter(params)
+        for key, conditions in shape:
+            for condition in conditions:
+                if isinstance(condition, tuple):
+                    yield key, "in", [next(params) for _ in range(condition[1])]
+                elif condition == "between":
+                    yield key, condition, [next(params), next(params)]
+                else:
+                    yield key, condition, [next(params)]
+
+    def _parse_filters(self, filters):
+        """
+        Split filters into hashable shape and a list of parameters
+        """
+        if not filters:
+            return (), []
+        shape = []
+        params = []
+        for key, values in filters.items():
+            if not IDENTIFIER_REGEX.match(key):
+                raise ValueError("Invalid filter field: {}".format(key))
+            if not isinstance(values, (list, tuple)):
+                values = [values]
+            conditions, condition_params = self._parse_values(key, values)
+            shape.append((key, conditions))
+            params.extend(condition_params)
+        return tuple(shape), params
+
+    def _parse_values(self, key, values):
+        """
+        Parse values of a single filter into conditions: equality values are combined into one IN condition,
+        comparison and range conditions are added one by one
+        """
+        equal_values = []
+        conditions = []
+        params = []
+        for value in values:
+            if isinstance(value, str):
+                value = decode_url_symbols(value)
+            if key in self.ordered_columns and isinstance(value, str):
+                operator = next((o for o in COMPARISON_OPERATORS if value.startswith(o)), None)
+                if operator:
+                    conditions.append(operator)
+                    params.append(self._convert(key, value[len(operator):]))
+                    continue
+                if RANGE_SEPARATOR in value:
+                    low, high = value.split(RANGE_SEPARATOR, 1)
+                    conditions.append("between")
+                    params.extend([self._convert(key, low), self._convert(key, high)])
+                    continue
+            equal_values.append(self._convert(key, value))
+
+        if equal_values:
+            conditions.insert(0, ("in", len(equal_values)))
+            params = equal_values + params
+        return tuple(conditions), params
+
+    def _convert(self, key, value):
+        if key not in self.numeric_columns or not isinstance(value, str):
+            return value
+        value = value.strip()
+        try:
+            return int(value)
+        except ValueError:
+            pass
+        try:
+            return float(value)
+        except ValueError:
+            raise ValueError("Invalid numeric value for filter {}: {}".format(key, value))
+
+    @staticmethod
+    def _render_conditions(table, shape):
+        rendered = []
+        for key, conditions in shape:
+            for condition in conditions:
+                if condition == "between":
+                    rendered.append("{}.{} BETWEEN ? AND ?".format(table, key))
+                elif isinstance(condition, tuple):
+                    rendered.append("{}.{} IN ({})".format(table, key, ", ".join("?" * condition[1])))
+                else:
+                    rendered.append("{}.{} {} ?".format(table, key, condition))
+        return rendered
+
+    def _render(self, query, table, and_shape, or_shape, search_shape, sortby, sort_order, rows, keyset_shape):
+        statement = query + " where 1=1"
+
+        and_query = " and ".join(self._render_conditions(table, and_shape))
+
+        or_query = []
+        for key_shape in or_shape:
+            or_query.append(" and ".join(self._render_conditions(table, (key_shape,))))
+        if search_shape and search_shape[0] == "match":
+            keys, search_index = search_shape[1], search_shape[2]
+            or_query.append("({}) IN (SELECT {} FROM {} WHERE {} MATCH ?)".format(
+                ", ".join("{}.{}".format(table, k) for k in keys), ", ".join(keys), search_index, search_index
+            ))
+        elif search_shape:
+            or_query.extend(
+                "{}.{} LIKE ? ESCAPE '{}'".format(table, col, LIKE_ESCAPE_CHAR) for col in search_shape[1]
+            )
+        or_query_total = " or ".join("({})".format(q) for q in or_query)
+
+        seek_query = None
+        if keyset_shape and keyset_shape[1]:
+            keyset_columns = ["{}.{}".format(table, col) for col in keyset_shape[0][:keyset_shape[1]]]
+            seek_query = "{} {}= ? and ({}) {} ({})".format(
+                keyset_columns[0],
+                ">" if sort_order == "asc" else "<",
+                ", ".join(keyset_columns),
+                ">" if sort_order == "asc" else "<",
+                ", ".join("?" * len(keyset_columns))
+            )
+
+        statement = " and ".join(filter(None, [statement, and_query, "({})".format(or_query_total) if or_query_total else None, seek_query]))
+
+        if keyset_shape:
+            statement += " ORDER BY {}".format(", ".join(
+                "{}.{} {}".format(table, col, sort_order) for col in keyset_shape[0]
+            ))
+            if rows is not None:
+                statement += " LIMIT {:d}".format(rows)
+            return statement + ";"
+
+        if sortby is not None or rows is not None:
+            sorting_expression = "ORDER BY {}".format(
+                ", ".join("{}.{} {}".format(table, col, sort_order) for col in sortby)) if sortby else "ORDER BY(SELECT NULL)"
+            statement += " {}".format(sorting_expression)
+        if rows is not None:
+            statement += " LIMIT {:d} OFFSET ?".format(rows)
+        return statement + ";"
@@ -0,0 +1,234 @@
+"""
+Aggregations over match data executed in SQL.
+Commonly used aggregates are precomputed per year into rollup tables: win/loss, set and game totals per player and
+odds statistics per bookmaker, both split by surface, series and round. Rollups of a year are rebuilt from the match
+table whenever the year is written, so leaderboard queries read a few rows per player instead of whole years
+"""
+
+import time
+import logging
+
+from utils.db.matches import MATCHES_TABLE
+from utils.db.generations import bump_generations
+from utils.db.schema import get_column_types
+from utils.db.frames import frame_from_cursor
+
+PLAYERS_ROLLUP = "rollup_players"
+ODDS_ROLLUP = "rollup_odds"
+
+DIMENSIONS = ["Year", "Surface", "Series", "Round"]
+BOOKMAKERS = ["B365", "EX", "LB", "PS", "SJ", "Max", "Avg"]
+
+# metric name: SQL expression over rollup table
+PLAYER_METRICS = {
+    "Matches": "SUM(Matches)",
+    "Wins": "SUM(Wins)",
+    "Losses": "SUM(Losses)",
+    "WinRate": "ROUND(1.0 * SUM(Wins) / SUM(Matches), 4)",
+    "SetsWon": "SUM(SetsWon)",
+    "SetsLost": "SUM(SetsLost)",
+    "GamesWon": "SUM(GamesWon)",
+    "GamesLost": "SUM(GamesLost)",
+}
+ODDS_METRICS = {
+    "Matches": "SUM(Matches)",
+    "MeanWinnerOdds": "ROUND(SUM(WinnerOddsSum) / SUM(WinnerOddsCount), 4)",
+    "MaxWinnerOdds": "MAX(WinnerOddsMax)",
+    "MeanLoserOdds": "ROUND(SUM(LoserOddsSum) / SUM(LoserOddsCount), 4)",
+    "MaxLoserOdds": "MAX(LoserOddsMax)",
+}
+# functions accepted by ad hoc aggregation over match table
+AGGREGATE_FUNCTIONS = {"count": "COUNT", "sum": "SUM", "mean": "AVG", "min": "MIN", "max": "MAX"}
+
+# odds columns of match table, missing odds are stored as 0 by preprocessing
+ODDS_COLUMNS = [bookmaker + side for bookmaker in BOOKMAKERS for side in ("W", "L")]
+
+GAMES = " + ".join("COALESCE({{side}}{}, 0)".format(i) for i in range(1, 6))
+
+
+def odds_value(column, alias=None):
+    """
+    Render SQL expression of odds column with missing odds (stored as 0) as NULL, so they are skipped by aggregates
+    """
+    return "NULLIF({}{}, 0)".format("{}.".format(alias) if alias else "", column)
+
+
+def _year_condition(years):
+    if years is None:
+        return "1=1", []
+    return "Year IN ({})".format(", ".join("?" * len(years))), list(years)
+
+
+def _refresh_statements(years):
+    """
+    Render statements rebuilding rollups of the years
+    :return:                list of (statement, parameters)
+    """
+    condition, params = _year_condition(years)
+    player_side = (
+        "SELECT Year, {player} AS Player, Surface, Series, Round, {win} AS Win, {own}sets AS SetsWon, "
+        "{other}sets AS SetsLost, " + GAMES.replace("{side}", "{own}") + " AS GamesWon, " +
+        GAMES.replace("{side}", "{other}") + " AS GamesLost FROM " + MATCHES_TABLE +
+        " WHERE " + condition + " AND {player} IS NOT NULL"
+    )
+    players = (
+        "INSERT INTO " + PLAYERS_ROLLUP + " (Year, Player, Surface, Series, Round, Matches, Wins, Losses, SetsWon, "
+        "SetsLost, GamesWon, GamesLost) "
+        "SELECT Year, Player, Surface, Series, Round, COUNT(*), SUM(Win), COUNT(*) - SUM(Win), SUM(SetsWon), "
+        "SUM(SetsLost), SUM(GamesWon), SUM(GamesLost) FROM (" +
+        player_side.format(player="Winner", win=1, own="W", other="L") + " UNION ALL " +
+        player_side.format(player="Loser", win=0, own="L", other="W") +
+        ") GROUP BY Year, Player, Surface, Series, Round;"
+    )
+    odds = (
+        "INSERT INTO " + ODDS_ROLLUP + " (Year, Bookmaker, Surface, Series, Round, Matches, WinnerOddsSum, "
+        "WinnerOddsCount, WinnerOddsMax, LoserOddsSum, LoserOddsCount, LoserOddsMax) " +
+        " UNION ALL ".join(
+            "SELECT Year, '{b}', Surface, Series, Round, COUNT(COALESCE({w}, {l})), SUM({w}), COUNT({w}), MAX({w}), "
+            "SUM({l}), COUNT({l}), MAX({l}) FROM {matches} WHERE {condition} AND COALESCE({w}, {l}) IS NOT NULL "
+            "GROUP BY Year, Surface, Series, Round".format(
+                b=b, w=odds_value(b + "W"), l=odds_value(b + "L"), matches=MATCHES_TABLE, condition=condition)
+            for b in BOOKMAKERS
+        ) + ";"
+    )
+    return [
+        ("DELETE FROM {} WHERE {};".format(PLAYERS_ROLLUP, condition), params),
+        (players, params + params),
+        ("DELETE FROM {} WHERE {};".format(ODDS_ROLLUP, condition), params),
+        (odds, params * len(BOOKMAKERS)),
+    ]
+
+
+def refresh_rollups(db_connector, years=None):
+    """
+    Rebuild rollups of the years from match table in a single transaction
+    :param db_connector:    DBConnector object
+    :param years:           iterable of years, all years are rebuilt if None
+    """
+    years = None if years is None else sorted(set(int(y) for y in years))
+    if years is not None and not years:
+        return
+    connection = db_connector.write_connection
+    cursor = connection.cursor()
+    t1 = time.time()
+    try:
+        for statement, params in _refresh_statements(years):
+            cursor.execute(statement, params)
+        bump_generations(cursor, years)
+        connection.commit()
+    except Exception as e:
+        connection.rollback()
+        logging.error("Exception during refresh of rollups for years {}. Error message: {}".format(years, e))
+        raise
+    finally:
+        cursor.close()
+    logging.info("Rollups of years {} were refreshed in {:.3f} seconds".format(
+        "all" if years is None else years, time.time() - t1))
+
+
+def create_rollup_tables(db_connector, structure):
+    """
+    Create rollup tables declared in schema file and fill them with already stored data
+    :param db_connector:    DBConnector object
+    :param structure:       schema file content
+    """
+    db_connector._create_table(PLAYERS_ROLLUP, structure[PLAYERS_ROLLUP])
+    db_connector._create_table(ODDS_ROLLUP, structure[ODDS_ROLLUP])
+    refresh_rollups(db_connector)
+    logging.info("DB initialisation: rollup tables {} and {} were filled".format(PLAYERS_ROLLUP, ODDS_ROLLUP))
+
+
+def _check_names(names, allowed, kind):
+    for name in names:
+        if name not in allowed:
+            raise ValueError("Invalid {}: {}. Allowed values: {}".format(kind, name, ", ".join(allowed)))
+
+
+def _query(db_connector, query, params):
+    cursor = db_connector.connection.cursor()
+    try:
+        cursor.execute(query, params)
+        return frame_from_cursor(cursor, get_column_types())
+    finally:
+        cursor.close()
+
+
+def _aggregate(db_connector, query_builder, table, keys, metrics, order_by, limit, filters):
+    """
+    Render and execute grouped query: SELECT keys, metrics FROM table WHERE filters GROUP BY keys ORDER BY metric
+    """
+    select = ", ".join(keys + ["{} AS {}".format(expression, name) for name, expression in metrics.items()])
+    statement, params = query_builder.build("SELECT {} FROM {} AS t".format(select, table), table="t", **filters)
+    statement = statement.rstrip(";")
+    if keys:
+        statement += " GROUP BY {}".format(", ".join(keys))
+    if order_by:
+        descending = order_by.startswith("-")
+        order_by = order_by.lstrip("-")
+        _check_names([order_by], list(metrics) + keys, "order field")
+        statement += " ORDER BY {} {}".format(order_by, "DESC" if descending else "ASC")
+    if limit is not None:
+        statement += " LIMIT {:d}".format(int(limit))
+    t1 = time.time()
+    data = _query(db_connector, statement + ";", params)
+    logging.info("Aggregation over {} returned {} rows in {:.3f} seconds".format(table, len(data), time.time() - t1))
+    return data
+
+
+def get_player_stats(db_connector, query_builder, group_by=(), order_by="-Wins", limit=100, **filters):
+    """
+    Win/loss, set and game totals per player from rollup table
+    :param db_connector:    DBConnector object
+    :param query_builder:   QueryBuilder object used to render filters
+    :param group_by:        additional grouping fields from `DIMENSIONS`
+    :param order_by:        metric or grouping field, `-` prefix for descending order
+    :param limit:           maximum number of rows, all rows if None
+    :param filters:         `and_filters` and `or_filters` over `Player` and `DIMENSIONS`
+    :return:                DataFrame
+    """
+    group_by = list(group_by)
+    _check_names(group_by, DIMENSIONS, "grouping field")
+    return _aggregate(db_connector, query_builder, PLAYERS_ROLLUP, ["Player"] + group_by, PLAYER_METRICS,
+                      order_by, limit, filters)
+
+
+def get_odds_stats(db_connector, query_builder, group_by=(), order_by="Bookmaker", limit=None, **filters):
+    """
+    Mean and max odds of winners and losers per bookmaker from rollup table
+    :param group_by:        additional grouping fields from `DIMENSIONS`
+    :param filters:         `and_filters` and `or_filters` over `Bookmaker` and `DIMENSIONS`
+    Other parameters are the same as for `get_player_stats`
+    :return:                DataFrame
+    """
+    group_by = list(group_by)
+    _check_names(group_by, DIMENSIONS, "grouping field")
+    return _aggregate(db_connector, query_builder, ODDS_ROLLUP, ["Bookmaker"] + group_by, ODDS_METRICS,
+                      order_by, limit, filters)
+
+
+def get_match_aggregates(db_connector, query_builder, group_by, metrics, allowed_fields, order_by=None, limit=None,
+                         **filters):
+    """
+    Ad hoc aggregation over match table
+    :param group_by:        grouping fields from `allowed_fields`
+    :param metrics:         list of `function:field` strings, e.g. `mean:B365W`, `count` counts rows.
+                            Missing odds are not counted by aggregates of odds fields
+    :param allowed_fields:  fields allowed for grouping and aggregation
+    Other parameters are the same as for `get_player_stats`
+    :return:                DataFrame
+    """
+    group_by = list(group_by)
+    _check_names(group_by, allowed_fields, "grouping field")
+    expressions = {}
+    for metric in metrics or ["count"]:
+        function, _, field = metric.partition(":")
+        _check_names([function], list(AGGREGATE_FUNCTIONS), "aggregate function")
+        if field:
+            _check_names([field], allowed_fields, "aggregated field")
+            value = odds_value(field, "t") if field in ODDS_COLUMNS else "t.{}".format(field)
+            expressions["{}_{}".format(function, field)] = "{}({})".format(AGGREGATE_FUNCTIONS[function], value)
+        elif function == "count":
+            expressions["count"] = "COUNT(*)"
+        else:
+            raise ValueError("Aggregate function {} requires a field, e.g. {}:B365W".format(function, function))
+    return _aggregate(db_connector, query_builder, MATCHES_TABLE, group_by, expressions, order_by, limit, filters)
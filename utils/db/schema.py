@@ -0,0 +1,63 @@
+"""
+Helpers for reading database schema file
+"""
+
+import os
+import re
+import json
+import functools
+
+from config import config
+
+NUMERIC_TYPES = ("INT", "SMALLINT", "INTEGER", "BIGINT", "DECIMAL", "FLOAT", "REAL", "NUMERIC")
+DATE_TYPES = ("DATE", "DATETIME")
+
+
+@functools.lru_cache(maxsize=None)
+def load_db_schema(schema_file=None):
+    """
+    Load and cache database schema file
+    :param schema_file:     path to schema file, default is taken from configuration
+    :return:                dictionary with schema definition
+    """
+    schema_file = schema_file or config["db"]["db_schema"]
+    if not os.path.exists(schema_file):
+        raise Exception("DB initialisation: No db_schema specified")
+    with open(schema_file, "r") as f:
+        return json.load(f)
+
+
+@functools.lru_cache(maxsize=None)
+def get_column_types(schema_file=None):
+    """
+    Get SQL type of every column declared in schema file.
+    If the same column is declared in multiple tables, the first declaration is used
+    :param schema_file:     path to schema file, default is taken from configuration
+    :return:                dictionary {column name: SQL type without size, e.g. `DECIMAL`}
+    """
+    column_types = {}
+    for table, fields in load_db_schema(schema_file).items():
+        if not isinstance(fields, list):
+            continue
+        for field in fields:
+            if not isinstance(field, str):
+                continue
+            match = re.match(r"^(\w+)\s+(\w+)", field)
+            if not match or match.group(1).upper() in ("PRIMARY", "FOREIGN", "UNIQUE", "CHECK", "CONSTRAINT"):
+                continue
+            column_types.setdefault(match.group(1), match.group(2).upper())
+    return column_types
+
+
+def get_numeric_columns(schema_file=None):
+    """
+    Get columns with numeric SQL type
+    """
+    return [k for k, v in get_column_types(schema_file).items() if v in NUMERIC_TYPES]
+
+
+def get_date_columns(schema_file=None):
+    """
+    Get columns with date SQL type
+    """
+    return [k for k, v in get_column_types(schema_file).items() if v in DATE_TYPES]
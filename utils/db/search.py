@@ -0,0 +1,109 @@
+"""
+SQLite FTS5 full-text index for global search.
+Index contains one row per row of match table (rowid is the same as in match table) with search fields of the match
+and its tournament, so tournaments without results are found as well. Player ids are stored as unindexed key columns.
+Index is kept in sync with match table by triggers, which fire from the match table triggers, so every import, upload
+and delete (including cascade deletes) updates it in the same transaction
+"""
+
+import re
+import logging
+
+import config as c
+from utils.db.players import PLAYER_ID_COLUMNS
+from utils.db.matches import MATCHES_TABLE
+
+SEARCH_TABLE = "tournaments_search"
+
+RESULTS_SEARCH_FIELDS = ["Winner", "Loser", "Round", "Comment"]
+TOURNAMENTS_SEARCH_FIELDS = ["Tournament", "Location", "Series", "Court", "Surface"]
+# key columns stored in index to match rows of results and bets tables
+KEY_FIELDS = ["ATP"] + list(PLAYER_ID_COLUMNS.values())
+
+TOKEN_REGEX = re.compile(r"\w+", re.UNICODE)
+
+
+def build_match_expression(search_value, search_columns=None):
+    """
+    Convert search phrase into FTS5 MATCH expression: every word of the phrase must match a prefix of a token
+    :param search_value:    search phrase
+    :param search_columns:  columns to search in, all indexed columns if None
+    :return:                MATCH expression or None if phrase does not contain any words
+    """
+    tokens = TOKEN_REGEX.findall(str(search_value))
+    if not tokens:
+        return None
+    expression = " ".join('"{}"*'.format(token) for token in tokens)
+    if search_columns is not None and set(search_columns) != set(c.SEARCH_FIELDS):
+        expression = "{{{}}} : ({})".format(" ".join(search_columns), expression)
+    return expression
+
+
+def search_index_exists(db_connector):
+    """
+    Check if full-text index table exists in database
+    """
+    cursor = db_connector.connection.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?;", [SEARCH_TABLE])
+    exists = cursor.fetchone() is not None
+    cursor.close()
+    return exists
+
+
+def drop_search_index(db_connector):
+    """
+    Drop full-text index with its synchronization triggers, e.g. before it is rebuilt by schema upgrade
+    :param db_connector:    DBConnector object
+    """
+    cursor = db_connector.connection.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name GLOB ?;", [SEARCH_TABLE + "_*"])
+    triggers = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    for trigger in triggers:
+        db_connector._execute_single_query("DROP TRIGGER IF EXISTS {};".format(trigger))
+    db_connector._execute_single_query("DROP TABLE IF EXISTS {};".format(SEARCH_TABLE))
+
+
+def create_search_index(db_connector):
+    """
+    Create full-text index with synchronization triggers and fill it with existing data.
+    Index is not created if SQLite is built without FTS5 extension, global search falls back to LIKE in this case
+    :param db_connector:    DBConnector object
+    :return:                True if index exists
+    """
+    if search_index_exists(db_connector):
+        return True
+
+    fields = TOURNAMENTS_SEARCH_FIELDS + ["Year"] + RESULTS_SEARCH_FIELDS
+    try:
+        db_connector._execute_single_query(
+            "CREATE VIRTUAL TABLE {} USING fts5({}, {}, tokenize = 'unicode61');".format(
+                SEARCH_TABLE, ", ".join(f + " UNINDEXED" for f in KEY_FIELDS), ", ".join(fields))
+        )
+    except Exception as e:
+        logging.warning("DB initialisation: full-text search is not available, LIKE search is used. Reason: {}".format(e))
+        return False
+
+    # match table already carries tournament fields and player names, so index rows are copies of its rows
+    columns = ", ".join(["rowid"] + KEY_FIELDS + fields)
+    db_connector._execute_single_query(
+        "INSERT INTO {search} ({columns}) SELECT {columns} FROM {matches};".format(
+            search=SEARCH_TABLE, columns=columns, matches=MATCHES_TABLE)
+    )
+
+    new_row = "INSERT INTO {search} (" + columns + ") VALUES (" + \
+              ", ".join("new." + f for f in ["rowid"] + KEY_FIELDS + fields) + ");"
+    # changes of bet columns do not touch the index
+    watched = ", ".join(KEY_FIELDS + fields)
+    triggers = [
+        "CREATE TRIGGER IF NOT EXISTS {search}_matches_insert AFTER INSERT ON {matches} BEGIN " + new_row + " END;",
+        "CREATE TRIGGER IF NOT EXISTS {search}_matches_delete AFTER DELETE ON {matches} BEGIN "
+        "DELETE FROM {search} WHERE rowid = old.rowid; END;",
+        "CREATE TRIGGER IF NOT EXISTS {search}_matches_update AFTER UPDATE OF " + watched + " ON {matches} BEGIN "
+        "DELETE FROM {search} WHERE rowid = old.rowid; " + new_row + " END;",
+    ]
+    for trigger in triggers:
+        db_connector._execute_single_query(trigger.format(search=SEARCH_TABLE, matches=MATCHES_TABLE))
+
+    logging.info("DB initialisation: full-text search index {} was created".format(SEARCH_TABLE))
+    return True
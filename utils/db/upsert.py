@@ -0,0 +1,138 @@
+"""
+Diff-based upsert of yearly data.
+Every stored row carries a hash of its non-key values (`RowHash` column). Incoming rows are hashed the same way and
+compared with stored hashes by primary key, so only new rows are inserted, only changed rows are updated and,
+optionally, rows that vanished from the source are deleted
+"""
+
+import time
+import logging
+import numpy as np
+import pandas as pd
+
+import config as c
+from utils.db.players import db_keys, intern_frames
+from utils.db.generations import bump_generations
+
+HASH_COLUMN = "RowHash"
+
+# tables are written in foreign key order
+TABLE_ORDER = ["tournaments", "results", "bets"]
+
+
+def row_hashes(df):
+    """
+    Calculate hash of non-key values of every row
+    :param df:                  DataFrame indexed by primary key
+    :return:                    array of signed 64-bit hashes (SQLite integers are signed)
+    """
+    values = df.drop(columns=[HASH_COLUMN], errors="ignore").reset_index(drop=True)
+    return pd.util.hash_pandas_object(values, index=False).to_numpy().view(np.int64)
+
+
+def _load_stored_hashes(cursor, table, keys, years):
+    query = "SELECT {keys}, {hash} FROM {table} WHERE Year IN ({years});".format(
+        keys=", ".join(keys), hash=HASH_COLUMN, table=table, years=", ".join("?" * len(years)))
+    cursor.execute(query, years)
+    rows = cursor.fetchall()
+    stored = pd.DataFrame.from_records([tuple(r) for r in rows], columns=keys + [HASH_COLUMN])
+    return stored
+
+
+def _diff(df, stored, keys):
+    """
+    Compare incoming rows with stored hashes
+    :return:                    tuple (new rows, changed rows, keys of vanished rows, number of unchanged rows)
+    """
+    incoming = df.reset_index()
+    incoming[HASH_COLUMN] = row_hashes(df)
+    if stored.empty:
+        return incoming, incoming.iloc[0:0], stored[keys], 0
+
+    # keys read from database may have other dtypes than incoming data
+    for key in keys:
+        stored[key] = stored[key].astype(incoming[key].dtype)
+    merged = incoming[keys + [HASH_COLUMN]].merge(
+        stored, on=keys, how="outer", suffixes=("", "_stored"), indicator=True)
+
+    new_mask = (merged["_merge"] == "left_only").to_numpy()
+    both = merged["_merge"] == "both"
+    changed_mask = (both & (merged[HASH_COLUMN] != merged[HASH_COLUMN + "_stored"])).to_numpy()
+    vanished = merged.loc[merged["_merge"] == "right_only", keys]
+
+    incoming_keys = merged.loc[new_mask | changed_mask, keys + ["_merge"]]
+    selected = incoming.merge(incoming_keys, on=keys, how="inner")
+    new = selected[selected["_merge"] == "left_only"].drop(columns="_merge")
+    changed = selected[selected["_merge"] == "both"].drop(columns="_merge")
+    return new, changed, vanished, int(both.sum()) - len(changed)
+
+
+def upsert_frames(db_connector, frames, years, delete_missing=False):
+    """
+    Write yearly data in a single transaction, touching only new, changed and, optionally, vanished rows.
+    Player names in keys are interned into player ids in the same transaction
+    :param db_connector:        DBConnector object
+    :param frames:              dictionary {table key as in `DBConnector.tables`: DataFrame indexed by primary key}
+    :param years:               years covered by frames, stored rows of other years are not compared or deleted
+    :param delete_missing:      delete stored rows of the years which are not present in frames
+    :return:                    dictionary {table key: {"inserted", "updated", "deleted", "unchanged": number of rows}}
+    """
+    years = [int(y) for y in years]
+    report = {}
+    connection = db_connector.write_connection
+    cursor = connection.cursor()
+    t1 = time.time()
+    try:
+        frames = intern_frames(cursor, frames)
+        diffs = {}
+        for table in TABLE_ORDER:
+            if table not in frames:
+                continue
+            keys = db_keys(c.PRIMARY_KEYS[table])
+            stored = _load_stored_hashes(cursor, db_connector.tables[table], keys, years)
+            diffs[table] = _diff(frames[table], stored, keys)
+
+        # dependent rows are deleted before their tournaments, new tournaments are inserted before dependent rows
+        if delete_missing:
+            for table in reversed(TABLE_ORDER):
+                if table in diffs and not diffs[table][2].empty:
+                    keys = db_keys(c.PRIMARY_KEYS[table])
+                    cursor.executemany("DELETE FROM {} WHERE {};".format(
+                        db_connector.tables[table], " AND ".join("{} = ?".format(k) for k in keys)), db_connector.row_values(diffs[table][2]))
+
+        for table in TABLE_ORDER:
+            if table not in diffs:
+                continue
+            keys = db_keys(c.PRIMARY_KEYS[table])
+            new, changed, vanished, unchanged = diffs[table]
+            if not new.empty:
+                columns = new.columns.tolist()
+                cursor.executemany("INSERT INTO {} ({}) VALUES ({});".format(
+                    db_connector.tables[table], ", ".join(columns), ", ".join("?" * len(columns))), db_connector.row_values(new))
+            if not changed.empty:
+                values = [col for col in changed.columns if col not in keys]
+                cursor.executemany("UPDATE {} SET {} WHERE {};".format(
+                    db_connector.tables[table],
+                    ", ".join("{} = ?".format(col) for col in values),
+                    " AND ".join("{} = ?".format(k) for k in keys)), db_connector.row_values(changed[values + keys]))
+            report[table] = {
+                "inserted": len(new),
+                "updated": len(changed),
+                "deleted": len(vanished) if delete_missing else 0,
+                "unchanged": unchanged
+            }
+        if any(r["inserted"] or r["updated"] or r["deleted"] for r in report.values()):
+            bump_generations(cursor, years)
+        connection.commit()
+    except Exception as e:
+        connection.rollback()
+        logging.error("Exception during upsert of years {}. Error message: {}".format(years, e))
+        raise
+    finally:
+        cursor.close()
+
+    elapsed = time.time() - t1
+    written = sum(r["inserted"] + r["updated"] + r["deleted"] for r in report.values())
+    logging.info("Upsert of years {} took {:.2f} seconds ({:.0f} written rows/s): {}".format(
+        years, elapsed, written / max(elapsed, 1e-9), report))
+    return report
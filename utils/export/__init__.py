@@ -0,0 +1 @@
+from .writers import EXPORT_FORMATS, write_ndjson, write_json_array, write_csv
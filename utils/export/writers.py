@@ -0,0 +1,81 @@
+"""
+Streaming writers converting chunks of database rows into text formats
+"""
+
+import io
+import csv
+import json
+import datetime
+import decimal
+
+
+def _default(value):
+    """
+    Convert values not supported by json module
+    """
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def _dump_row(names, row):
+    return json.dumps(dict(zip(names, row)), default=_default, ensure_ascii=False)
+
+
+def write_ndjson(chunks):
+    """
+    Write one JSON object per line
+    :param chunks:          iterable of (column names, list of row tuples)
+    :return:                generator of strings
+    """
+    for names, rows in chunks:
+        yield "".join(_dump_row(names, row) + "\n" for row in rows)
+
+
+def write_json_array(chunks):
+    """
+    Write JSON array of objects
+    :param chunks:          iterable of (column names, list of row tuples)
+    :return:                generator of strings
+    """
+    # opening bracket is sent before the first chunk is fetched
+    yield "["
+    first = True
+    for names, rows in chunks:
+        if not rows:
+            continue
+        body = ",\n".join(_dump_row(names, row) for row in rows)
+        yield body if first else ",\n" + body
+        first = False
+    yield "]"
+
+
+def write_csv(chunks):
+    """
+    Write CSV with header
+    :param chunks:          iterable of (column names, list of row tuples)
+    :return:                generator of strings
+    """
+    header_written = False
+    for names, rows in chunks:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if not header_written:
+            writer.writerow(names)
+            header_written = True
+        writer.writerows(
+            [v.isoformat() if isinstance(v, (datetime.date, datetime.datetime)) else v for v in row] for row in rows
+        )
+        yield buffer.getvalue()
+
+
+# format name: (writer, mimetype, file extension)
+EXPORT_FORMATS = {
+    "json": (write_json_array, "application/json", "json"),
+    "ndjson": (write_ndjson, "application/x-ndjson", "ndjson"),
+    "csv": (write_csv, "text/csv", "csv"),
+}
@@ -1,7 +1,8 @@
 import re
 import json
 import logging
-from dateutil.parser import parse
+
+from utils.validation import get_schema_validator
 
 def replace_symbols(values, to_replace, with_replace):
     if isinstance(values, str):
@@ -13,57 +14,24 @@ def replace_symbols(values, to_replace, with_replace):
     else:
         return values
 
-def validate_data_for_sql_query(data):
+def decode_url_symbols(data):
 
-    # Replace special URL and SQL symbols
-    data = replace_symbols(data, "'", "''")
+    # Replace special URL symbols
     data = replace_symbols(data, "amp26", "&")
     data = replace_symbols(data, "hash23", "#")
-    data = replace_symbols(data, "%", "[%]")
 
     return data
 
-def validate_input_json(data):
-
-    def is_date(string, fuzzy=False):
-        """
-        Return whether the string can be interpreted as a date.
-        :param string: str, string to check for date
-        :param fuzzy: bool, ignore unknown tokens in string if True
-         """
-        try: 
-            parse(string, fuzzy=fuzzy)
-            return True
-        except ValueError:
-            return False
+def escape_like_pattern(value, escape_char="\\"):
 
-    def is_float(string):
-        """
-        Return whether the string can be converted to float.
-        :param string: str, string to check for float
-        """
-        try:
-            float(string)
-            return True
-        except ValueError:
-            return False
-                
-    numeric_fields = ["ATP", "Best of", "WRank", "LRank", "WPts", "LPts", "W1", "L1", "W2", "L2",  "W3", "L3", "W4", "L4", "W5", "L5", "Wsets", "Lsets"]
+    # Escape LIKE wildcards so that value is matched literally
+    value = value.replace(escape_char, escape_char * 2)
+    value = value.replace("%", escape_char + "%")
+    value = value.replace("_", escape_char + "_")
 
-    for f in numeric_fields:
-        val = data.get(f)
-        if val and not isinstance(val, int) and not val.isnumeric():
-            return False
+    return value
 
-    decimal_fields = ["B365W", "B365L", "EXW", "EXL", "LBW", "LBL", "PSW", "PSL", "SJW", "SJL", "MaxW", "MaxL", "AvgW", "AvgL"]
-
-    for f in decimal_fields:
-        val = data.get(f)
-        if val and not isinstance(val, float) and not is_float(val):
-            return False
+def validate_input_json(data):
 
-    date = data.get("date")
-    if date and not is_date(date):
-        return False
-    
-    return True
\ No newline at end of file
+    # Validate a single record against database schema, scalar rules avoid building a one-row DataFrame
+    return not get_schema_validator().validate_record(data)
@@ -0,0 +1,199 @@
+"""
+Background jobs for long-running requests.
+Jobs are executed on a bounded thread pool separate from request handling threads, so a slow job never delays other
+requests. Every job is registered under a set of keys (e.g. imported years) and at most one job per key can be in flight
+"""
+
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATUSES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside a job when cancellation was requested
+    """
+
+
+class JobConflict(Exception):
+    """
+    Raised when a job overlaps with keys of another in-flight job
+    """
+    def __init__(self, job):
+        super().__init__("Job {} is already in progress for {}".format(job.id, sorted(job.keys)))
+        self.job = job
+
+
+class Job:
+    """
+    Implements state of a single background job.
+    Job function receives the job object to report progress and check for cancellation
+    """
+    def __init__(self, name, keys):
+        """
+        :param name:                        human readable job name
+        :param keys:                        set of keys locked by the job
+        """
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.keys = frozenset(keys)
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.future = None
+        self._cancel_event = threading.Event()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel_event.is_set()
+
+    def set_progress(self, progress, message=None):
+        """
+        Report job progress
+        :param progress:                    fraction of work done, from 0 to 1
+        :param message:                     optional description of the current stage
+        """
+        self.progress = min(max(float(progress), 0.0), 1.0)
+        if message is not None:
+            self.message = message
+
+    def check_cancelled(self):
+        """
+        Stop job execution if cancellation was requested.
+        Cancellation is cooperative, so jobs call this method between stages
+        """
+        if self._cancel_event.is_set():
+            raise JobCancelled("Job {} was cancelled".format(self.id))
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "keys": sorted(self.keys),
+            "status": self.status,
+            "progress": round(self.progress, 4),
+            "message": self.message,
+            "result": self.result,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class JobManager:
+    """
+    Implements thread pool of background jobs with per-key deduplication
+    """
+    def __init__(self, max_workers=2, max_finished=100):
+        """
+        :param max_workers:                 number of jobs executed concurrently
+        :param max_finished:                number of finished jobs kept for status requests
+        """
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, name, keys, func, *args, **kwargs):
+        """
+        Submit job unless a job with the same keys is already in flight
+        :param name:                        human readable job name
+        :param keys:                        iterable of keys locked by the job
+        :param func:                        job function called as `func(job, *args, **kwargs)`, its return value is
+                                            stored as job result
+        :return:                            tuple (job, True if the job was created or False if the same job is in flight)
+        :raises JobConflict:                if keys partially overlap with keys of an in-flight job
+        """
+        keys = frozenset(keys)
+        with self._lock:
+            for job in self._jobs.values():
+                if job.status in FINISHED_STATUSES or not job.keys & keys:
+                    continue
+                if job.keys == keys:
+                    logging.info("Job {} for {} is already in flight".format(job.id, sorted(keys)))
+                    return job, False
+                raise JobConflict(job)
+
+            job = Job(name, keys)
+            self._jobs[job.id] = job
+            self._evict_finished()
+            job.future = self._executor.submit(self._run, job, func, *args, **kwargs)
+        logging.info("Job {} ({}) submitted".format(job.id, name))
+        return job, True
+
+    def _run(self, job, func, *args, **kwargs):
+        if job.cancel_requested:
+            job.status = CANCELLED
+            job.finished = time.time()
+            return
+        job.status = RUNNING
+        job.started = time.time()
+        try:
+            job.result = func(job, *args, **kwargs)
+            job.status = SUCCEEDED
+            job.set_progress(1.0)
+        except JobCancelled as e:
+            job.status = CANCELLED
+            job.message = str(e)
+        except Exception as e:
+            logging.error("Job {} ({}) failed with exception {}".format(job.id, job.name, e))
+            job.status = FAILED
+            job.error = str(e)
+        finally:
+            job.finished = time.time()
+        logging.info("Job {} ({}) {} in {:.2f} seconds".format(job.id, job.name, job.status, job.finished - job.started))
+
+    def _evict_finished(self):
+        finished = [job for job in self._jobs.values() if job.status in FINISHED_STATUSES]
+        for job in sorted(finished, key=lambda j: j.finished)[:max(len(finished) - self.max_finished, 0)]:
+            del self._jobs[job.id]
+
+    def get(self, job_id):
+        """
+        Get job by id
+        :return:                            Job object or None
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        """
+        Get all known jobs from the newest to the oldest
+        """
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda j: j.created, reverse=True)
+
+    def cancel(self, job_id):
+        """
+        Request job cancellation. Queued jobs are cancelled at once, running jobs stop at the next stage
+        :return:                            Job object or None if job is unknown
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED_STATUSES:
+                return job
+            job._cancel_event.set()
+            if job.future.cancel():
+                job.status = CANCELLED
+                job.finished = time.time()
+        logging.info("Job {} cancellation requested".format(job_id))
+        return job
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,5 @@
+from .events import LiveEvent, ACTION, WEATHER, DROPPED
+from .fanout import Hub, Subscriber, POLICIES, DROP_OLDEST, DROP_NEWEST, COALESCE
+from .sources import ActionFeed, WeatherPoller, MatchStream
+from .service import create_app
+from .weather import WeatherClient, LocationResolver, load_locations
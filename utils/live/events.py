@@ -0,0 +1,63 @@
+"""
+Events of live match streams.
+An event is serialized once when it is published, so fan-out to thousands of subscribers only copies references to the
+same encoded websocket and SSE payloads
+"""
+
+import json
+import time
+
+ACTION = "action"
+WEATHER = "weather"
+# sent to a subscriber after events were dropped from its buffer
+DROPPED = "dropped"
+
+
+class LiveEvent:
+    """
+    Implements a single event of a match stream
+    """
+    __slots__ = ("match_id", "type", "data", "time", "seq", "_payload", "_sse")
+
+    def __init__(self, match_id, event_type, data, event_time=None, seq=None):
+        """
+        :param match_id:                    match identifier
+        :param event_type:                  `ACTION`, `WEATHER` or `DROPPED`
+        :param data:                        JSON-serializable event data
+        :param event_time:                  unix time of the event, current time if None
+        :param seq:                         sequence number within the match stream, assigned on publishing
+        """
+        self.match_id = match_id
+        self.type = event_type
+        self.data = data
+        self.time = time.time() if event_time is None else event_time
+        self.seq = seq
+        self._payload = None
+        self._sse = None
+
+    def to_dict(self):
+        return {"match_id": self.match_id, "type": self.type, "seq": self.seq, "time": self.time, "data": self.data}
+
+    @property
+    def payload(self):
+        """
+        JSON text of the event, used as websocket message
+        """
+        if self._payload is None:
+            self._payload = json.dumps(self.to_dict(), default=str)
+        return self._payload
+
+    @property
+    def sse(self):
+        """
+        Event encoded as Server-Sent Events message
+        """
+        if self._sse is None:
+            message = "event: {}\ndata: {}\n\n".format(self.type, self.payload)
+            if self.seq is not None:
+                message = "id: {}\n".format(self.seq) + message
+            self._sse = message.encode("utf-8")
+        return self._sse
+
+    def __repr__(self):
+        return "LiveEvent(match_id={}, type={}, seq={})".format(self.match_id, self.type, self.seq)
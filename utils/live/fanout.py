@@ -0,0 +1,226 @@
+"""
+Fan-out of match streams to subscribers.
+Every subscriber owns a bounded buffer, publishing only appends to buffers and never waits for a subscriber, so a slow
+client can only lose its own events and never delays the match stream or other clients. Overflow is handled by the
+policy chosen by subscriber:
+    - `drop_oldest`: the oldest buffered event is discarded
+    - `drop_newest`: the incoming event is discarded
+    - `coalesce`: a buffered weather reading is replaced by the newer one, otherwise as `drop_oldest`
+Subscriber is notified with a `dropped` event about the number of lost events, sequence numbers of events show the gaps
+"""
+
+import asyncio
+import logging
+import collections
+
+from utils.live.events import LiveEvent, WEATHER, DROPPED
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+COALESCE = "coalesce"
+POLICIES = (DROP_OLDEST, DROP_NEWEST, COALESCE)
+
+
+class Subscriber:
+    """
+    Implements bounded event buffer of a single client
+    """
+    def __init__(self, match_id, buffer_size=256, policy=COALESCE):
+        """
+        :param match_id:                    match identifier
+        :param buffer_size:                 maximum number of buffered events
+        :param policy:                      overflow policy, one of `POLICIES`
+        """
+        if policy not in POLICIES:
+            raise ValueError("Invalid overflow policy: {}. Allowed values: {}".format(policy, ", ".join(POLICIES)))
+        if int(buffer_size) < 1:
+            raise ValueError("Buffer size must be positive: {}".format(buffer_size))
+        self.match_id = match_id
+        self.buffer_size = int(buffer_size)
+        self.policy = policy
+        self.buffer = collections.deque()
+        self.dropped = 0
+        self.delivered = 0
+        self.closed = False
+        self._not_reported = 0
+        self._wakeup = asyncio.Event()
+
+    def offer(self, event):
+        """
+        Add event to buffer without waiting, overflow policy is applied if buffer is full
+        :param event:                       LiveEvent object
+        """
+        if self.closed:
+            return
+        if self.policy == COALESCE and event.type == WEATHER:
+            for i, queued in enumerate(self.buffer):
+                if queued.type == WEATHER:
+                    # weather reading is a state, so outdated reading is replaced without loss
+                    del self.buffer[i]
+                    break
+        if len(self.buffer) >= self.buffer_size:
+            self._drop()
+            if self.policy == DROP_NEWEST:
+                return
+            self.buffer.popleft()
+        self.buffer.append(event)
+        self._wakeup.set()
+
+    def _drop(self):
+        self.dropped += 1
+        self._not_reported += 1
+
+    async def get(self):
+        """
+        Wait for the next event
+        :return:                            LiveEvent object or None if subscriber is closed and buffer is empty
+        """
+        while not self.buffer and not self._not_reported:
+            if self.closed:
+                return None
+            self._wakeup.clear()
+            await self._wakeup.wait()
+        if self._not_reported:
+            count, self._not_reported = self._not_reported, 0
+            return LiveEvent(self.match_id, DROPPED, {"count": count})
+        self.delivered += 1
+        return self.buffer.popleft()
+
+    def close(self):
+        """
+        Stop accepting events, already buffered events are still returned by `get`
+        """
+        self.closed = True
+        self._wakeup.set()
+
+    def to_dict(self):
+        return {"buffered": len(self.buffer), "buffer_size": self.buffer_size, "policy": self.policy,
+                "delivered": self.delivered, "dropped": self.dropped}
+
+
+class Channel:
+    """
+    Implements stream of a single match: numbers events and passes them to subscribers
+    """
+    def __init__(self, match_id):
+        self.match_id = match_id
+        self.subscribers = set()
+        self.seq = 0
+        self.last_weather = None
+        self.stream = None
+        self.idle_handle = None
+
+    def publish(self, event):
+        """
+        Assign sequence number to event and add it to buffers of all subscribers
+        :param event:                       LiveEvent object
+        """
+        self.seq += 1
+        event.seq = self.seq
+        if event.type == WEATHER:
+            self.last_weather = event
+        for subscriber in self.subscribers:
+            subscriber.offer(event)
+
+    def add(self, subscriber):
+        self.subscribers.add(subscriber)
+        # new subscriber gets current conditions without waiting for the next change
+        if self.last_weather is not None:
+            subscriber.offer(self.last_weather)
+
+
+class Hub:
+    """
+    Implements registry of match channels. Match stream is started with the first subscriber of a match and stopped
+    when match has no subscribers for `idle_timeout` seconds
+    """
+    def __init__(self, stream_factory, idle_timeout=30):
+        """
+        :param stream_factory:              function (match_id, publish) returning coroutine which publishes events of
+                                            a match by calling `publish(event)` until the match ends
+        :param idle_timeout:                seconds to keep match stream running without subscribers
+        """
+        self.stream_factory = stream_factory
+        self.idle_timeout = idle_timeout
+        self.channels = {}
+
+    def subscribe(self, match_id, buffer_size=256, policy=COALESCE):
+        """
+        Register subscriber of a match, match stream is started if it is not running
+        :return:                            Subscriber object
+        """
+        subscriber = Subscriber(match_id, buffer_size=buffer_size, policy=policy)
+        channel = self.channels.get(match_id)
+        if channel is None:
+            channel = self.channels[match_id] = Channel(match_id)
+        if channel.idle_handle is not None:
+            channel.idle_handle.cancel()
+            channel.idle_handle = None
+        channel.add(subscriber)
+        if channel.stream is None:
+            channel.stream = asyncio.ensure_future(self._run_stream(channel))
+            logging.info("Live: stream of match {} was started".format(match_id))
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        """
+        Remove subscriber, match stream is stopped after `idle_timeout` if it was the last subscriber
+        """
+        subscriber.close()
+        channel = self.channels.get(subscriber.match_id)
+        if channel is None or subscriber not in channel.subscribers:
+            return
+        channel.subscribers.discard(subscriber)
+        if not channel.subscribers and channel.idle_handle is None:
+            channel.idle_handle = asyncio.get_event_loop().call_later(self.idle_timeout, self._stop_idle, channel)
+
+    def _stop_idle(self, channel):
+        channel.idle_handle = None
+        if channel.subscribers or self.channels.get(channel.match_id) is not channel:
+            return
+        del self.channels[channel.match_id]
+        if channel.stream is not None:
+            channel.stream.cancel()
+        logging.info("Live: stream of match {} was stopped without subscribers".format(channel.match_id))
+
+    async def _run_stream(self, channel):
+        try:
+            await self.stream_factory(channel.match_id, channel.publish)
+            logging.info("Live: match {} has ended".format(channel.match_id))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error("Live: stream of match {} failed. Error message: {}".format(channel.match_id, e))
+        finally:
+            # subscribers receive buffered events and are disconnected, the next subscriber starts a new stream
+            if self.channels.get(channel.match_id) is channel:
+                del self.channels[channel.match_id]
+            if channel.idle_handle is not None:
+                channel.idle_handle.cancel()
+            for subscriber in channel.subscribers:
+                subscriber.close()
+
+    async def close(self):
+        """
+        Stop all match streams and close subscribers
+        """
+        streams = [channel.stream for channel in self.channels.values() if channel.stream is not None]
+        for stream in streams:
+            stream.cancel()
+        await asyncio.gather(*streams, return_exceptions=True)
+        self.channels = {}
+
+    def stats(self):
+        """
+        Statistics of running streams
+        :return:                            dictionary {match id: {"seq", "subscribers", "buffered", "dropped"}}
+        """
+        return {
+            match_id: {
+                "seq": channel.seq,
+                "subscribers": len(channel.subscribers),
+                "buffered": sum(len(s.buffer) for s in channel.subscribers),
+                "dropped": sum(s.dropped for s in channel.subscribers),
+            }
+            for match_id, channel in self.channels.items()
+        }
@@ -0,0 +1,160 @@
+"""
+Asyncio service of live match streams.
+Routes:
+    - `/live/{match_id}/ws`: websocket stream of events as JSON messages
+    - `/live/{match_id}/sse`: the same stream as Server-Sent Events
+    - `/live/stats`: running match streams, their subscribers and weather client statistics
+Stream routes accept `buffer` (number of buffered events) and `policy` (overflow policy) query parameters.
+Every client is served by its own task reading its own buffer, writes to a client are limited by `send_timeout`, so a
+stalled client is disconnected instead of holding memory
+"""
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+from aiohttp import web
+
+from config import config
+
+from utils.live.fanout import Hub, POLICIES
+from utils.live.sources import MatchStream
+from utils.live.weather import WeatherClient, LocationResolver
+
+
+def _subscription_params(request):
+    """
+    Read buffer size and overflow policy of a subscriber from query parameters
+    :return:                                tuple (buffer size, policy)
+    """
+    app = request.app
+    try:
+        buffer_size = int(request.query.get("buffer", app["buffer_size"]))
+    except ValueError:
+        raise web.HTTPBadRequest(text="Invalid buffer size: {}".format(request.query["buffer"]))
+    if buffer_size < 1:
+        raise web.HTTPBadRequest(text="Buffer size must be positive: {}".format(buffer_size))
+    policy = request.query.get("policy", app["policy"])
+    if policy not in POLICIES:
+        raise web.HTTPBadRequest(text="Invalid overflow policy: {}. Allowed values: {}".format(policy, ", ".join(POLICIES)))
+    return min(buffer_size, app["max_buffer_size"]), policy
+
+
+async def _websocket_stream(request):
+    app = request.app
+    match_id = request.match_info["match_id"]
+    buffer_size, policy = _subscription_params(request)
+    ws = web.WebSocketResponse(heartbeat=app["heartbeat"])
+    await ws.prepare(request)
+
+    subscriber = app["hub"].subscribe(match_id, buffer_size=buffer_size, policy=policy)
+
+    async def read_client():
+        # client messages are ignored, reading is needed to process close frames and pongs
+        async for _ in ws:
+            pass
+        subscriber.close()
+
+    reader = asyncio.ensure_future(read_client())
+    try:
+        while True:
+            event = await subscriber.get()
+            if event is None or ws.closed:
+                break
+            await asyncio.wait_for(ws.send_str(event.payload), app["send_timeout"])
+    except asyncio.TimeoutError:
+        logging.warning("Live: websocket subscriber of match {} was too slow and was disconnected".format(match_id))
+    except (ConnectionResetError, aiohttp.ClientConnectionError):
+        pass
+    finally:
+        app["hub"].unsubscribe(subscriber)
+        reader.cancel()
+        await ws.close()
+    return ws
+
+
+async def _sse_stream(request):
+    app = request.app
+    match_id = request.match_info["match_id"]
+    buffer_size, policy = _subscription_params(request)
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+    await response.prepare(request)
+
+    subscriber = app["hub"].subscribe(match_id, buffer_size=buffer_size, policy=policy)
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(subscriber.get(), app["keepalive"])
+            except asyncio.TimeoutError:
+                # comment line keeps idle connection open through proxies
+                await asyncio.wait_for(response.write(b": keepalive\n\n"), app["send_timeout"])
+                continue
+            if event is None:
+                break
+            await asyncio.wait_for(response.write(event.sse), app["send_timeout"])
+    except asyncio.TimeoutError:
+        logging.warning("Live: SSE subscriber of match {} was too slow and was disconnected".format(match_id))
+    except (ConnectionResetError, aiohttp.ClientConnectionError):
+        pass
+    finally:
+        app["hub"].unsubscribe(subscriber)
+    return response
+
+
+async def _stats(request):
+    app = request.app
+    return web.json_response({"matches": app["hub"].stats(), "weather": app["weather"].stats()})
+
+
+def create_app(stream_factory=None, actions_url=None, weather_url=None):
+    """
+    Create live stream service application
+    :param stream_factory:                  function (match_id, publish) returning coroutine which publishes match
+                                            events, by default MatchStream of configured providers is used
+    :param actions_url:                     action feed URL template, default is taken from configuration
+    :param weather_url:                     weather API URL, default is taken from configuration
+    :return:                                aiohttp Application object
+    """
+    settings = config["live"]
+    app = web.Application()
+    app["buffer_size"] = settings.getint("buffer_size", 256)
+    app["max_buffer_size"] = settings.getint("max_buffer_size", 4096)
+    app["policy"] = settings.get("policy", "coalesce")
+    app["send_timeout"] = settings.getfloat("send_timeout", 10)
+    app["heartbeat"] = settings.getfloat("heartbeat", 15)
+    app["keepalive"] = settings.getfloat("sse_keepalive", 15)
+
+    async def on_startup(app):
+        # connection pools, weather cache and location mapping are shared by all match streams
+        app["session"] = aiohttp.ClientSession()
+        app["weather"] = WeatherClient(url=weather_url)
+        app["resolver"] = LocationResolver()
+        app["executor"] = ThreadPoolExecutor(max_workers=settings.getint("weather_workers", 8))
+
+        def match_stream(match_id, publish):
+            stream = MatchStream(match_id, app["session"], app["weather"], app["resolver"], actions_url=actions_url,
+                                 executor=app["executor"])
+            return stream.run(publish)
+
+        app["hub"] = Hub(stream_factory or match_stream, idle_timeout=settings.getfloat("idle_timeout", 30))
+
+    async def on_shutdown(app):
+        await app["hub"].close()
+
+    async def on_cleanup(app):
+        await app["session"].close()
+        app["executor"].shutdown(wait=False)
+        app["weather"].close()
+
+    app.on_startup.append(on_startup)
+    app.on_shutdown.append(on_shutdown)
+    app.on_cleanup.append(on_cleanup)
+    app.router.add_get("/live/stats", _stats)
+    app.router.add_get("/live/{match_id}/ws", _websocket_stream)
+    app.router.add_get("/live/{match_id}/sse", _sse_stream)
+    return app
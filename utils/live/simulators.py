@@ -0,0 +1,225 @@
+"""
+Local simulators of live data providers.
+Action provider streams a point by point simulation of a best of three sets match over websocket, weather provider
+answers HTTP requests with slowly drifting conditions per location. Both are seeded, so the same match id always
+produces the same match and a reconnecting client can resume from the last received action
+"""
+
+import zlib
+import random
+import asyncio
+import logging
+
+from aiohttp import web
+
+from utils.live.sources import INFO, END
+
+POINT = "point"
+GAME = "game"
+SET = "set"
+
+# tournament locations of simulated matches, coordinates are resolved by the service
+LOCATIONS = ["Melbourne", "Paris", "London", "New York", "Indian Wells", "Madrid"]
+
+PLAYERS = ["Alcaraz C.", "Sinner J.", "Djokovic N.", "Medvedev D.", "Zverev A.", "Rune H.", "Ruud C.", "Fritz T."]
+
+CONDITIONS = ["clear", "cloudy", "overcast", "light rain"]
+
+
+def _seed(seed, key):
+    return zlib.crc32("{}:{}".format(seed, key).encode("utf-8"))
+
+
+class MatchSimulator:
+    """
+    Implements point by point simulation of a best of three sets match
+    """
+    def __init__(self, match_id, seed=0, serve_win=0.63):
+        """
+        :param match_id:                    match identifier, simulation is seeded with it
+        :param seed:                        global seed of simulations
+        :param serve_win:                   probability that server wins a point
+        """
+        self.match_id = match_id
+        self.rng = random.Random(_seed(seed, match_id))
+        self.serve_win = serve_win
+        self.players = self.rng.sample(PLAYERS, 2)
+        self.location = self.rng.choice(LOCATIONS)
+        self.server = 0
+        self.points = [0, 0]
+        self.games = [0, 0]
+        self.sets = [0, 0]
+        self.seq = 0
+
+    def _action(self, action_type, **data):
+        self.seq += 1
+        action = {"match_id": self.match_id, "seq": self.seq, "type": action_type}
+        action.update(data)
+        return action
+
+    def info(self):
+        return self._action(INFO, players=self.players, location=self.location)
+
+    def score(self):
+        return {"points": list(self.points), "games": list(self.games), "sets": list(self.sets)}
+
+    def next_point(self):
+        """
+        Play one point
+        :return:                            action dictionary, `end` action when match is over
+        """
+        winner = self.server if self.rng.random() < self.serve_win else 1 - self.server
+        action_type = POINT
+        self.points[winner] += 1
+        tiebreak = self.games == [6, 6]
+        target = 7 if tiebreak else 4
+        if self.points[winner] >= target and self.points[winner] - self.points[1 - winner] >= 2:
+            action_type = GAME
+            self.points = [0, 0]
+            self.games[winner] += 1
+            self.server = 1 - self.server
+            if (self.games[winner] >= 6 and self.games[winner] - self.games[1 - winner] >= 2) or self.games[winner] == 7:
+                action_type = SET
+                self.games = [0, 0]
+                self.sets[winner] += 1
+                if self.sets[winner] == 2:
+                    action_type = END
+        return self._action(action_type, winner=self.players[winner], score=self.score())
+
+    def actions(self):
+        """
+        Generate all actions of the match
+        """
+        yield self.info()
+        while True:
+            action = self.next_point()
+            yield action
+            if action["type"] == END:
+                return
+
+
+async def _match_feed(request):
+    app = request.app
+    match_id = request.match_info["match_id"]
+    since = int(request.query.get("since", 0))
+    ws = web.WebSocketResponse(heartbeat=app["heartbeat"])
+    await ws.prepare(request)
+    app["connections"] += 1
+    try:
+        for action in MatchSimulator(match_id, seed=app["seed"]).actions():
+            if ws.closed:
+                break
+            # actions already received by client are replayed instantly
+            if action["seq"] <= since:
+                continue
+            await ws.send_json(action)
+            await asyncio.sleep(app["interval"])
+    finally:
+        await ws.close()
+    return ws
+
+
+def create_actions_simulator(interval=1.0, seed=0, heartbeat=15):
+    """
+    Create websocket application simulating match action provider: `/matches/{match_id}` streams actions of a match,
+    `since` query parameter skips actions up to the sequence number
+    :param interval:                        seconds between actions
+    :param seed:                            global seed of simulations
+    :param heartbeat:                       websocket ping interval in seconds
+    :return:                                aiohttp Application object
+    """
+    app = web.Application()
+    app["interval"] = interval
+    app["seed"] = seed
+    app["heartbeat"] = heartbeat
+    app["connections"] = 0
+    app.router.add_get("/matches/{match_id}", _match_feed)
+    return app
+
+
+class WeatherSimulator:
+    """
+    Implements weather conditions drifting in time for every requested location
+    """
+    def __init__(self, seed=0, change_probability=0.3):
+        """
+        :param seed:                        global seed of simulations
+        :param change_probability:          probability that conditions change between two requests of a location
+        """
+        self.seed = seed
+        self.change_probability = change_probability
+        self.readings = {}
+        self.requests = 0
+
+    def reading(self, latitude, longitude):
+        """
+        Current conditions at coordinates
+        :return:                            dictionary with weather conditions
+        """
+        self.requests += 1
+        key = (round(latitude, 2), round(longitude, 2))
+        rng = random.Random(_seed(self.seed, "{}:{}:{}".format(key[0], key[1], self.requests)))
+        reading = self.readings.get(key)
+        if reading is None:
+            rng_location = random.Random(_seed(self.seed, key))
+            reading = {
+                "temperature": round(rng_location.uniform(5, 35), 1),
+                "humidity": round(rng_location.uniform(20, 90)),
+                "wind_speed": round(rng_location.uniform(0, 30), 1),
+                "precipitation": 0.0,
+                "conditions": rng_location.choice(CONDITIONS[:2]),
+            }
+        elif rng.random() < self.change_probability:
+            reading = dict(reading)
+            reading["temperature"] = round(reading["temperature"] + rng.uniform(-1.5, 1.5), 1)
+            reading["humidity"] = min(100, max(0, reading["humidity"] + rng.randint(-8, 8)))
+            reading["wind_speed"] = round(max(0.0, reading["wind_speed"] + rng.uniform(-3, 3)), 1)
+            reading["conditions"] = rng.choice(CONDITIONS)
+            reading["precipitation"] = round(rng.uniform(0.1, 4), 1) if reading["conditions"] == "light rain" else 0.0
+        self.readings[key] = reading
+        return dict(reading, latitude=latitude, longitude=longitude)
+
+
+async def _weather(request):
+    app = request.app
+    try:
+        latitude = float(request.query["latitude"])
+        longitude = float(request.query["longitude"])
+    except (KeyError, ValueError):
+        raise web.HTTPBadRequest(text="latitude and longitude are required")
+    if app["latency"]:
+        await asyncio.sleep(app["latency"])
+    return web.json_response(app["simulator"].reading(latitude, longitude))
+
+
+async def _weather_stats(request):
+    return web.json_response({"requests": request.app["simulator"].requests})
+
+
+def create_weather_simulator(seed=0, change_probability=0.3, latency=0.0):
+    """
+    Create HTTP application simulating weather provider: `/weather?latitude=..&longitude=..` returns current
+    conditions, `/stats` returns number of served requests
+    :param seed:                            global seed of simulations
+    :param change_probability:              probability that conditions change between two requests of a location
+    :param latency:                         response delay in seconds
+    :return:                                aiohttp Application object
+    """
+    app = web.Application()
+    app["simulator"] = WeatherSimulator(seed=seed, change_probability=change_probability)
+    app["latency"] = latency
+    app.router.add_get("/weather", _weather)
+    app.router.add_get("/stats", _weather_stats)
+    return app
+
+
+async def start_app(app, host, port):
+    """
+    Start application on a TCP port in the running event loop
+    :return:                                aiohttp AppRunner object, `cleanup` coroutine stops the application
+    """
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info("Live: simulator is listening on {}:{}".format(host, port))
+    return runner
@@ -0,0 +1,201 @@
+"""
+Live data providers and fan-in of a match stream.
+Match actions are consumed from provider websocket, which is reconnected with exponential backoff; actions replayed
+after reconnect are skipped by their sequence number. Weather is polled for the coordinates of match venue through
+the shared weather client (see `utils.live.weather`) and emitted only when conditions change
+"""
+
+import json
+import asyncio
+import logging
+import functools
+
+import aiohttp
+import requests
+from yarl import URL
+
+from config import config
+
+from utils.live.events import LiveEvent, ACTION, WEATHER
+
+# action types with special meaning for the service
+INFO = "info"
+END = "end"
+
+# weather fields compared to detect a change: number of decimals, None for exact comparison
+WEATHER_PRECISION = {"temperature": 0, "humidity": -1, "wind_speed": 0, "precipitation": 1, "conditions": None}
+
+
+def weather_signature(reading):
+    """
+    Rounded weather conditions, readings with the same signature are not emitted
+    :param reading:                         dictionary returned by weather provider
+    :return:                                tuple of rounded values
+    """
+    signature = []
+    for field, precision in WEATHER_PRECISION.items():
+        value = reading.get(field)
+        if precision is not None and isinstance(value, (int, float)):
+            value = round(value, precision)
+        signature.append(value)
+    return tuple(signature)
+
+
+class ActionFeed:
+    """
+    Implements consumer of provider websocket with match actions
+    """
+    def __init__(self, session, url, reconnect_delay=None, max_reconnect_delay=None, heartbeat=None):
+        """
+        :param session:                     aiohttp ClientSession object
+        :param url:                         websocket URL of match feed
+        :param reconnect_delay:             initial delay before reconnect in seconds, default is taken from configuration
+        :param max_reconnect_delay:         maximum delay before reconnect in seconds, default is taken from configuration
+        :param heartbeat:                   websocket ping interval in seconds, default is taken from configuration
+        """
+        self.session = session
+        self.url = url
+        self.reconnect_delay = reconnect_delay or config["live"].getfloat("reconnect_delay", 1)
+        self.max_reconnect_delay = max_reconnect_delay or config["live"].getfloat("max_reconnect_delay", 30)
+        self.heartbeat = heartbeat or config["live"].getfloat("heartbeat", 15)
+        self.last_seq = None
+
+    async def actions(self):
+        """
+        Iterate over match actions until `end` action
+        :return:                            async generator of action dictionaries
+        """
+        delay = self.reconnect_delay
+        while True:
+            url = URL(self.url)
+            if self.last_seq is not None:
+                # provider sends only actions after the last received one
+                url = url.update_query(since=self.last_seq)
+            try:
+                async with self.session.ws_connect(url, heartbeat=self.heartbeat) as ws:
+                    delay = self.reconnect_delay
+                    async for message in ws:
+                        if message.type != aiohttp.WSMsgType.TEXT:
+                            continue
+                        try:
+                            action = json.loads(message.data)
+                        except ValueError:
+                            logging.warning("Live: invalid action message was skipped: {}".format(message.data[:200]))
+                            continue
+                        seq = action.get("seq")
+                        if seq is not None:
+                            if self.last_seq is not None and seq <= self.last_seq:
+                                continue
+                            self.last_seq = seq
+                        yield action
+                        if action.get("type") == END:
+                            return
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logging.warning("Live: connection to action feed {} failed: {}".format(self.url, e))
+            logging.info("Live: reconnecting to action feed {} in {:.1f} seconds".format(self.url, delay))
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+
+class WeatherPoller:
+    """
+    Implements polling of weather for a single location. Requests go through shared WeatherClient, so streams of
+    matches at the same location are served by one upstream call per cache period
+    """
+    def __init__(self, client, interval=None, executor=None):
+        """
+        :param client:                      WeatherClient object shared by all streams
+        :param interval:                    polling interval in seconds, default is taken from configuration
+        :param executor:                    executor running blocking client calls, default executor of the loop if None
+        """
+        self.client = client
+        self.interval = interval or config["live"].getfloat("weather_interval", 60)
+        self.executor = executor
+
+    async def fetch(self, latitude, longitude):
+        """
+        Get current weather reading
+        :return:                            dictionary with weather conditions
+        """
+        return await asyncio.get_event_loop().run_in_executor(self.executor, self.client.get, latitude, longitude)
+
+    async def changes(self, latitude, longitude):
+        """
+        Poll weather and yield readings which differ from the previous emitted one
+        :return:                            async generator of weather dictionaries
+        """
+        signature = None
+        while True:
+            try:
+                reading = await self.fetch(latitude, longitude)
+            except (requests.RequestException, ValueError) as e:
+                logging.warning("Live: weather request for ({}, {}) failed: {}".format(latitude, longitude, e))
+            else:
+                current = weather_signature(reading)
+                if current != signature:
+                    signature = current
+                    yield reading
+            await asyncio.sleep(self.interval)
+
+
+class MatchStream:
+    """
+    Implements fan-in of match actions and weather changes into one stream of events.
+    Weather polling starts when `info` action identifies match venue
+    """
+    def __init__(self, match_id, session, weather_client, resolver, actions_url=None, executor=None):
+        """
+        :param match_id:                    match identifier
+        :param session:                     aiohttp ClientSession object shared by all streams
+        :param weather_client:              WeatherClient object shared by all streams
+        :param resolver:                    LocationResolver object shared by all streams
+        :param actions_url:                 action feed URL template with `{match_id}` placeholder,
+                                            default is taken from configuration
+        :param executor:                    executor running blocking weather and database calls
+        """
+        self.match_id = match_id
+        self.feed = ActionFeed(session, (actions_url or config["live"]["actions_url"]).format(match_id=match_id))
+        self.weather = WeatherPoller(weather_client, executor=executor)
+        self.resolver = resolver
+        self.executor = executor
+
+    async def run(self, publish):
+        """
+        Publish events of the match until the match ends
+        :param publish:                     function accepting LiveEvent object
+        """
+        weather_task = None
+        try:
+            async for action in self.feed.actions():
+                publish(LiveEvent(self.match_id, ACTION, action))
+                if action.get("type") == INFO and weather_task is None:
+                    weather_task = asyncio.ensure_future(self._publish_weather(publish, action))
+        finally:
+            if weather_task is not None:
+                weather_task.cancel()
+
+    async def coordinates(self, info):
+        """
+        Coordinates of match venue from `info` action: explicit `latitude` and `longitude`, tournament `location` or
+        tournament `ATP` and `year` stored in database
+        :return:                            tuple (latitude, longitude) or None if they are unknown
+        """
+        if info.get("latitude") is not None and info.get("longitude") is not None:
+            return float(info["latitude"]), float(info["longitude"])
+        return await asyncio.get_event_loop().run_in_executor(
+            self.executor, functools.partial(
+                self.resolver.resolve, location=info.get("location"), atp=info.get("ATP"), year=info.get("year")
+            )
+        )
+
+    async def _publish_weather(self, publish, info):
+        try:
+            coordinates = await self.coordinates(info)
+        except Exception as e:
+            logging.error("Live: venue of match {} was not resolved. Error message: {}".format(self.match_id, e))
+            return
+        if coordinates is None:
+            logging.warning("Live: coordinates of match {} are unknown, weather is not streamed".format(self.match_id))
+            return
+        async for reading in self.weather.changes(*coordinates):
+            publish(LiveEvent(self.match_id, WEATHER, reading))
@@ -0,0 +1,202 @@
+"""
+Weather lookup for tournament locations.
+Matches played at the same `Location` share coordinates, so readings are cached per rounded coordinates for `ttl`
+seconds and concurrent requests of the same coordinates wait for one upstream call instead of sending their own.
+Client is synchronous and thread-safe: the asyncio service calls it from executor threads, so the same cache and
+request coalescing serve both the live streams and any other caller
+"""
+
+import json
+import time
+import logging
+import threading
+import functools
+from concurrent.futures import Future
+
+import requests
+from urllib3.util.retry import Retry
+from requests.adapters import HTTPAdapter
+
+from config import config
+
+from utils.db.connector import DBConnector
+from utils.preprocess.names import name_key
+
+
+@functools.lru_cache(maxsize=None)
+def load_locations(locations_file=None):
+    """
+    Read coordinates of tournament locations
+    :param locations_file:                  path to JSON object {location: [latitude, longitude]},
+                                            default is taken from configuration
+    :return:                                dictionary {normalized location: (latitude, longitude)}
+    """
+    locations_file = locations_file or config["live"]["locations"]
+    try:
+        with open(locations_file, encoding="utf-8") as f:
+            locations = json.load(f)
+    except FileNotFoundError:
+        logging.warning("Tournament locations file {} was not found".format(locations_file))
+        return {}
+    return {name_key(location): (float(lat), float(lon)) for location, (lat, lon) in locations.items()}
+
+
+class LocationResolver:
+    """
+    Implements mapping of tournament `Location` to coordinates
+    """
+    def __init__(self, locations_file=None):
+        """
+        :param locations_file:              path to JSON file with coordinates, default is taken from configuration
+        """
+        self.locations = load_locations(locations_file)
+        self._tournaments = {}
+        self._lock = threading.Lock()
+
+    def coordinates(self, location):
+        """
+        Coordinates of a tournament location, spelling is compared the same way as player names
+        :return:                            tuple (latitude, longitude) or None if location is unknown
+        """
+        if not location:
+            return None
+        return self.locations.get(name_key(str(location)))
+
+    def tournament_location(self, atp, year):
+        """
+        Location of a tournament stored in `tournaments_common` table
+        :return:                            location string or None if tournament is not stored
+        """
+        key = (int(atp), int(year))
+        with self._lock:
+            if key in self._tournaments:
+                return self._tournaments[key]
+        with DBConnector(create_tables=False) as db_connector:
+            cursor = db_connector.connection.cursor()
+            cursor.execute("SELECT Location FROM {} WHERE ATP = ? AND Year = ?;".format(
+                db_connector.tables["tournaments"]), list(key))
+            row = cursor.fetchone()
+            cursor.close()
+        location = row[0] if row else None
+        with self._lock:
+            self._tournaments[key] = location
+        return location
+
+    def resolve(self, location=None, atp=None, year=None):
+        """
+        Coordinates of match venue given by location or by tournament
+        :param location:                    tournament location, e.g. "Melbourne"
+        :param atp:                         tournament number, used with `year` if location is not given
+        :param year:                        tournament year
+        :return:                            tuple (latitude, longitude) or None if venue is unknown
+        """
+        if not location and atp is not None and year is not None:
+            location = self.tournament_location(atp, year)
+        coordinates = self.coordinates(location)
+        if coordinates is None:
+            logging.warning("Coordinates of location {} (ATP {}, year {}) are unknown".format(location, atp, year))
+        return coordinates
+
+
+class WeatherClient:
+    """
+    Implements weather provider client with TTL cache keyed by rounded coordinates and coalescing of concurrent
+    identical requests
+    """
+    def __init__(self, url=None, ttl=None, precision=None, timeout=None, retries=None, pool_size=None):
+        """
+        :param url:                         weather API URL accepting `latitude` and `longitude` query parameters
+        :param ttl:                         seconds a reading is served from cache
+        :param precision:                   number of decimals of cache key coordinates, 2 decimals are about 1 km
+        :param timeout:                     request timeout in seconds
+        :param retries:                     allowed number of retries
+        :param pool_size:                   maximum number of pooled connections to the provider
+        All defaults are taken from configuration
+        """
+        settings = config["live"]
+        self.url = url or settings["weather_url"]
+        self.ttl = ttl if ttl is not None else settings.getfloat("weather_ttl", 60)
+        self.precision = precision if precision is not None else settings.getint("weather_precision", 2)
+        self.timeout = timeout or settings.getfloat("weather_timeout", 10)
+        self.pool_size = pool_size or settings.getint("weather_pool_size", 10)
+        self.session = self.create_session(retries=retries if retries is not None else settings.getint("weather_retries", 3))
+        self.requests = 0
+        self.hits = 0
+        self.coalesced = 0
+        self._cache = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def create_session(self, retries=3):
+        """
+        Create session object with pooled connections and specified number of retries
+        :param retries: allowed number of retries
+        :return: session object
+        """
+        session = requests.Session()
+        retries = Retry(total=retries, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504])
+        adapter = HTTPAdapter(max_retries=retries, pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def cache_key(self, latitude, longitude):
+        return round(float(latitude), self.precision), round(float(longitude), self.precision)
+
+    def get(self, latitude, longitude):
+        """
+        Current weather at coordinates, served from cache while it is fresh
+        :return:                            dictionary with weather conditions
+        """
+        key = self.cache_key(latitude, longitude)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] > time.monotonic():
+                self.hits += 1
+                return cached[1]
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            # exception of the upstream call is raised in every waiting caller
+            return future.result()
+
+        try:
+            reading = self.fetch(*key)
+        except Exception as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._cache[key] = (time.monotonic() + self.ttl, reading)
+            del self._inflight[key]
+            self._evict()
+        future.set_result(reading)
+        return reading
+
+    def fetch(self, latitude, longitude):
+        """
+        Request weather from provider without cache
+        :return:                            dictionary with weather conditions
+        """
+        self.requests += 1
+        params = {"latitude": "{:.4f}".format(latitude), "longitude": "{:.4f}".format(longitude)}
+        with self.session.get(self.url, params=params, timeout=self.timeout) as r:
+            r.raise_for_status()
+            return r.json()
+
+    def _evict(self):
+        now = time.monotonic()
+        expired = [key for key, (expires, _) in self._cache.items() if expires <= now]
+        for key in expired:
+            del self._cache[key]
+
+    def stats(self):
+        return {"requests": self.requests, "hits": self.hits, "coalesced": self.coalesced, "cached": len(self._cache)}
+
+    def close(self):
+        self.session.close()
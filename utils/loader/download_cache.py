@@ -0,0 +1,117 @@
+"""
+Local cache of downloaded yearly files.
+For every year the manifest stores validators returned by the server (ETag and Last-Modified), SHA-256 of the
+downloaded file and SHA-256 of the file that was last successfully imported. Validators are used to make conditional
+requests, and the content hash allows skipping the whole import chain when upstream data has not changed
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+
+# manifest is shared by all loaders of the process, e.g. by import pipeline workers
+_MANIFEST_LOCK = threading.Lock()
+
+
+def file_sha256(filename, chunk_size=1024*1024):
+    """
+    Calculate SHA-256 of a file
+    :param filename:            path to file
+    :param chunk_size:          number of bytes read at once
+    :return:                    hex digest
+    """
+    sha = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class DownloadCache:
+    """
+    Implements JSON manifest of downloaded yearly files
+    """
+    def __init__(self, manifest_file):
+        """
+        :param manifest_file:       path to manifest file, created on first update
+        """
+        self.manifest_file = manifest_file
+
+    def _load(self):
+        if not os.path.exists(self.manifest_file):
+            return {}
+        try:
+            with open(self.manifest_file, "r") as f:
+                return json.load(f)
+        except Exception as e:
+            # broken manifest only disables conditional requests
+            logging.warning("Download cache: failed to read manifest {} due to exception: {}".format(self.manifest_file, e))
+            return {}
+
+    def _save(self, manifest):
+        os.makedirs(os.path.dirname(self.manifest_file) or ".", exist_ok=True)
+        tmp_file = self.manifest_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_file, self.manifest_file)
+
+    def get(self, year):
+        """
+        Get cache entry of the year
+        :return:                    dictionary with `filename`, `etag`, `last_modified`, `sha256` and `imported_sha256`
+                                    keys, empty if year was never downloaded
+        """
+        with _MANIFEST_LOCK:
+            return self._load().get(str(year), {})
+
+    def update(self, year, **values):
+        """
+        Update cache entry of the year
+        """
+        with _MANIFEST_LOCK:
+            manifest = self._load()
+            manifest.setdefault(str(year), {}).update(values)
+            self._save(manifest)
+
+    def get_conditional_headers(self, year):
+        """
+        Build conditional request headers of the year.
+        Validators are used only if previously downloaded file is still present
+        :return:                    dictionary of headers
+        """
+        entry = self.get(year)
+        if not entry.get("filename") or not os.path.exists(entry["filename"]):
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def is_imported(self, year, sha256):
+        """
+        Check if file with the hash was already successfully imported
+        """
+        return sha256 is not None and self.get(year).get("imported_sha256") == sha256
+
+    def mark_imported(self, year, sha256):
+        """
+        Record hash of successfully imported file
+        """
+        self.update(year, imported_sha256=sha256)
+
+    def clear_imported(self, years=None):
+        """
+        Forget imported hashes, e.g. after data was changed in database by other means
+        :param years:               iterable of years, all years are cleared if None
+        """
+        with _MANIFEST_LOCK:
+            manifest = self._load()
+            keys = manifest.keys() if years is None else [str(year) for year in years]
+            for key in keys:
+                if key in manifest:
+                    manifest[key].pop("imported_sha256", None)
+            self._save(manifest)
@@ -6,11 +6,19 @@ import shutil
 import logging
 import requests
 from zipfile import ZipFile
-import pandas as pd
 
 import config as c
 from config import config
 
+from utils.preprocess import Preprocessor
+from utils.loader.download_cache import DownloadCache, file_sha256
+from utils.loader.parsers import parse_data
+from utils.validation import get_schema_validator, REQUIRED_FIELDS
+from utils.logging.helpers import log_and_warn
+from utils.db.upsert import upsert_frames
+from utils.storage.snapshots import get_snapshot_store
+from utils.preprocess import TOURNAMENTS_PREPROCESS, RESULTS_PREPROCESS, BETS_PREPROCESS
+
 from urllib3.util.retry import Retry
 from requests.adapters import HTTPAdapter
 
@@ -26,16 +34,11 @@ def load_data(filename, data=None):
         if os.path.exists(filename):
             logging.info("Loading data from file: {}".format(filename))
             try:
-                data = pd.read_csv(filename)
-            except Exception:
-                try:
-                    data = pd.read_json(filename)
-                except Exception:
-                    try:
-                        data = pd.read_excel(filename)
-                    except Exception as e:
-                        logging.info("Failed to open {} due to exception: {}".format(filename, e))
-                        raise Exception(e)
+                with open(filename, "rb") as f:
+                    data = parse_data(f.read(), filename)
+            except Exception as e:
+                logging.info("Failed to open {} due to exception: {}".format(filename, e))
+                raise Exception(e)
         else:
             logging.info("File not found")
             
@@ -48,6 +51,8 @@ class TennisDataLoader(object):
         self.auth = auth
         self.session = self.create_session(retries=3)
         self.db_connector = db_connector
+        self.download_cache = DownloadCache(config["tennis"]["download_cache"])
+        self.snapshots = get_snapshot_store()
         
     def create_session(self, retries=3):
         """
@@ -62,96 +67,107 @@ class TennisDataLoader(object):
         session.mount('https://', HTTPAdapter(max_retries=retries))
         return session
     
-    def single_api_call(self, url, params=None, timeout=600, filename=None):
+    def single_api_call(self, url, params=None, timeout=600, filename=None, headers=None):
         """
         Single get request with specified timeout
-        :return: responce as json object with data and its time if any was received
+        :param headers: optional request headers, e.g. validators of conditional request
+        :return: tuple (status code, response headers), file is not written if server responded 304 Not Modified
         """
         if not params:
             params = {}
             
         try:
-            with self.session.get(url, params=params, timeout=timeout, stream=True) as r:
+            with self.session.get(url, params=params, headers=headers, timeout=timeout, stream=True) as r:
                     r.raise_for_status()
-                    with open(filename, "wb") as f:
-                        shutil.copyfileobj(r.raw, f, length=16*1024*1024)
-            logging.info("Downloaded: {}".format(filename))
+                    if r.status_code == 304:
+                        logging.info("Not modified: {}".format(url))
+                    else:
+                        # previously downloaded file is kept until the new one is complete
+                        tmp_filename = filename + ".part"
+                        with open(tmp_filename, "wb") as f:
+                            shutil.copyfileobj(r.raw, f, length=16*1024*1024)
+                        os.replace(tmp_filename, filename)
+                        logging.info("Downloaded: {}".format(filename))
             responce_time = r.elapsed.total_seconds()
         except Exception as e:
             msg = "Exception on API call to tennis-data: {}".format(type(e))
             logging.error(msg)
             raise Exception(msg)
             
-        return True
-    
-    def download_by_year(self, url, year, path, data=None):
+        return r.status_code, r.headers
+
+    def fetch_by_year(self, url, year, path):
+        """
+        Download yearly file unless cached copy is still valid
+        :return: tuple (path to downloaded file, SHA-256 of the file)
+        """
+        url = url.format(year=year)
+        filename = os.path.join(path, url[url.rindex('/')+1:])
+        os.makedirs(path, exist_ok=True)
+
+        headers = self.download_cache.get_conditional_headers(year)
+        status, response_headers = self.single_api_call(url=url, filename=filename, headers=headers)
+
+        # Check if file was downloaded correctly
+        if not os.path.exists(filename):
+            logging.info("Failed to download data")
+            raise Exception("Failed to download data")
+
+        if status == 304:
+            sha256 = self.download_cache.get(year).get("sha256") or file_sha256(filename)
+        else:
+            sha256 = file_sha256(filename)
+            self.download_cache.update(year, filename=filename, sha256=sha256,
+                                      etag=response_headers.get("ETag"),
+                                      last_modified=response_headers.get("Last-Modified"))
+        logging.info("Using file {} with SHA-256 {}".format(filename, sha256))
+        return filename, sha256
+
+    def download_by_year(self, url, year, path, data=None, skip_imported=False):
         """
         Download yearly file or load if already downloaded
+        :param skip_imported: return None if the file was already successfully imported
         """
         if data is None:
-            url = url.format(year=year)
-            
-            filename = os.path.join(path, url[url.rindex('/')+1:])
-                
-            os.makedirs(path, exist_ok=True)
-            
-            self.single_api_call(url=url, filename=filename)
+            filename, sha256 = self.fetch_by_year(url=url, year=year, path=path)
+
+            if skip_imported and self.download_cache.is_imported(year, sha256):
+                logging.info("Data for year {} is unchanged since the last import".format(year))
+                return None
 
             # Accepted file formats
             formats = (".csv", ".json", ".xlsx", ".xls")
 
-            extracted_file = None
-            
-            # Check if file was downloaded correctly
-            if not os.path.exists(filename):
-                logging.info("Failed to download data")
-                raise Exception("Failed to download data")
-            else:
-                with ZipFile(filename, 'r') as zipf:
-                    # Check if any files in zip have correct file format
-                    # If not raise exception
-                    files = [f for f in zipf.namelist() if f.endswith(formats)]
-                    if len(files) == 0:
-                        logging.info("No valid data file detected")
-                        raise Exception("No valid data file detected")
-                    # Extract only files with correct format
-                    # There should be one correct file per zip but if there's many
-                    # pick the last one assuming that data is the same across the files
-                    for f in files:
-                        zipf.extract(f, path=path)
-                        extracted_file = f
-                        logging.info("Extracted: {}".format(f))  
-                os.remove(filename)
-            logging.info("Unpacked: {}".format(filename))  
-            
-            extracted_file_path = os.path.join(path, extracted_file)
+            with ZipFile(filename, 'r') as zipf:
+                # Check if any files in zip have correct file format
+                # If not raise exception
+                files = [f for f in zipf.namelist() if f.lower().endswith(formats)]
+                if len(files) == 0:
+                    logging.info("No valid data file detected")
+                    raise Exception("No valid data file detected")
+                # There should be one correct file per zip but if there's many
+                # pick the last one assuming that data is the same across the files
+                member = files[-1]
+                # member is parsed from memory, nothing is extracted to disk
+                content = zipf.read(member)
+            # downloaded file is kept as a cached copy for conditional requests
+            logging.info("Unpacked: {} from {}".format(member, filename))
 
-            logging.info("Using file {}".format(extracted_file_path))
-            data = load_data(extracted_file_path)
+            data = parse_data(content, member)
             
             if data is None:
                 logging.error("Failed to load data from file")
                 raise Exception("Failed to load data from file")
 
+            data.attrs["content_hash"] = sha256
+
         return data
 
-    @staticmethod
-    def save_data_to_csv(data, filename, **kwargs):
-        """
-        Save df to csv
-        :param data: df to save
-        :param filename: path to file
-        :param kwargs: additional arguments for DataFrame.to_csv method
-        """
-        dirname = os.path.dirname(filename)
-        os.makedirs(dirname, exist_ok=True)
-        data.to_csv(filename, **kwargs)
-    
-    def save_tournament_data(self, yearly_data, primary_keys, filename, data=None):
+    def save_tournament_data(self, yearly_data, primary_keys, data=None):
         """
         Save downloaded static tournaments data
         :param yearly_data: dataFrame with static tournaments fields (atp, year, location, etc.)
-        :param filename: CSV file to save data to and load data from
+        :param primary_keys: primary key columns of the table
         :data: dataframe to be save in file and database
         """
         logging.info("Start working with tournament data")
@@ -160,18 +176,16 @@ class TennisDataLoader(object):
 
         data = data.drop_duplicates(subset=primary_keys)
 
-        self.save_data_to_csv(data, filename, index=False)
-
         data = data.set_index(primary_keys)
 
         self.db_connector.save_data(df=data, table="tournaments")
         logging.info("Tournaments data successfully loaded in database")
 
-    def save_results_data(self, yearly_data, primary_keys, filename, data=None):
+    def save_results_data(self, yearly_data, primary_keys, data=None):
         """
         Save downloaded data with tournament results in each round
         :param yearly_data: dataFrame with static tournaments fields (atp, year, location, etc.)
-        :param filename: CSV file to save data to and load data from
+        :param primary_keys: primary key columns of the table
         :data: dataframe to be save in file and database
         """
         logging.info("Start working with results data")
@@ -180,18 +194,16 @@ class TennisDataLoader(object):
 
         data = data.drop_duplicates(subset=primary_keys)
 
-        self.save_data_to_csv(data, filename, index=False)
-
         data = data.set_index(primary_keys)
 
         self.db_connector.save_data(df=data, table="results")
         logging.info("Results data successfully loaded in database")
 
-    def save_bets_data(self, yearly_data, primary_keys, filename, data=None):
+    def save_bets_data(self, yearly_data, primary_keys, data=None):
         """
         Save downloaded data with bets on each tournament result in each round
         :param yearly_data: dataFrame with static tournaments fields (atp, year, location, etc.)
-        :param filename: CSV file to save data to and load data from
+        :param primary_keys: primary key columns of the table
         :data: dataframe to be save in file and database
         """
         logging.info("Start working with bets data")
@@ -200,10 +212,72 @@ class TennisDataLoader(object):
 
         data = data.drop_duplicates(subset=primary_keys)
 
-        self.save_data_to_csv(data, filename, index=False)
-
         data = data.set_index(primary_keys)
 
         self.db_connector.save_data(df=data, table="bets")
         logging.info("Bets data successfully loaded in database")
 
+    def load_yearly_data(self, year, force=False):
+        """
+        Download yearly data and preprocess it before loading in database
+        :param year: year to download
+        :param force: preprocess data even if it is unchanged since the last successful import
+        :return: preprocessed dataframe or None if data is unchanged
+        """
+        logging.info("Downloading data from {}".format(config["tennis"]["base_url"]))
+        skip_imported = not force and config["tennis"].getboolean("skip_unchanged", True)
+        yearly_data = self.download_by_year(url=config["tennis"]["url_year"], year=year, path=config["tennis"]["base_dir"],
+                                            skip_imported=skip_imported)
+        if yearly_data is None:
+            return None
+        content_hash = yearly_data.attrs.get("content_hash")
+        yearly_data["Year"] = int(year)
+
+        # rows without keys can't be saved, other invalid values are coerced by preprocessor
+        validation = get_schema_validator().validate(yearly_data)
+        valid = validation.mask(columns=REQUIRED_FIELDS)
+        if not valid.all():
+            log_and_warn("{} rows without required fields {} were dropped from data for year {}".format(
+                (~valid).sum(), REQUIRED_FIELDS, year))
+            yearly_data = yearly_data[valid].reset_index(drop=True)
+
+        logging.info("Preprocessing data before loading in database")
+        results_preprocessor = Preprocessor(TOURNAMENTS_PREPROCESS+RESULTS_PREPROCESS+BETS_PREPROCESS,
+                                            timing=config["import"].getboolean("preprocess_timing", False))
+        yearly_data = results_preprocessor.calculate(yearly_data)
+
+        yearly_data = yearly_data.rename(columns=c.RENAME_MAP)
+        yearly_data.attrs["content_hash"] = content_hash
+        return yearly_data
+
+    def save_yearly_data(self, yearly_data, year):
+        """
+        Save preprocessed yearly data to database and snapshots
+        :param yearly_data: preprocessed dataframe
+        :param year: year of the data
+        :return: dictionary with numbers of inserted, updated, deleted and unchanged rows per table in upsert mode,
+                 None otherwise
+        """
+        report = None
+        delete_missing = config["import"].getboolean("delete_missing", False)
+        frames = {}
+        for table, fields in (("tournaments", c.TOURNAMENTS_FIELDS), ("results", c.RESULTS_FIELDS), ("bets", c.BETS_FIELDS)):
+            frames[table] = yearly_data[fields + ["Year"]].drop_duplicates(subset=c.PRIMARY_KEYS[table]).set_index(c.PRIMARY_KEYS[table])
+
+        if config["import"].get("write_mode", "upsert") == "upsert":
+            report = upsert_frames(self.db_connector, frames, years=[year], delete_missing=delete_missing)
+        else:
+            self.save_tournament_data(yearly_data=yearly_data, primary_keys=c.PRIMARY_KEYS["tournaments"])
+            self.save_results_data(yearly_data=yearly_data, primary_keys=c.PRIMARY_KEYS["results"])
+            self.save_bets_data(yearly_data=yearly_data, primary_keys=c.PRIMARY_KEYS["bets"])
+        self.db_connector.refresh_rollups([year])
+
+        # snapshot keeps the same rows as database: changed rows are replaced, vanished rows are kept unless deleted
+        if self.snapshots is not None:
+            self.snapshots.save_frames(frames, overwrite=True, replace=delete_missing)
+
+        # imported file is recorded only after all tables were saved
+        content_hash = yearly_data.attrs.get("content_hash")
+        if content_hash:
+            self.download_cache.mark_imported(year, content_hash)
+        return report
@@ -0,0 +1,98 @@
+"""
+Format-aware parsing of downloaded data files.
+Files are parsed from bytes (e.g. a member read directly from zip archive), the parser is chosen once by magic bytes
+or extension and is given an explicit dtype schema built from `*_FIELDS` lists, so no failed parse attempts or
+per-column type inference are needed
+"""
+
+import io
+import logging
+import pandas as pd
+
+import config as c
+
+from utils.db.schema import get_column_types, NUMERIC_TYPES, DATE_TYPES
+from utils.db.frames import INTEGER_TYPES
+from utils.db.players import PLAYER_ID_COLUMNS
+
+XLS_MAGIC = b"\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1"
+XLSX_MAGIC = b"PK\x03\x04"
+
+FORMATS = {".csv": "csv", ".json": "json", ".xlsx": "xlsx", ".xls": "xls"}
+EXCEL_ENGINES = {"xlsx": "openpyxl", "xls": "xlrd"}
+
+# columns are named as in source files before renaming
+RAW_COLUMN_NAMES = {v: k for k, v in c.RENAME_MAP.items()}
+
+
+def get_raw_dtypes():
+    """
+    Build dtype schema of source data files.
+    Integer key columns are parsed as integers, other numeric columns as floats as they may contain missing values,
+    date columns are left to the preprocessor as their format depends on the file format. Player name columns are
+    strings, they are stored as ids in results and bets tables
+    :return:                    dictionary {source column name: dtype}
+    """
+    column_types = get_column_types()
+    key_columns = set(f for keys in c.PRIMARY_KEYS.values() for f in keys)
+    dtypes = {}
+    for field in c.TOURNAMENTS_FIELDS + c.RESULTS_FIELDS + c.BETS_FIELDS:
+        if field in PLAYER_ID_COLUMNS:
+            dtypes[RAW_COLUMN_NAMES.get(field, field)] = "str"
+            continue
+        sql_type = column_types.get(field)
+        if sql_type is None or sql_type in DATE_TYPES:
+            continue
+        if sql_type in NUMERIC_TYPES:
+            dtype = "int64" if field in key_columns and sql_type in INTEGER_TYPES else "float64"
+        else:
+            dtype = "str"
+        dtypes[RAW_COLUMN_NAMES.get(field, field)] = dtype
+    return dtypes
+
+
+def detect_format(name, content):
+    """
+    Detect file format. Excel signatures take precedence over extension as files are sometimes misnamed
+    :param name:                file name
+    :param content:             file content bytes
+    :return:                    one of `csv`, `json`, `xlsx`, `xls`
+    """
+    if content.startswith(XLS_MAGIC):
+        return "xls"
+    if content.startswith(XLSX_MAGIC):
+        return "xlsx"
+    for extension, file_format in FORMATS.items():
+        if name.lower().endswith(extension):
+            return file_format
+    if content.lstrip()[:1] in (b"[", b"{"):
+        return "json"
+    return "csv"
+
+
+def _read(file_format, content, dtypes):
+    buffer = io.BytesIO(content)
+    if file_format == "csv":
+        return pd.read_csv(buffer, dtype=dtypes)
+    if file_format == "json":
+        return pd.read_json(buffer, dtype=dtypes)
+    return pd.read_excel(buffer, dtype=dtypes, engine=EXCEL_ENGINES[file_format])
+
+
+def parse_data(content, name):
+    """
+    Parse data file content
+    :param content:             file content bytes
+    :param name:                file name used for format detection
+    :return:                    DataFrame
+    """
+    file_format = detect_format(name, content)
+    logging.info("Parsing {} as {}".format(name, file_format))
+    dtypes = get_raw_dtypes()
+    try:
+        return _read(file_format, content, dtypes)
+    except (ValueError, TypeError) as e:
+        # non-numeric values in numeric columns are coerced by preprocessor
+        logging.warning("Failed to apply numeric types to {} due to exception: {}, "
+                        "numeric columns are parsed with inferred types".format(name, e))
+        return _read(file_format, content, {k: v for k, v in dtypes.items() if v == "str"})
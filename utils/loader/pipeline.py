@@ -0,0 +1,102 @@
+"""
+Concurrent import of multiple years.
+Years are downloaded, parsed and preprocessed concurrently on a bounded thread pool, while a single writer saves
+prepared data to database one year at a time. Prepared data is passed to the writer through a bounded queue, so
+preparation is paused when the writer falls behind and memory is bounded by `queue_size` yearly frames
+"""
+
+import time
+import queue
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from config import config
+
+from utils.loader.loader import TennisDataLoader
+
+IMPORTED = "imported"
+SKIPPED = "skipped"
+CANCELLED = "cancelled"
+
+
+class ImportPipeline:
+    """
+    Implements concurrent import of a range of years with a single serialized database writer
+    """
+    def __init__(self, db_connector, max_workers=4, queue_size=2, force=False):
+        """
+        :param db_connector:                DBConnector object used by the writer
+        :param max_workers:                 number of years prepared concurrently
+        :param queue_size:                  maximum number of prepared years waiting for the writer
+        :param force:                       import years even if data is unchanged since the last import
+        """
+        self.db_connector = db_connector
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self.force = force
+        # write reports of saved years, see `TennisDataLoader.save_yearly_data`
+        self.reports = {}
+
+    def _prepare(self, year, prepared, should_stop):
+        """
+        Download and preprocess a single year and pass result to the writer.
+        Every worker uses its own loader as HTTP session is not shared between threads
+        """
+        if should_stop():
+            prepared.put((year, None, CANCELLED))
+            return
+        t1 = time.time()
+        try:
+            loader = TennisDataLoader(url=config["tennis"]["base_url"], db_connector=None)
+            yearly_data = loader.load_yearly_data(year, force=self.force)
+            logging.info("Import pipeline: year {} prepared in {:.2f} seconds".format(year, time.time() - t1))
+            prepared.put((year, yearly_data, None))
+        except Exception as e:
+            logging.error("Import pipeline: year {} failed with exception {}".format(year, e))
+            prepared.put((year, None, e))
+
+    def run(self, years, on_saved=None, on_progress=None, should_stop=None):
+        """
+        Import all years
+        :param years:                       iterable of years to import
+        :param on_saved:                    optional callback called with year after it is saved to database
+        :param on_progress:                 optional callback called with (number of processed years, number of years)
+        :param should_stop:                 optional callable, years are not prepared or saved after it returns True
+        :return:                            dictionary {year: IMPORTED, SKIPPED, CANCELLED or exception}
+        """
+        years = list(years)
+        should_stop = should_stop or (lambda: False)
+        prepared = queue.Queue(maxsize=self.queue_size)
+        loader = TennisDataLoader(url=config["tennis"]["base_url"], db_connector=self.db_connector)
+        results = {}
+
+        t1 = time.time()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="import") as executor:
+            for year in years:
+                executor.submit(self._prepare, year, prepared, should_stop)
+
+            # the calling thread is the only database writer
+            for _ in years:
+                year, yearly_data, status = prepared.get()
+                if status is None and should_stop():
+                    status = CANCELLED
+                elif status is None and yearly_data is None:
+                    status = SKIPPED
+                elif status is None:
+                    try:
+                        t2 = time.time()
+                        self.reports[year] = loader.save_yearly_data(yearly_data=yearly_data, year=year)
+                        logging.info("Import pipeline: year {} saved in {:.2f} seconds".format(year, time.time() - t2))
+                        if on_saved:
+                            on_saved(year)
+                    except Exception as e:
+                        logging.error("Import pipeline: saving year {} failed with exception {}".format(year, e))
+                        status = e
+                results[year] = status or IMPORTED
+                if on_progress:
+                    on_progress(len(results), len(years))
+
+        logging.info("Import pipeline: {} imported, {} unchanged of {} years in {:.2f} seconds".format(
+            sum(r == IMPORTED for r in results.values()), sum(r == SKIPPED for r in results.values()),
+            len(years), time.time() - t1))
+        return results
@@ -0,0 +1,152 @@
+"""
+Bulk upload of match records.
+Records are read from a JSON array or a streamed NDJSON body, grouped in batches and every batch is validated,
+preprocessed and upserted to database as a whole, in one transaction, and appended to snapshots. Records of already
+stored matches replace them, so partners can send corrections. Rejected records are reported by their position in
+the request body
+"""
+
+import json
+import time
+import logging
+import numpy as np
+import pandas as pd
+
+import config as c
+
+from utils.preprocess import Preprocessor
+from utils.preprocess import TOURNAMENTS_PREPROCESS, RESULTS_PREPROCESS, BETS_PREPROCESS
+from utils.loader.parsers import RAW_COLUMN_NAMES
+from utils.validation import get_schema_validator
+from utils.storage.snapshots import get_snapshot_store
+from utils.db.upsert import upsert_frames, TABLE_ORDER
+
+# row counts reported per table
+CHANGE_COUNTS = ("inserted", "updated", "unchanged")
+
+NDJSON_MIMETYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/x-jsonlines")
+
+
+def iter_json_records(body):
+    """
+    Iterate over records of JSON array body. A single object is treated as an array of one record.
+    Body is decoded when the function is called, so invalid JSON raises ValueError before any record is processed
+    :param body:                    request body bytes
+    :return:                        generator of (row number, record or error message)
+    """
+    records = json.loads(body)
+    if isinstance(records, dict):
+        records = [records]
+    if not isinstance(records, list):
+        raise ValueError("Expected JSON array or object")
+    return ((i, record if isinstance(record, dict) else "Record is not a JSON object") for i, record in enumerate(records))
+
+
+def iter_ndjson_records(lines):
+    """
+    Iterate over records of NDJSON body without reading the whole body in memory
+    :param lines:                   iterable of body lines, e.g. request stream
+    :return:                        generator of (row number, record or error message)
+    """
+    i = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+            yield i, record if isinstance(record, dict) else "Record is not a JSON object"
+        except ValueError as e:
+            yield i, "Invalid JSON: {}".format(e)
+        i += 1
+
+
+class BulkUploader:
+    """
+    Implements batched validation, preprocessing and saving of uploaded records
+    """
+    def __init__(self, db_connector, batch_size=1000):
+        """
+        :param db_connector:            DBConnector object
+        :param batch_size:              number of records validated and saved at once
+        """
+        self.db_connector = db_connector
+        self.batch_size = batch_size
+        self.preprocessor = Preprocessor(TOURNAMENTS_PREPROCESS+RESULTS_PREPROCESS+BETS_PREPROCESS)
+        self.snapshots = get_snapshot_store()
+
+    def upload(self, records):
+        """
+        Upload records
+        :param records:                 iterable of (row number, record or error message)
+        :return:                        dictionary with number of received records, numbers of inserted, updated and
+                                        unchanged rows per table, list of rejected records and list of changed years
+        """
+        report = {"received": 0, "rejected": [], "years": set()}
+        for count in CHANGE_COUNTS:
+            report[count] = {table: 0 for table in TABLE_ORDER}
+        self._snapshot_years = set()
+        batch = []
+        t1 = time.time()
+        for row, record in records:
+            report["received"] += 1
+            if isinstance(record, str):
+                report["rejected"].append({"row": row, "errors": [record]})
+                continue
+            batch.append((row, record))
+            if len(batch) >= self.batch_size:
+                self._upload_batch(batch, report)
+                batch = []
+        if batch:
+            self._upload_batch(batch, report)
+
+        report["rejected"].sort(key=lambda r: r["row"])
+        report["years"] = sorted(report["years"])
+        self.db_connector.refresh_rollups(report["years"])
+        # matches and manifest of snapshots are rebuilt once per upload, not per batch
+        if self._snapshot_years:
+            self.snapshots.refresh(self._snapshot_years)
+        logging.info("Bulk upload: {} records received, {} rejected in {:.2f} seconds, inserted rows: {}, updated rows: {}".format(
+            report["received"], len(report["rejected"]), time.time() - t1, report["inserted"], report["updated"]))
+        return report
+
+    def _upload_batch(self, batch, report):
+        rows = [row for row, _ in batch]
+        # records may use database column names as well as source file names
+        data = pd.DataFrame.from_records([record for _, record in batch]).rename(columns=RAW_COLUMN_NAMES)
+
+        validation = get_schema_validator().validate(data)
+        valid = validation.mask()
+        for i, errors in validation.row_errors().items():
+            report["rejected"].append({"row": rows[i], "errors": errors})
+        if not valid.any():
+            return
+
+        data = data[valid].reset_index(drop=True)
+        data = self.preprocessor.calculate(data)
+        data = data.rename(columns=c.RENAME_MAP)
+        data["ATP"] = pd.to_numeric(data["ATP"]).astype(np.int64)
+        data["Year"] = pd.to_numeric(data["Year"]).astype(np.int64)
+
+        frames = {}
+        for table, fields in (("tournaments", c.TOURNAMENTS_FIELDS), ("results", c.RESULTS_FIELDS), ("bets", c.BETS_FIELDS)):
+            keys = c.PRIMARY_KEYS[table]
+            frames[table] = data.reindex(columns=fields + ["Year"]).drop_duplicates(subset=keys).set_index(keys)
+
+        years = data["Year"].unique().tolist()
+        try:
+            # stored rows are compared by hash of their values, so corrections are updated and repeats are skipped
+            changes = upsert_frames(self.db_connector, frames, years=years)
+        except Exception as e:
+            for i in np.flatnonzero(valid):
+                report["rejected"].append({"row": rows[i], "errors": ["Failed to save batch: {}".format(e)]})
+            return
+
+        for table, counts in changes.items():
+            for count in CHANGE_COUNTS:
+                report[count][table] += counts[count]
+        if any(counts["inserted"] or counts["updated"] for counts in changes.values()):
+            report["years"].update(years)
+            # appended rows replace snapshot rows with the same keys, as the upsert did in database
+            if self.snapshots is not None:
+                self._snapshot_years |= self.snapshots.append_frames(frames, refresh=False)
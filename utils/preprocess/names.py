@@ -0,0 +1,70 @@
+"""
+Player name normalization.
+Source files spell the same player differently across years (extra spaces, accents, missing dots, letter case).
+Names are cleaned during preprocessing, known spelling variants are replaced by canonical names from aliases file, and
+the remaining differences are removed by `name_key` which is used to intern names into player ids
+"""
+
+import os
+import re
+import json
+import logging
+import functools
+import unicodedata
+
+from config import config
+
+WHITESPACE_REGEX = re.compile(r"\s+", re.UNICODE)
+NON_ALPHANUMERIC_REGEX = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def clean_name(name):
+    """
+    Clean name spelling: unicode composition, surrounding and repeated whitespace
+    :param name:                player name
+    :return:                    cleaned name
+    """
+    return WHITESPACE_REGEX.sub(" ", unicodedata.normalize("NFC", name)).strip()
+
+
+def name_key(name):
+    """
+    Key identifying a player regardless of spelling variant: accents, letter case, whitespace and punctuation are
+    ignored, e.g. `Del Potro J.M.` and `del potro J. M` have the same key
+    :param name:                player name
+    :return:                    normalized key
+    """
+    decomposed = unicodedata.normalize("NFKD", name)
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    key = NON_ALPHANUMERIC_REGEX.sub("", stripped).casefold()
+    # names without letters and digits are kept distinguishable
+    return key or clean_name(name).casefold()
+
+
+@functools.lru_cache(maxsize=None)
+def load_aliases(aliases_file=None):
+    """
+    Load and cache aliases file: JSON object {spelling variant: canonical name}
+    :param aliases_file:        path to aliases file, default is taken from configuration
+    :return:                    dictionary {key of spelling variant: canonical name}
+    """
+    aliases_file = aliases_file or config["players"].get("aliases")
+    if not aliases_file or not os.path.exists(aliases_file):
+        logging.info("Player aliases file {} was not found, names are only cleaned".format(aliases_file))
+        return {}
+    with open(aliases_file, "r", encoding="utf-8") as f:
+        aliases = json.load(f)
+    return {name_key(variant): clean_name(name) for variant, name in aliases.items()}
+
+
+def normalize_name(name, aliases=None):
+    """
+    Clean name and replace known spelling variant by canonical name
+    :param name:                player name
+    :param aliases:             dictionary returned by `load_aliases`
+    :return:                    normalized name
+    """
+    name = clean_name(name)
+    if aliases:
+        return aliases.get(name_key(name), name)
+    return name
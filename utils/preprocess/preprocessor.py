@@ -2,20 +2,102 @@
 Preprocessor and PreprocessTransformation classes
 """
 
+import re
+import time
 import logging
+import datetime
 import numpy as np
 import pandas as pd
 from utils.logging.helpers import log_and_warn
+from utils.preprocess.names import load_aliases, normalize_name as normalize_player_name
+
+# operations applied to a block of columns at once, see `PreprocessStep`
+BLOCK_OPERATIONS = ("fill_na_with_value", "fill_na_and_negatives")
+
+# ISO 8601 date with optional time and UTC offset, the time part is not stored
+ISO_DATE_PATTERN = r"^(\d{4}-\d{1,2}-\d{1,2})(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?)?$"
+
+
+def parse_date(value):
+    """
+    Parse a single date, see `parse_dates`
+    :param value:                       datetime, ISO 8601 string or number of milliseconds since epoch
+    :return:                            Timestamp or NaT if value can't be parsed
+    """
+    try:
+        if isinstance(value, (datetime.date, np.datetime64)):
+            return pd.Timestamp(value).normalize()
+        if isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_)):
+            return pd.NaT if np.isnan(value) else pd.Timestamp(float(value), unit="ms").normalize()
+        match = re.match(ISO_DATE_PATTERN, str(value).strip())
+        if match:
+            return pd.Timestamp(datetime.datetime.strptime(match.group(1), "%Y-%m-%d"))
+    except (ValueError, OverflowError):
+        pass
+    return pd.NaT
+
+
+def parse_dates(col):
+    """
+    Parse dates as written by supported sources: datetime values (Excel files), ISO 8601 dates and datetimes and
+    numbers of milliseconds since epoch (JSON written by pandas). Values which can't be parsed are replaced with NaT
+    :param col:                         Series of dates
+    :return:                            Series of datetime64 values
+    """
+    if pd.api.types.is_datetime64_any_dtype(col.dtype):
+        return col
+    if pd.api.types.is_numeric_dtype(col.dtype) and not pd.api.types.is_bool_dtype(col.dtype):
+        return pd.to_datetime(col, unit="ms", errors="coerce")
+    # a column has few distinct dates, so only distinct values are parsed, missing values have code -1
+    codes, uniques = pd.factorize(col)
+    parsed = [parse_date(value) for value in uniques] + [pd.NaT]
+    values = pd.DatetimeIndex(parsed).to_numpy(dtype="datetime64[ns]")[codes]
+    return pd.Series(values, index=col.index, name=col.name)
+
 
 class Preprocessor:
     """
-    Implements preprocessor to apply multiple standardized preprocess operations on a data DataFrame
+    Implements preprocessor to apply multiple standardized preprocess operations on a data DataFrame.
+    Transformations are compiled into an execution plan: in-place transformations with the same operation and
+    arguments are grouped and applied to a block of columns in one vectorized pass, other transformations are applied
+    one by one in the original order
     """
-    def __init__(self, transformations):
+    def __init__(self, transformations, timing=False):
         """
         :param transformations:             an iterable of `PreprocessTransformation` objects to apply
+        :param timing:                      if True, execution time of every plan step is logged after calculation
         """
         self.transformations = transformations
+        self.timing = timing
+        self.timings = []
+        self.plan = self.compile(transformations)
+
+    @staticmethod
+    def compile(transformations):
+        """
+        Build execution plan
+        :param transformations:             an iterable of `PreprocessTransformation` objects
+        :return:                            list of `PreprocessStep` objects
+        """
+        transformations = list(transformations)
+        # columns used by more than one transformation keep sequential execution to preserve dependencies
+        usage = {}
+        for transformation in transformations:
+            for col in set(transformation.input_cols + [transformation.output_col]):
+                usage[col] = usage.get(col, 0) + 1
+
+        plan = []
+        groups = {}
+        for transformation in transformations:
+            if transformation.is_block_operation() and usage[transformation.output_col] == 1:
+                key = transformation.block_key()
+                if key not in groups:
+                    groups[key] = PreprocessStep(key[0], [], *transformation.args, **transformation.kwargs)
+                    plan.append(groups[key])
+                groups[key].transformations.append(transformation)
+            else:
+                plan.append(PreprocessStep(None, [transformation]))
+        return plan
 
     def calculate(self, data):
         """
@@ -23,10 +105,142 @@ class Preprocessor:
         :param data:                        an input DataFrame
         :return:                            a DataFrame with all preprocessing transformations applied
         """
-        for transformation in self.transformations:
-            data[transformation.output_col] = transformation.calculate(data)
+        summary = PreprocessSummary()
+        self.timings = []
+        for step in self.plan:
+            t1 = time.perf_counter()
+            step.calculate(data, summary)
+            self.timings.append((step, time.perf_counter() - t1))
+        summary.report()
+        if self.timing:
+            self.report_timings()
         return data
 
+    def report_timings(self):
+        """
+        Log execution time of every plan step of the last calculation
+        """
+        total = sum(t for _, t in self.timings)
+        for step, t in sorted(self.timings, key=lambda x: x[1], reverse=True):
+            logging.info("Preprocessing timing: {} took {:.2f} ms".format(step, t * 1000))
+        logging.info("Preprocessing timing: {} steps took {:.2f} ms".format(len(self.timings), total * 1000))
+
+
+class PreprocessStep:
+    """
+    Implements single step of preprocessor execution plan: either one transformation or a block operation applied to
+    multiple columns at once
+    """
+    def __init__(self, operation, transformations, *args, **kwargs):
+        """
+        :param operation:                   name of block operation or None for a single transformation
+        :param transformations:             list of `PreprocessTransformation` objects of the step
+        """
+        self.operation = operation
+        self.transformations = transformations
+        self.args = args
+        self.kwargs = kwargs
+
+    def __repr__(self):
+        if self.operation is None:
+            return repr(self.transformations[0])
+        return "PreprocessStep({}, columns={})".format(self.operation, [t.output_col for t in self.transformations])
+
+    def calculate(self, data, summary):
+        """
+        Apply step to DataFrame in place
+        :param data:                        an input DataFrame
+        :param summary:                     PreprocessSummary object collecting data issues
+        """
+        if self.operation is None:
+            transformation = self.transformations[0]
+            data[transformation.output_col] = transformation.calculate(data)
+            return
+
+        columns = [t.output_col for t in self.transformations]
+        missing = [col for col in columns if col not in data.columns]
+        for col in missing:
+            logging.warning(
+                "{}: input column {} wasn't found in provided DataFrame "
+                "for {} calculation".format(self.__class__.__name__, col, col)
+            )
+            data[col] = None
+        columns = [col for col in columns if col not in missing]
+        if columns:
+            getattr(self, self.operation)(data, columns, summary, *self.args, **self.kwargs)
+
+    @staticmethod
+    def fill_na_with_value(data, columns, summary, value):
+        """Fills missing values of a block of columns with provided value
+        """
+        block = data[columns]
+        na_counts = block.isna().sum()
+        summary.add("NA values filled with `{}`".format(value), na_counts)
+        filled = [col for col in columns if na_counts[col] > 0]
+        if filled:
+            data[filled] = block[filled].fillna(value=value)
+
+    @staticmethod
+    def fill_na_and_negatives(data, columns, summary, na_fill_value=0, negative_fill_value=0):
+        """
+        Block version of `PreprocessTransformation.fill_na_and_negatives`: converts columns to numeric, fills missing
+        and negative values in one pass over a 2D array
+        """
+        block = data[columns]
+        # extension dtypes (e.g. strings) are not numpy dtypes, so dtypes are checked by pandas
+        numeric = [col for col in columns if pd.api.types.is_numeric_dtype(block[col].dtype)
+                   and not pd.api.types.is_bool_dtype(block[col].dtype)]
+        integer = [col for col in numeric if pd.api.types.is_integer_dtype(block[col].dtype)]
+        # column-major layout keeps every column contiguous for per-column writes and reductions
+        values = np.empty(block.shape, dtype=np.float64, order="F")
+        for i, col in enumerate(columns):
+            if col in numeric:
+                values[:, i] = block[col].to_numpy(dtype=np.float64)
+            else:
+                values[:, i] = pd.to_numeric(block[col], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+
+        na_mask = np.isnan(values)
+        non_numeric = na_mask & block.notna().to_numpy()
+        summary.add("non-numeric values replaced with `{}`".format(na_fill_value), pd.Series(non_numeric.sum(axis=0), index=columns))
+        summary.add("NA values filled with `{}`".format(na_fill_value), pd.Series((na_mask & ~non_numeric).sum(axis=0), index=columns))
+        values[na_mask] = na_fill_value
+
+        negative_mask = values < 0
+        summary.add("negative values filled with `{}`".format(negative_fill_value), pd.Series(negative_mask.sum(axis=0), index=columns))
+        values[negative_mask] = negative_fill_value
+
+        result = pd.DataFrame(values, columns=columns, index=data.index, copy=False)
+        # integer columns without missing values keep their type as in sequential preprocessing
+        for col in integer:
+            result[col] = result[col].astype(block[col].dtype)
+        data[columns] = result
+
+
+class PreprocessSummary:
+    """
+    Implements aggregation of data issues found during preprocessing, reported as a single warning
+    """
+    def __init__(self):
+        self.issues = {}
+
+    def add(self, issue, counts):
+        """
+        Add number of affected values per column
+        :param issue:                       description of the issue
+        :param counts:                      Series of number of affected values indexed by column name
+        """
+        counts = {col: int(n) for col, n in counts.items() if n > 0}
+        if counts:
+            self.issues.setdefault(issue, {}).update(counts)
+
+    def report(self):
+        if not self.issues:
+            return
+        log_and_warn("Preprocessing summary: " + "; ".join(
+            "{} {} ({})".format(sum(counts.values()), issue, ", ".join("{}: {}".format(col, n) for col, n in counts.items()))
+            for issue, counts in self.issues.items()
+        ))
+
 
 class PreprocessTransformation():
     """
@@ -56,7 +270,11 @@ class PreprocessTransformation():
         self.kwargs = kwargs
         
         if isinstance(calculation_func, str):
+            self.calculation_name = calculation_func
             self.calculation_func = getattr(self, calculation_func)
+        else:
+            self.calculation_name = None
+            self.calculation_func = calculation_func
             
     def calculate(self, df):
         """
@@ -75,6 +293,19 @@ class PreprocessTransformation():
                 return None
         return self.calculation_func(*[df[input_col] for input_col in self.input_cols], *self.args, **self.kwargs)
             
+    def is_block_operation(self):
+        """
+        Check if transformation can be applied as a part of block operation, i.e. it is an in-place transformation
+        with an operation supported by `PreprocessStep`
+        """
+        return self.calculation_name in BLOCK_OPERATIONS and self.input_cols == [self.output_col]
+
+    def block_key(self):
+        """
+        Key of transformations that can be applied together in one block operation
+        """
+        return self.calculation_name, self.args, tuple(sorted(self.kwargs.items()))
+
     def __repr__(self):
         """PreprocessTransformation string representation
         """
@@ -91,7 +322,7 @@ class PreprocessTransformation():
         """Transforms column to numeric format
         """
         # check if column is already numeric
-        if np.issubdtype(col.dtype, np.number):
+        if pd.api.types.is_numeric_dtype(col.dtype) and not pd.api.types.is_bool_dtype(col.dtype):
             return col
         col = pd.to_numeric(col, errors="coerce")
         num_non_numeric = col.isna().sum()
@@ -103,10 +334,11 @@ class PreprocessTransformation():
         return col
 
     @staticmethod
-    def to_datetime(col, dt_format="%Y-%m-%d"):
-        """Transforms string column to datetime format
+    def to_datetime(col, dt_format=None):
+        """Transforms string column to datetime format, formats accepted by `parse_dates` are parsed if `dt_format` is None
         """
-        parsed = pd.to_datetime(col, format=dt_format, errors="coerce").dt.normalize()
+        parsed = parse_dates(col) if dt_format is None else pd.to_datetime(col, format=dt_format, errors="coerce")
+        parsed = parsed.dt.normalize()
         num_not_parsed = pd.isnull(parsed).sum() - pd.isnull(col).sum()
         if num_not_parsed > 0:
             log_and_warn(
@@ -116,10 +348,11 @@ class PreprocessTransformation():
         return parsed
 
     @staticmethod
-    def to_date(col, dt_format="%Y-%m-%d"):
-        """Transforms string column to date format
+    def to_date(col, dt_format=None):
+        """Transforms string column to date format, formats accepted by `parse_dates` are parsed if `dt_format` is None
         """
-        parsed = pd.to_datetime(col, format=dt_format, errors="coerce").dt.date
+        parsed = parse_dates(col) if dt_format is None else pd.to_datetime(col, format=dt_format, errors="coerce")
+        parsed = parsed.dt.date
         num_not_parsed = pd.isnull(parsed).sum() - pd.isnull(col).sum()
         if num_not_parsed > 0:
             log_and_warn(
@@ -129,6 +362,18 @@ class PreprocessTransformation():
         return parsed
 
 
+    @staticmethod
+    def normalize_name(col):
+        """Normalizes spelling of player names and replaces known variants by canonical names from aliases file
+        """
+        aliases = load_aliases()
+        mapping = {name: normalize_player_name(str(name), aliases) for name in col.dropna().unique()}
+        changed = sum(1 for name, normalized in mapping.items() if name != normalized)
+        if changed > 0:
+            logging.info("{} distinct names were normalized in column `{}`".format(changed, col.name))
+            return col.map(mapping)
+        return col
+
     @staticmethod
     def fill_na_with_value(col, value):
         """Fills missing values with provided value
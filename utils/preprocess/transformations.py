@@ -12,6 +12,8 @@ TOURNAMENTS_PREPROCESS = [
 RESULTS_PREPROCESS = [
     PreprocessTransformation("Winner", "Winner", "fill_na_with_value", ""),
     PreprocessTransformation("Loser", "Loser", "fill_na_with_value", ""),
+    PreprocessTransformation("Winner", "Winner", "normalize_name"),
+    PreprocessTransformation("Loser", "Loser", "normalize_name"),
     PreprocessTransformation("Round", "Round", "fill_na_with_value", ""),
     PreprocessTransformation("Best of", "Best of", "fill_na_and_negatives", 0, 0),
     PreprocessTransformation("WRank", "WRank", "fill_na_and_negatives", 0, 0),
@@ -0,0 +1,5 @@
+from .base import StorageBackend
+from .sqlite import SQLiteBackend
+from .parquet import ParquetBackend
+from .factory import STORAGE_BACKENDS, get_storage_backend
+from .snapshots import get_snapshot_store, restore_database
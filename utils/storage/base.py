@@ -0,0 +1,67 @@
+"""
+Storage backend interface.
+Backends store tournaments, results and bets data and serve the denormalized `matches` view with the same filters,
+global search and pagination as the API accepts
+"""
+
+import config as c
+
+
+class StorageBackend:
+    """
+    Base class of storage backends
+    """
+    name = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Release resources held by backend
+        """
+
+    def save_data(self, df, table, overwrite=False):
+        """
+        Save data to table
+        :param df:                      DataFrame indexed by primary key of the table
+        :param table:                   table key: `tournaments`, `results` or `bets`
+        :param overwrite:               replace rows with already stored primary keys if True, ignore them otherwise
+        """
+        self.save_frames({table: df}, overwrite=overwrite)
+
+    def save_frames(self, frames, overwrite=False):
+        """
+        Save data to multiple tables
+        :param frames:                  dictionary {table key: DataFrame indexed by primary key}
+        :param overwrite:               replace rows with already stored primary keys if True, ignore them otherwise
+        """
+        raise NotImplementedError
+
+    def get_data(self, columns=c.VALID_FILTER_FIELDS+["Year"], rows=c.NROWS_PER_PAGE, page=1, sortby=["ATP", "Year"],
+                 sort_order="asc", search=None, cursor=None, **filters):
+        """
+        Get matches data, parameters are the same as for `DBConnector.get_db_data`
+        :return:                        DataFrame
+        """
+        raise NotImplementedError
+
+    def delete_data(self, table, search=None, **filters):
+        """
+        Delete data from table, results and bets of deleted tournaments are deleted as well
+        :param table:                   table key: `tournaments`, `results` or `bets`
+        :param search:                  phrase for global search
+        :param filters:                 `and_filters` and `or_filters` dictionaries
+        """
+        raise NotImplementedError
+
+    def search(self, phrase, columns=c.VALID_FILTER_FIELDS+["Year"], rows=c.NROWS_PER_PAGE, page=1, **filters):
+        """
+        Get matches containing search phrase
+        :param phrase:                  phrase for global search
+        :return:                        DataFrame
+        """
+        return self.get_data(columns=columns, rows=rows, page=page, search=phrase, **filters)
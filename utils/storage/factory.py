@@ -0,0 +1,26 @@
+"""
+Storage backend selection by name
+"""
+
+from config import config
+
+from utils.storage.sqlite import SQLiteBackend
+from utils.storage.parquet import ParquetBackend
+
+STORAGE_BACKENDS = {
+    SQLiteBackend.name: SQLiteBackend,
+    ParquetBackend.name: ParquetBackend,
+}
+
+
+def get_storage_backend(name=None, **kwargs):
+    """
+    Create storage backend
+    :param name:                    backend name (`sqlite` or `parquet`), default is taken from configuration
+    :param kwargs:                  arguments of backend constructor
+    :return:                        StorageBackend object
+    """
+    name = name or config["storage"].get("backend", SQLiteBackend.name)
+    if name not in STORAGE_BACKENDS:
+        raise ValueError("Unknown storage backend: {}".format(name))
+    return STORAGE_BACKENDS[name](**kwargs)
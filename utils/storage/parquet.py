@@ -0,0 +1,531 @@
+"""
+Columnar storage backend: year-partitioned Parquet datasets.
+Every table is stored as a hive-partitioned dataset `<base_dir>/<table>/Year=<year>/part-0.parquet` plus files of
+appended rows, the denormalized `matches` dataset is rebuilt for every year written. Stored files are listed with row
+counts and checksums in `manifest.json`, so the store also serves as a restorable snapshot of the database. Filters are converted into pyarrow dataset expressions, so
+partitions of other years are skipped, row groups are pruned by column statistics and only requested columns are read
+"""
+
+import os
+import json
+import time
+import logging
+import operator
+import threading
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+import config as c
+from config import config
+
+from utils.db.query import QueryBuilder, decode_cursor
+from utils.db.schema import load_db_schema, get_column_types, get_numeric_columns, get_date_columns, NUMERIC_TYPES, DATE_TYPES
+from utils.db.frames import INTEGER_TYPES
+from utils.db.matches import MATCH_COLUMNS, TOURNAMENT_COLUMNS, RESULT_COLUMNS, BET_COLUMNS
+from utils.db.players import PLAYER_ID_COLUMNS
+from utils.helpers import decode_url_symbols
+from utils.loader.download_cache import file_sha256
+from utils.storage.base import StorageBackend
+
+PARTITION_COLUMN = "Year"
+PART_FILE = "part-0.parquet"
+APPEND_PREFIX = "append-"
+MANIFEST_FILE = "manifest.json"
+MATCHES = "matches"
+
+# files are keyed by player names, player ids exist only in database
+MATCH_KEYS = c.PRIMARY_KEYS["results"]
+MATCH_FIELDS = [f for f in MATCH_COLUMNS if f not in PLAYER_ID_COLUMNS.values()]
+
+TABLE_FIELDS = {
+    "tournaments": c.TOURNAMENTS_FIELDS,
+    "results": c.RESULTS_FIELDS,
+    "bets": c.BETS_FIELDS,
+    MATCHES: MATCH_FIELDS,
+}
+
+OPERATORS = {
+    ">=": operator.ge,
+    "<=": operator.le,
+    ">": operator.gt,
+    "<": operator.lt,
+    "!=": operator.ne,
+}
+
+# filters are parsed exactly as for SQL queries
+QUERY_BUILDER = QueryBuilder(numeric_columns=get_numeric_columns(), date_columns=get_date_columns())
+
+_WRITE_LOCK = threading.Lock()
+
+
+def arrow_type(sql_type):
+    """
+    Get Arrow type of SQL column type
+    """
+    if sql_type in INTEGER_TYPES:
+        return pa.int64()
+    if sql_type in NUMERIC_TYPES:
+        return pa.float64()
+    if sql_type in DATE_TYPES:
+        return pa.date32()
+    return pa.string()
+
+
+def build_match_frame(tournaments, results, bets):
+    """
+    Join tournaments, results and bets of a year into match rows, the same way as `tournaments_matches` table is built
+    """
+    tournaments = tournaments.reindex(columns=["ATP", "Year", "Date"] + TOURNAMENT_COLUMNS)
+    results = results.reindex(columns=MATCH_KEYS + ["Date"] + RESULT_COLUMNS).rename(columns={"Date": "ResultDate"})
+    bets = bets.reindex(columns=MATCH_KEYS + ["Date"] + BET_COLUMNS).rename(columns={"Date": "BetDate"})
+    matches = tournaments.merge(results, on=["ATP", "Year"], how="left").merge(bets, on=MATCH_KEYS, how="left")
+    matches["Date"] = matches["Date"].fillna(matches["ResultDate"]).fillna(matches["BetDate"])
+    return matches.reindex(columns=MATCH_FIELDS)
+
+
+class ParquetBackend(StorageBackend):
+    """
+    Implements storage backend on year-partitioned Parquet files
+    """
+    name = "parquet"
+
+    def __init__(self, base_dir=None, compression=None, row_group_size=None):
+        """
+        :param base_dir:                directory of datasets, default is taken from configuration
+        :param compression:             Parquet compression codec, default is taken from configuration
+        :param row_group_size:          maximum number of rows in a row group, default is taken from configuration
+        """
+        if pa is None:
+            raise ImportError("pyarrow is required for Parquet storage backend")
+        self.base_dir = base_dir or config["storage"]["parquet_dir"]
+        self.compression = compression or config["storage"].get("compression", "zstd")
+        self.row_group_size = row_group_size or config["storage"].getint("row_group_size", 100000)
+        self.manifest_file = os.path.join(self.base_dir, MANIFEST_FILE)
+        self.column_types = get_column_types()
+        # partitions written since the last manifest update
+        self._written = set()
+
+    def _check_table(self, table, matches=False):
+        if table not in TABLE_FIELDS or (table == MATCHES and not matches):
+            raise ValueError("Invalid table: {}".format(table))
+
+    def _file_schema(self, table):
+        """
+        Schema of partition files, partition column is stored in directory name only
+        """
+        return pa.schema([
+            (f, arrow_type(self.column_types.get(f))) for f in TABLE_FIELDS[table] if f != PARTITION_COLUMN
+        ])
+
+    def _partition_path(self, table, year):
+        return os.path.join(self.base_dir, table, "{}={:d}".format(PARTITION_COLUMN, int(year)), PART_FILE)
+
+    def _dataset(self, table):
+        """
+        Open dataset of a table
+        :return:                        pyarrow Dataset or None if nothing was saved to the table yet
+        """
+        path = os.path.join(self.base_dir, table)
+        if not os.path.isdir(path):
+            return None
+        partitioning = ds.partitioning(pa.schema([(PARTITION_COLUMN, pa.int64())]), flavor="hive")
+        schema = self._file_schema(table).append(pa.field(PARTITION_COLUMN, pa.int64()))
+        return ds.dataset(path, schema=schema, format="parquet", partitioning=partitioning)
+
+    def _to_arrow(self, df, table):
+        """
+        Convert DataFrame to Arrow table with the declared column types, missing columns are filled with nulls
+        """
+        arrays = []
+        for field in self._file_schema(table):
+            if field.name not in df.columns:
+                arrays.append(pa.nulls(len(df), type=field.type))
+                continue
+            values = df[field.name]
+            missing = values.isna().to_numpy()
+            if pa.types.is_string(field.type):
+                arrays.append(pa.array(values.astype(str).to_numpy(dtype=object), type=field.type, mask=missing))
+            elif pa.types.is_date32(field.type):
+                dates = pa.array(pd.to_datetime(values, errors="coerce"), from_pandas=True)
+                arrays.append(pc.cast(dates, field.type, safe=False))
+            else:
+                arrays.append(pa.array(pd.to_numeric(values, errors="coerce"), type=field.type, from_pandas=True))
+        return pa.Table.from_arrays(arrays, schema=self._file_schema(table))
+
+    @staticmethod
+    def _to_frame(table):
+        """
+        Convert Arrow table to DataFrame with the same dtypes as data read from database
+        """
+        df = table.to_pandas(date_as_object=False, types_mapper={pa.int64(): pd.Int64Dtype()}.get)
+        for column in df.columns:
+            if isinstance(df[column].dtype, pd.Int64Dtype) and not df[column].hasnans:
+                df[column] = df[column].astype(np.int64)
+        return df
+
+    def _partition_files(self, table, year):
+        """
+        Data files of a partition: compacted file first, then appended files in order of writing
+        """
+        directory = os.path.dirname(self._partition_path(table, year))
+        if not os.path.isdir(directory):
+            return []
+        appended = sorted(f for f in os.listdir(directory) if f.startswith(APPEND_PREFIX) and f.endswith(".parquet"))
+        files = [PART_FILE] if os.path.exists(os.path.join(directory, PART_FILE)) else []
+        return [os.path.join(directory, f) for f in files + appended]
+
+    def _read_partition(self, table, year):
+        files = self._partition_files(table, year)
+        if not files:
+            return pd.DataFrame(columns=TABLE_FIELDS[table] + [PARTITION_COLUMN])
+        df = self._to_frame(pa.concat_tables([pq.read_table(f, schema=self._file_schema(table)) for f in files]))
+        if table in c.PRIMARY_KEYS and len(files) > 1:
+            # files are concatenated in order of writing, so appended rows replace stored rows, as upsert
+            df = df.drop_duplicates(subset=[k for k in c.PRIMARY_KEYS[table] if k != PARTITION_COLUMN], keep="last")
+        df[PARTITION_COLUMN] = int(year)
+        return df
+
+    def read_table(self, table, year):
+        """
+        Read all rows of a table stored for a year
+        :param table:                   table key: `tournaments`, `results`, `bets` or `matches`
+        :param year:                    partition year
+        :return:                        DataFrame
+        """
+        self._check_table(table, matches=True)
+        return self._read_partition(table, year)
+
+    def _write_file(self, table, path, df):
+        """
+        Write file atomically, so readers always see a complete file.
+        Temporary file name starts with a dot and is ignored by dataset discovery
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = os.path.join(os.path.dirname(path), "." + os.path.basename(path) + ".tmp")
+        pq.write_table(self._to_arrow(df, table), tmp_path, compression=self.compression, row_group_size=self.row_group_size)
+        os.replace(tmp_path, path)
+
+    def _write_partition(self, table, year, df):
+        """
+        Replace partition with a single compacted file, appended files are merged into it
+        """
+        appended = [f for f in self._partition_files(table, year) if os.path.basename(f).startswith(APPEND_PREFIX)]
+        self._write_file(table, self._partition_path(table, year), df)
+        for path in appended:
+            os.remove(path)
+        self._written.add((table, int(year)))
+
+    def _append_partition(self, table, year, df):
+        """
+        Add rows to partition as a separate file without rewriting stored rows
+        """
+        directory = os.path.dirname(self._partition_path(table, year))
+        # file names sort in order of writing, later files win on read
+        path = os.path.join(directory, "{}{:020d}.parquet".format(APPEND_PREFIX, time.time_ns()))
+        while os.path.exists(path):
+            path = os.path.join(directory, "{}{:020d}.parquet".format(APPEND_PREFIX, time.time_ns()))
+        self._write_file(table, path, df)
+        self._written.add((table, int(year)))
+
+    def _refresh_matches(self, years):
+        for year in years:
+            matches = build_match_frame(
+                self._read_partition("tournaments", year),
+                self._read_partition("results", year),
+                self._read_partition("bets", year),
+            )
+            self._write_partition(MATCHES, year, matches.sort_values(MATCH_KEYS))
+
+    def _save(self, df, table, overwrite, replace):
+        """
+        Merge data into year partitions of a table
+        :return:                        set of written years
+        """
+        keys = c.PRIMARY_KEYS[table]
+        df = df.reset_index()
+        years = set()
+        for year, data in df.groupby(PARTITION_COLUMN):
+            stored = pd.DataFrame() if replace else self._read_partition(table, year)
+            # the last frame wins: saved rows replace stored ones if `overwrite`, are ignored otherwise
+            frames = [stored, data] if overwrite else [data, stored]
+            merged = pd.concat([f for f in frames if not f.empty], ignore_index=True)
+            # partitions are sorted by primary key, so row group statistics of the key columns are selective
+            merged = merged.drop_duplicates(subset=keys, keep="last").sort_values(keys)
+            self._write_partition(table, year, merged)
+            years.add(int(year))
+        return years
+
+    def save_frames(self, frames, overwrite=False, replace=False):
+        """
+        Save data to multiple tables, see `StorageBackend.save_frames`
+        :param replace:                 drop stored rows of the written years, so partitions contain only saved data
+        """
+        t1 = time.time()
+        years = set()
+        with _WRITE_LOCK:
+            for table in ("tournaments", "results", "bets"):
+                if table in frames and not frames[table].empty:
+                    years |= self._save(frames[table], table, overwrite, replace)
+            self._refresh_matches(sorted(years))
+            self._update_manifest()
+        logging.info("Parquet: {} rows of years {} were saved in {:.2f} seconds".format(
+            sum(len(df) for df in frames.values()), sorted(years), time.time() - t1))
+
+    def append_frames(self, frames, refresh=True):
+        """
+        Append data to multiple tables without rewriting stored rows. Appended rows replace rows with the same primary
+        keys on read, appended files are compacted on the next save of the year
+        :param frames:                  dictionary {table key: DataFrame indexed by primary key}
+        :param refresh:                 rebuild matches of the written years and update manifest, callers appending
+                                        several batches call `refresh` once after the last one instead
+        :return:                        set of written years
+        """
+        t1 = time.time()
+        years = set()
+        with _WRITE_LOCK:
+            for table in ("tournaments", "results", "bets"):
+                if table not in frames or frames[table].empty:
+                    continue
+                df = frames[table].reset_index()
+                for year, data in df.groupby(PARTITION_COLUMN):
+                    self._append_partition(table, year, data.drop_duplicates(subset=c.PRIMARY_KEYS[table], keep="last"))
+                    years.add(int(year))
+            if refresh:
+                self._refresh_matches(sorted(years))
+                self._update_manifest()
+        logging.info("Parquet: {} rows of years {} were appended in {:.2f} seconds".format(
+            sum(len(df) for df in frames.values()), sorted(years), time.time() - t1))
+        return years
+
+    def refresh(self, years):
+        """
+        Rebuild matches of the years and record written files in manifest
+        :param years:                   iterable of years written by `append_frames`
+        """
+        t1 = time.time()
+        with _WRITE_LOCK:
+            self._refresh_matches(sorted(years))
+            self._update_manifest()
+        logging.info("Parquet: matches of years {} were refreshed in {:.2f} seconds".format(sorted(years), time.time() - t1))
+
+    def load_manifest(self):
+        """
+        Load manifest of stored files
+        :return:                        dictionary {"schema_version", "updated",
+                                        "tables": {table: {year: list of {"file", "rows", "bytes", "sha256"}}}}
+        """
+        if not os.path.exists(self.manifest_file):
+            return {"schema_version": None, "updated": None, "tables": {}}
+        with open(self.manifest_file, "r") as f:
+            return json.load(f)
+
+    def _update_manifest(self):
+        """
+        Record files of partitions written since the last update
+        """
+        if not self._written:
+            return
+        manifest = self.load_manifest()
+        for table, year in sorted(self._written):
+            entries = []
+            for path in self._partition_files(table, year):
+                entries.append({
+                    "file": os.path.relpath(path, self.base_dir).replace(os.sep, "/"),
+                    "rows": pq.ParquetFile(path).metadata.num_rows,
+                    "bytes": os.path.getsize(path),
+                    "sha256": file_sha256(path),
+                })
+            manifest["tables"].setdefault(table, {})[str(year)] = entries
+        self._written = set()
+        manifest["schema_version"] = load_db_schema().get("version")
+        manifest["updated"] = time.time()
+
+        tmp_file = os.path.join(self.base_dir, "." + MANIFEST_FILE + ".tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_file, self.manifest_file)
+
+    def verify(self, years=None):
+        """
+        Check stored files against manifest
+        :param years:                   years to check, all years in manifest if None
+        :return:                        list of error messages, empty if all files are intact
+        """
+        errors = []
+        for table, partitions in self.load_manifest()["tables"].items():
+            for year, entries in partitions.items():
+                if years is not None and int(year) not in years:
+                    continue
+                for entry in entries:
+                    path = os.path.join(self.base_dir, entry["file"])
+                    if not os.path.exists(path):
+                        errors.append("File {} is missing".format(entry["file"]))
+                    elif file_sha256(path) != entry["sha256"]:
+                        errors.append("File {} does not match manifest checksum".format(entry["file"]))
+        return errors
+
+    def _condition(self, schema, key, operation, values):
+        if schema.get_field_index(key) < 0:
+            raise ValueError("Invalid filter field: {}".format(key))
+        if pa.types.is_date32(schema.field(key).type):
+            try:
+                values = [pd.Timestamp(v).date() for v in values]
+            except ValueError:
+                raise ValueError("Invalid date value for filter {}: {}".format(key, values))
+        field = ds.field(key)
+        if operation == "in":
+            return field.isin(values)
+        if operation == "between":
+            return (field >= values[0]) & (field <= values[1])
+        return OPERATORS[operation](field, values[0])
+
+    def _search_expression(self, schema, search, search_columns):
+        """
+        Case-insensitive substring search over columns, as LIKE search of SQLite
+        """
+        search = decode_url_symbols(str(search))
+        expression = None
+        for column in search_columns:
+            if schema.get_field_index(column) < 0:
+                continue
+            field = ds.field(column)
+            if not pa.types.is_string(schema.field(column).type):
+                field = field.cast(pa.string())
+            condition = pc.match_substring(field, search, ignore_case=True)
+            expression = condition if expression is None else expression | condition
+        return expression
+
+    def _filter_expression(self, schema, search=None, search_columns=c.SEARCH_FIELDS, **filters):
+        """
+        Convert `and_filters`, `or_filters` and global search into dataset expression
+        :return:                        pyarrow Expression or None if there are no conditions
+        """
+        and_expressions = [
+            self._condition(schema, *condition) for condition in QUERY_BUILDER.iter_conditions(filters.get("and_filters"))
+        ]
+        or_expressions = []
+        for key, values in (filters.get("or_filters") or {}).items():
+            conditions = [self._condition(schema, *condition) for condition in QUERY_BUILDER.iter_conditions({key: values})]
+            or_expressions.append(_combine(conditions, operator.and_))
+        if search:
+            search_expression = self._search_expression(schema, search, search_columns)
+            if search_expression is not None:
+                or_expressions.append(search_expression)
+        if or_expressions:
+            and_expressions.append(_combine(or_expressions, operator.or_))
+        return _combine(and_expressions, operator.and_)
+
+    @staticmethod
+    def _seek_expression(keyset, after, sort_order):
+        """
+        Select rows following `after` key in `keyset` order, key columns with missing values are compared by prefix
+        """
+        size = next((i for i, v in enumerate(after) if v is None), len(after))
+        if len(after) != len(keyset) or size == 0:
+            raise ValueError("Invalid pagination cursor")
+        compare = operator.gt if sort_order == "asc" else operator.lt
+        expression = None
+        equal = None
+        for column, value in zip(keyset[:size], after[:size]):
+            condition = compare(ds.field(column), value)
+            if equal is not None:
+                condition = equal & condition
+            expression = condition if expression is None else expression | condition
+            equal = ds.field(column) == value if equal is None else equal & (ds.field(column) == value)
+        return expression
+
+    def get_data(self, columns=c.VALID_FILTER_FIELDS+["Year"], rows=c.NROWS_PER_PAGE, page=1, sortby=["ATP", "Year"],
+                 sort_order="asc", search=None, cursor=None, **filters):
+        """
+        Get matches data, parameters are the same as for `DBConnector.get_db_data`.
+        Global search is a case-insensitive substring search over `SEARCH_FIELDS`
+        """
+        sort_order = sort_order.lower()
+        if sort_order not in ("asc", "desc"):
+            raise ValueError("Invalid sorting order: {}".format(sort_order))
+        columns = list(MATCH_FIELDS) if columns is None else list(columns)
+
+        after = None
+        if cursor is not None:
+            sortby = c.KEYSET_COLUMNS
+            after = decode_cursor(cursor) if cursor else None
+            columns += [k for k in c.KEYSET_COLUMNS if k not in columns]
+
+        dataset = self._dataset(MATCHES)
+        if dataset is None:
+            return pd.DataFrame(columns=columns)
+        expression = self._filter_expression(dataset.schema, search=search, **filters)
+        if after is not None:
+            expression = _combine([expression, self._seek_expression(c.KEYSET_COLUMNS, after, sort_order)], operator.and_)
+
+        sortby = list(sortby) if sortby else []
+        read_columns = columns + [col for col in sortby if col not in columns]
+        for column in read_columns:
+            if dataset.schema.get_field_index(column) < 0:
+                raise ValueError("Invalid column: {}".format(column))
+
+        t1 = time.time()
+        data = self._to_frame(dataset.to_table(columns=read_columns, filter=expression))
+        if sortby:
+            # missing values are the smallest, as in SQLite
+            data = data.sort_values(
+                sortby, ascending=sort_order == "asc", na_position="first" if sort_order == "asc" else "last", kind="stable")
+        if rows is not None:
+            rows = int(rows)
+            start = 0 if cursor is not None else (int(page) - 1) * rows
+            data = data.iloc[start:start + rows]
+        logging.info("Parquet: {} rows of {} columns were read in {:.3f} seconds".format(
+            len(data), len(read_columns), time.time() - t1))
+        return data[columns].reset_index(drop=True)
+
+    def delete_data(self, table, search=None, **filters):
+        self._check_table(table)
+        dataset = self._dataset(table)
+        if dataset is None:
+            return
+        keys = c.PRIMARY_KEYS[table]
+        search_columns = [f for f in c.SEARCH_FIELDS if dataset.schema.get_field_index(f) >= 0]
+        expression = self._filter_expression(dataset.schema, search=search, search_columns=search_columns, **filters)
+        t1 = time.time()
+        with _WRITE_LOCK:
+            deleted = self._to_frame(dataset.to_table(columns=keys, filter=expression))
+            for year, rows in deleted.groupby(PARTITION_COLUMN):
+                self._write_partition(table, year, _anti_join(self._read_partition(table, year), rows, keys))
+                if table == "tournaments":
+                    # results and bets of deleted tournaments are deleted as by ON DELETE CASCADE
+                    for dependent in ("results", "bets"):
+                        stored = self._read_partition(dependent, year)
+                        self._write_partition(dependent, year, _anti_join(stored, rows, ["ATP", "Year"]))
+            years = sorted(int(y) for y in deleted[PARTITION_COLUMN].unique())
+            self._refresh_matches(years)
+            self._update_manifest()
+        logging.info("Parquet: {} rows of years {} were deleted from {} in {:.2f} seconds".format(
+            len(deleted), years, table, time.time() - t1))
+
+
+def _combine(expressions, combine):
+    expressions = [e for e in expressions if e is not None]
+    if not expressions:
+        return None
+    result = expressions[0]
+    for expression in expressions[1:]:
+        result = combine(result, expression)
+    return result
+
+
+def _anti_join(df, rows, keys):
+    """
+    Rows of `df` whose keys are not present in `rows`
+    """
+    if df.empty:
+        return df
+    merged = df.merge(rows[keys].drop_duplicates(), on=keys, how="left", indicator=True)
+    return merged[merged["_merge"] == "left_only"].drop(columns="_merge")
@@ -0,0 +1,63 @@
+"""
+Database snapshots.
+Imported and uploaded data is written to the Parquet store, which keeps compressed typed year partitions of every table
+and a manifest with row counts and checksums. Database can be rebuilt from snapshots without network access
+"""
+
+import time
+import logging
+
+import config as c
+from config import config
+
+from utils.db.upsert import upsert_frames, TABLE_ORDER
+from utils.logging.helpers import log_and_warn
+from utils.storage import parquet
+from utils.storage.parquet import ParquetBackend
+
+
+def get_snapshot_store(base_dir=None):
+    """
+    Get snapshot store if snapshots are enabled
+    :param base_dir:                directory of snapshots, default is taken from configuration
+    :return:                        ParquetBackend object or None
+    """
+    if not config["storage"].getboolean("snapshots", True):
+        return None
+    if parquet.pa is None:
+        log_and_warn("Snapshots are disabled: pyarrow is not installed")
+        return None
+    return ParquetBackend(base_dir=base_dir)
+
+
+def restore_database(db_connector, store=None, years=None, verify=True):
+    """
+    Rebuild database tables from snapshots. Every year is written in one transaction, rows which are not present in
+    snapshot are deleted, so restore can be repeated on a non-empty database
+    :param db_connector:            DBConnector object
+    :param store:                   ParquetBackend object with snapshots, configured snapshot store if None
+    :param years:                   years to restore, all years listed in manifest if None
+    :param verify:                  check snapshot files against manifest checksums before restore
+    :return:                        dictionary {year: {table key: {"inserted", "updated", "deleted", "unchanged"}}}
+    """
+    store = store or ParquetBackend()
+    manifest = store.load_manifest()
+    available = sorted(int(y) for y in manifest["tables"].get("tournaments", {}))
+    years = available if years is None else sorted(int(y) for y in years)
+    missing = [y for y in years if y not in available]
+    if missing:
+        raise ValueError("No snapshots were found for years {}".format(missing))
+
+    if verify:
+        errors = store.verify(years)
+        if errors:
+            raise ValueError("Snapshots are corrupted: {}".format("; ".join(errors)))
+
+    report = {}
+    for year in years:
+        t1 = time.time()
+        frames = {table: store.read_table(table, year).set_index(c.PRIMARY_KEYS[table]) for table in TABLE_ORDER}
+        report[year] = upsert_frames(db_connector, frames, years=[year], delete_missing=True)
+        logging.info("Year {} was restored from snapshots in {:.2f} seconds".format(year, time.time() - t1))
+    db_connector.refresh_rollups(years)
+    return report
@@ -0,0 +1,50 @@
+"""
+SQLite storage backend: row-oriented storage through `DBConnector`
+"""
+
+import config as c
+
+from utils.db.connector import DBConnector
+from utils.db.upsert import upsert_frames, TABLE_ORDER
+from utils.storage.base import StorageBackend
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Implements storage backend on top of `DBConnector`
+    """
+    name = "sqlite"
+
+    def __init__(self, db_connector=None):
+        """
+        :param db_connector:            DBConnector object, a new connector owned by backend is created if None
+        """
+        self._owns_connector = db_connector is None
+        self.db_connector = db_connector or DBConnector()
+
+    def close(self):
+        if self._owns_connector:
+            self.db_connector.close()
+
+    def save_frames(self, frames, overwrite=False):
+        # all tables are saved in one transaction
+        frames = {t: frames[t] for t in TABLE_ORDER if t in frames}
+        years = set()
+        for df in frames.values():
+            years.update(df.index.get_level_values("Year").unique().tolist())
+        if overwrite:
+            upsert_frames(self.db_connector, frames, years=sorted(years))
+        else:
+            self.db_connector.save_batch(frames)
+        self.db_connector.refresh_rollups(years)
+
+    def get_data(self, columns=c.VALID_FILTER_FIELDS+["Year"], rows=c.NROWS_PER_PAGE, page=1, sortby=["ATP", "Year"],
+                 sort_order="asc", search=None, cursor=None, **filters):
+        return self.db_connector.get_db_data(
+            columns=columns, rows=rows, page=page, sortby=sortby, sort_order=sort_order, search=search, cursor=cursor,
+            **filters
+        )
+
+    def delete_data(self, table, search=None, **filters):
+        self.db_connector.delete_db_data(table, search=search, **filters)
+        self.db_connector.refresh_rollups()
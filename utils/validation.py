@@ -0,0 +1,296 @@
+"""
+Vectorized validation of input data against database schema.
+Column rules (type, size, range) are derived from `db_table_schemas.json` and every rule is applied to a whole column
+at once, so validation cost does not depend on Python per-value calls
+"""
+
+import re
+import logging
+import functools
+import numpy as np
+import pandas as pd
+
+import config as c
+
+from utils.db.schema import load_db_schema, NUMERIC_TYPES, DATE_TYPES
+from utils.db.players import PLAYERS_TABLE, PLAYER_ID_COLUMNS
+from utils.preprocess.preprocessor import parse_date, parse_dates
+
+INTEGER_RANGES = {
+    "SMALLINT": (-2**15, 2**15 - 1),
+    "INT": (-2**31, 2**31 - 1),
+    "INTEGER": (-2**63, 2**63 - 1),
+    "BIGINT": (-2**63, 2**63 - 1),
+}
+STRING_TYPES = ("CHAR", "VARCHAR", "NCHAR", "NVARCHAR", "TEXT")
+
+# source files name some columns differently from database
+SOURCE_COLUMN_NAMES = {v: k for k, v in c.RENAME_MAP.items()}
+
+REQUIRED_FIELDS = ["ATP", "Year"]
+
+
+class ColumnRule:
+    """
+    Implements declarative validation rule of a single column
+    """
+    def __init__(self, name, sql_type, size=None, scale=None, required=False):
+        """
+        :param name:                        column name in database
+        :param sql_type:                    SQL type without size, e.g. `DECIMAL`
+        :param size:                        string length or numeric precision, if declared
+        :param scale:                       numeric scale, if declared
+        :param required:                    True if missing values are not allowed
+        """
+        self.name = name
+        self.sql_type = sql_type
+        self.size = size
+        self.scale = scale
+        self.required = required
+
+    def __repr__(self):
+        return "ColumnRule(name={}, type={}, size={}, scale={}, required={})".format(
+            self.name, self.sql_type, self.size, self.scale, self.required)
+
+    @property
+    def typed(self):
+        """
+        True if values are checked beyond missing values
+        """
+        return self.sql_type in NUMERIC_TYPES or self.sql_type in DATE_TYPES or \
+            (self.sql_type in STRING_TYPES and bool(self.size))
+
+    @property
+    def message(self):
+        """
+        Error message of invalid values
+        """
+        if self.sql_type in INTEGER_RANGES:
+            return "is not an integer fitting {}".format(self.sql_type)
+        if self.sql_type in NUMERIC_TYPES:
+            if self.size is not None:
+                return "is not a number fitting {}({},{})".format(self.sql_type, self.size, self.scale or 0)
+            return "is not a number"
+        if self.sql_type in DATE_TYPES:
+            return "is not a date"
+        return "is longer than {} characters".format(self.size)
+
+    def check(self, values):
+        """
+        Validate column
+        :param values:                      Series of column values
+        :return:                            list of (boolean array of invalid values, error message) pairs
+        """
+        checks = []
+        if values.dtype == object:
+            # source columns have few distinct values, so distinct values are checked one by one as single records
+            codes, uniques = pd.factorize(values)
+            missing = codes < 0
+            if self.typed:
+                invalid = np.fromiter((self.is_invalid(value) for value in uniques), dtype=bool, count=len(uniques))
+                # missing values have code -1 and are mapped to the appended False
+                checks.append((np.append(invalid, False)[codes], self.message))
+        else:
+            missing = values.isna().to_numpy()
+            if self.typed:
+                checks.append((self._invalid_values(values) & ~missing, self.message))
+        if self.required:
+            checks.append((missing, "is missing"))
+        return checks
+
+    def check_value(self, value):
+        """
+        Validate a single value, e.g. of a record, with the rules applied to distinct values of object columns by `check`
+        :param value:                       scalar value, None or NaN if missing
+        :return:                            error message or None if value is valid
+        """
+        if value is None or (isinstance(value, (float, np.floating)) and np.isnan(value)):
+            return "is missing" if self.required else None
+        if self.typed and self.is_invalid(value):
+            return self.message
+        return None
+
+    def is_invalid(self, value):
+        """
+        Check type of a non-missing value
+        """
+        if self.sql_type in NUMERIC_TYPES:
+            if isinstance(value, (int, float, np.number)):
+                parsed = float(value)
+            else:
+                parsed = float(pd.to_numeric(str(value), errors="coerce"))
+            return bool(np.isnan(parsed) or self._out_of_range(np.array([parsed]))[0])
+        if self.sql_type in DATE_TYPES:
+            # dates are accepted in every format the preprocessor parses
+            return parse_date(value) is pd.NaT
+        return len(str(value)) > self.size
+
+    def _invalid_values(self, values):
+        """
+        Check type of values of a typed (not object) column, missing values are masked by the caller
+        :return:                            boolean array of invalid values
+        """
+        if self.sql_type in NUMERIC_TYPES:
+            if pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+                parsed = values.to_numpy(dtype=np.float64, na_value=np.nan)
+                invalid = np.zeros(len(values), dtype=bool)
+            else:
+                parsed = pd.to_numeric(values, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+                invalid = np.isnan(parsed) & values.notna().to_numpy()
+            return invalid | self._out_of_range(np.nan_to_num(parsed))
+        if self.sql_type in DATE_TYPES:
+            if pd.api.types.is_datetime64_any_dtype(values.dtype):
+                return np.zeros(len(values), dtype=bool)
+            return parse_dates(values).isna().to_numpy()
+        return values.astype(str).str.len().to_numpy() > self.size
+
+    def _out_of_range(self, parsed):
+        """
+        Check parsed numbers against type range, precision and scale
+        :param parsed:                      float array without NaN values
+        :return:                            boolean array of invalid values
+        """
+        if self.sql_type in INTEGER_RANGES:
+            low, high = INTEGER_RANGES[self.sql_type]
+            return (parsed != np.floor(parsed)) | (parsed < low) | (parsed > high)
+        if self.size is not None:
+            return np.abs(parsed) >= 10.0 ** (self.size - (self.scale or 0))
+        return np.zeros(len(parsed), dtype=bool)
+
+
+class ValidationResult:
+    """
+    Implements result of DataFrame validation
+    """
+    def __init__(self, nrows, checks):
+        """
+        :param nrows:                       number of validated rows
+        :param checks:                      dictionary {column name: list of (boolean array of invalid values, message)}
+        """
+        self.nrows = nrows
+        self.checks = checks
+        self.invalid = {}
+        for column, column_checks in checks.items():
+            invalid = np.zeros(nrows, dtype=bool)
+            for mask, _ in column_checks:
+                invalid |= mask
+            self.invalid[column] = invalid
+
+    @property
+    def error_counts(self):
+        """
+        Number of invalid values per column, columns without errors are omitted
+        """
+        counts = {column: int(mask.sum()) for column, mask in self.invalid.items()}
+        return {column: count for column, count in counts.items() if count}
+
+    def mask(self, columns=None):
+        """
+        Boolean mask of valid rows
+        :param columns:                     columns to take into account, all validated columns if None
+        """
+        mask = np.ones(self.nrows, dtype=bool)
+        for column, invalid in self.invalid.items():
+            if columns is None or column in columns:
+                mask &= ~invalid
+        return mask
+
+    def row_errors(self):
+        """
+        Error messages of invalid rows
+        :return:                            dictionary {row position: list of error messages}
+        """
+        errors = {}
+        for column, column_checks in self.checks.items():
+            for invalid, message in column_checks:
+                for i in np.flatnonzero(invalid):
+                    errors.setdefault(int(i), []).append("Field `{}` {}".format(column, message))
+        return errors
+
+
+class SchemaValidator:
+    """
+    Implements validation of DataFrame columns against rules derived from database schema
+    """
+    def __init__(self, rules):
+        """
+        :param rules:                       an iterable of `ColumnRule` objects
+        """
+        self.rules = list(rules)
+
+    def validate(self, data):
+        """
+        Validate DataFrame. Columns may be named as in database or as in source files,
+        columns not present in DataFrame are treated as missing
+        :param data:                        an input DataFrame
+        :return:                            ValidationResult object
+        """
+        checks = {}
+        for rule in self.rules:
+            column = rule.name if rule.name in data.columns else SOURCE_COLUMN_NAMES.get(rule.name, rule.name)
+            if column in data.columns:
+                checks[column] = rule.check(data[column])
+            elif rule.required:
+                checks[column] = [(np.ones(len(data), dtype=bool), "is missing")]
+        result = ValidationResult(len(data), checks)
+        if result.error_counts:
+            logging.info("Validation: invalid values per column {}".format(result.error_counts))
+        return result
+
+    def validate_record(self, record):
+        """
+        Validate a single record without building a DataFrame, keys are named as DataFrame columns in `validate`
+        :param record:                      dictionary {column name: value}
+        :return:                            list of error messages, empty if record is valid
+        """
+        errors = []
+        for rule in self.rules:
+            column = rule.name if rule.name in record else SOURCE_COLUMN_NAMES.get(rule.name, rule.name)
+            if column in record:
+                message = rule.check_value(record[column])
+            else:
+                message = "is missing" if rule.required else None
+            if message is not None:
+                errors.append("Field `{}` {}".format(column, message))
+        return errors
+
+
+def _parse_fields(fields):
+    """
+    Parse column declarations of a table in schema file, constraints are skipped
+    :return:                                generator of (name, SQL type, size, scale)
+    """
+    for field in fields:
+        match = re.match(r"^(\w+)\s+(\w+)(?:\((\d+)(?:\s*,\s*(\d+))?\))?", field)
+        if not match or match.group(1).upper() in ("PRIMARY", "FOREIGN", "UNIQUE", "CHECK", "CONSTRAINT"):
+            continue
+        name, sql_type, size, scale = match.groups()
+        yield name, sql_type.upper(), int(size) if size else None, int(scale) if scale else None
+
+
+@functools.lru_cache(maxsize=None)
+def get_schema_validator(schema_file=None, required=tuple(REQUIRED_FIELDS)):
+    """
+    Build validator of tournaments, results and bets columns from schema file.
+    Only columns of source data are validated: surrogate player ids and row hashes are set on write, player names are
+    validated against `Name` column of players table
+    :param schema_file:                     path to schema file, default is taken from configuration
+    :param required:                        names of columns that must not be missing
+    :return:                                SchemaValidator object
+    """
+    schema = load_db_schema(schema_file)
+    declarations = {}
+    for table in ("tournaments_common", "tournaments_results", "tournaments_bets"):
+        for name, sql_type, size, scale in _parse_fields(schema.get(table, [])):
+            declarations.setdefault(name, (sql_type, size, scale))
+    for name, sql_type, size, scale in _parse_fields(schema.get(PLAYERS_TABLE, [])):
+        if name == "Name":
+            for column in PLAYER_ID_COLUMNS:
+                declarations.setdefault(column, (sql_type, size, scale))
+
+    input_fields = set(c.TOURNAMENTS_FIELDS + c.RESULTS_FIELDS + c.BETS_FIELDS + list(required))
+    rules = [
+        ColumnRule(name, sql_type, size=size, scale=scale, required=name in required)
+        for name, (sql_type, size, scale) in declarations.items() if name in input_fields
+    ]
+    return SchemaValidator(rules)